@@ -0,0 +1,357 @@
+"""
+Pre-encoded Opus cache for the bot's audio clips.
+
+Every *.mp3 is transcoded once (48 kHz stereo, 20 ms Opus frames) into
+AUDIO_CACHE_DIR, keyed by the SHA-256 of the source file and the encoder
+settings. Playback then hands the stored Opus packets straight to discord.py:
+no ffmpeg process and no encoding on the hot path.
+
+Packet store format (.opk, little endian), mmap'ed once per clip and shared
+by every player:
+    header  "OPK1" | uint32 frame_count | uint32 frame_ms
+    index   uint32[frame_count + 1]   offsets of each packet in the data section
+    data    Opus packets back to back
+
+Each build trims silence, normalizes loudness and writes manifest.json with
+the exact duration, frame count, loudness and hashes of every clip; the bot
+loads it at startup. Run `python build_audio.py` at build time.
+"""
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import discord
+from discord.oggparse import OggStream
+
+import metrics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", os.path.join(BASE_DIR, ".audio_cache"))
+
+MANIFEST_PATH = os.path.join(AUDIO_CACHE_DIR, "manifest.json")
+
+# Changing any of these invalidates every cached clip.
+# Trim leading/trailing silence (trailing via areverse), normalize loudness,
+# resample to Discord's native 48 kHz so nothing is resampled at play time.
+AUDIO_FILTERS = ("silenceremove=start_periods=1:start_threshold=-50dB:start_silence=0.05,"
+                 "areverse,"
+                 "silenceremove=start_periods=1:start_threshold=-50dB:start_silence=0.05,"
+                 "areverse,"
+                 "loudnorm=I=-16:TP=-1.5:LRA=11:print_format=json,"
+                 "aresample=48000")
+OPUS_ARGS = ["-vn", "-ac", "2", "-ar", "48000", "-c:a", "libopus", "-b:a", "96k",
+             "-frame_duration", "20", "-application", "audio", "-f", "ogg"]
+CACHE_VERSION = "3"
+
+STORE_MAGIC = b"OPK1"
+STORE_HEADER = struct.Struct("<4sII")
+FRAME_MS = 20
+
+_cache_lock = threading.Lock()
+_stores = {}         # cached .opk path -> PacketStore
+_resolved = {}       # source path -> (source mtime, cached .opk path)
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def cache_key(path):
+    h = hashlib.sha256()
+    h.update(file_hash(path).encode())
+    h.update(CACHE_VERSION.encode())
+    h.update(AUDIO_FILTERS.encode())
+    h.update(" ".join(OPUS_ARGS).encode())
+    return h.hexdigest()[:16]
+
+def cached_path(path, key):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(AUDIO_CACHE_DIR, f"{stem}-{key}.opk")
+
+def write_packet_store(packets, path):
+    """Writes Opus packets as header + offset index + data (atomically)."""
+    offsets = [0]
+    for p in packets:
+        offsets.append(offsets[-1] + len(p))
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(STORE_HEADER.pack(STORE_MAGIC, len(packets), FRAME_MS))
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        for p in packets:
+            f.write(p)
+    os.replace(tmp, path)
+
+class PacketStore:
+    """A memory-mapped .opk clip: O(1) frame lookup, zero-copy memoryview slices."""
+
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise RuntimeError("Packet store index requires a little-endian host")
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, self.frame_count, self.frame_ms = STORE_HEADER.unpack_from(view, 0)
+        if magic != STORE_MAGIC:
+            raise ValueError(f"{path} is not a packet store")
+        index_start = STORE_HEADER.size
+        data_start = index_start + 4 * (self.frame_count + 1)
+        self._index = view[index_start:data_start].cast("I")
+        self._data = view[data_start:]
+        self.path = path
+
+    @property
+    def duration(self):
+        return self.frame_count * self.frame_ms / 1000.0
+
+    def frame(self, i):
+        """Zero-copy view of packet `i`."""
+        return self._data[self._index[i]:self._index[i + 1]]
+
+def _parse_loudnorm(stderr):
+    """Extracts loudnorm's JSON report (printed after the run) from ffmpeg's stderr."""
+    start = stderr.rfind("{")
+    end = stderr.rfind("}")
+    if start == -1 or end < start:
+        return {}
+    try:
+        report = json.loads(stderr[start:end + 1])
+        return {
+            "input_lufs": float(report["input_i"]),
+            "output_lufs": float(report["output_i"]),
+            "output_true_peak": float(report["output_tp"]),
+        }
+    except (ValueError, KeyError):
+        return {}
+
+def transcode(path, ffmpeg):
+    """
+    Trims silence, normalizes loudness and encodes `path` to a 48 kHz stereo
+    packet store. Returns (store path, loudness info) or (None, {}). Loudness
+    is empty when the store already existed (the manifest keeps it).
+    """
+    key = cache_key(path)
+    target = cached_path(path, key)
+    if os.path.exists(target):
+        return target, {}
+
+    os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+    tmp = target + ".ogg.tmp"
+    cmd = ([ffmpeg, "-y", "-hide_banner", "-nostats", "-loglevel", "info", "-i", path,
+            "-af", AUDIO_FILTERS] + OPUS_ARGS + [tmp])
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    try:
+        if result.returncode != 0 or not os.path.exists(tmp):
+            print(f"⚠️ Opus transcode failed for {path}: {result.stderr.strip()[-200:]}")
+            return None, {}
+        with open(tmp, "rb") as f:
+            packets = [p for p in OggStream(f).iter_packets()
+                       if not p.startswith((b"OpusHead", b"OpusTags"))]
+        write_packet_store(packets, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    # Drop stale copies of the same clip (source changed)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    for old in glob.glob(os.path.join(AUDIO_CACHE_DIR, f"{stem}-*.*")):
+        if old != target:
+            os.remove(old)
+    print(f"🎵 Built {os.path.basename(path)}")
+    return target, _parse_loudnorm(result.stderr)
+
+# --- Manifest ---
+def _manifest_entry(path, target, loudness, previous):
+    store = PacketStore(target)
+    stat = os.stat(path)
+    entry = {
+        "source": os.path.basename(path),
+        "source_hash": file_hash(path),
+        "source_size": stat.st_size,
+        "source_mtime": stat.st_mtime,
+        "store": os.path.basename(target),
+        "content_hash": file_hash(target),
+        "frames": store.frame_count,
+        "frame_ms": store.frame_ms,
+        "duration": store.duration,
+        "sample_rate": 48000,
+        "channels": 2,
+    }
+    if loudness:
+        entry.update(loudness)
+    elif previous and previous.get("store") == entry["store"]:
+        for k in ("input_lufs", "output_lufs", "output_true_peak"):
+            if k in previous:
+                entry[k] = previous[k]
+    return entry
+
+def read_manifest():
+    try:
+        with open(MANIFEST_PATH, encoding="utf-8") as f:
+            return json.load(f).get("clips", {})
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"⚠️ Audio manifest unreadable: {e}")
+        return {}
+
+def write_manifest(clips):
+    tmp = MANIFEST_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": CACHE_VERSION, "clips": clips}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, MANIFEST_PATH)
+
+def load_manifest():
+    """
+    Startup path: trusts the manifest for sources whose size and mtime are
+    unchanged (no hashing, no ffmpeg). Returns the number of clips resolved.
+    """
+    clips = read_manifest()
+    loaded = 0
+    for name, entry in clips.items():
+        path = os.path.join(BASE_DIR, entry["source"])
+        target = os.path.join(AUDIO_CACHE_DIR, entry["store"])
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if stat.st_size != entry["source_size"] or stat.st_mtime != entry["source_mtime"]:
+            continue
+        if not os.path.exists(target):
+            continue
+        _remember(path, target)
+        loaded += 1
+    if loaded:
+        print(f"🎵 Audio manifest: {loaded} clips ready")
+    return loaded
+
+def prepare_all(ffmpeg, directory=BASE_DIR, workers=None):
+    """
+    Builds every *.mp3 in `directory` in parallel (incremental: unchanged
+    clips are skipped) and rewrites the manifest. Blocking; run in a thread.
+    """
+    if not ffmpeg:
+        print("⚠️ No FFmpeg: Opus cache disabled, falling back to runtime decoding.")
+        return {}
+    paths = sorted(glob.glob(os.path.join(directory, "*.mp3")))
+    previous = read_manifest()
+
+    def build(path):
+        try:
+            target, loudness = transcode(path, ffmpeg)
+            if target:
+                name = os.path.basename(path)
+                return name, _manifest_entry(path, target, loudness, previous.get(name))
+        except Exception as e:
+            print(f"⚠️ Opus cache error for {path}: {e}")
+        return os.path.basename(path), None
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 2) as pool:
+        results = list(pool.map(build, paths))
+
+    clips = {}
+    for name, entry in results:
+        if entry:
+            clips[name] = entry
+            _remember(os.path.join(directory, name), os.path.join(AUDIO_CACHE_DIR, entry["store"]))
+    if clips != previous:
+        write_manifest(clips)
+    print(f"🎵 Opus cache ready: {len(clips)} clips")
+    return clips
+
+def prepare_file(path, ffmpeg):
+    """Builds one clip outside the manifest (e.g. runtime TTS); returns True when cached."""
+    if lookup(path):
+        return True
+    if not ffmpeg:
+        return False
+    target, _ = transcode(path, ffmpeg)
+    if not target:
+        return False
+    _remember(path, target)
+    return True
+
+def _remember(path, target):
+    with _cache_lock:
+        _resolved[os.path.abspath(path)] = (os.path.getmtime(path), target)
+
+def load_store(target):
+    """Maps a cached clip once; every player shares the same resident pages."""
+    store = _stores.get(target)
+    if store is None:
+        with _cache_lock:
+            store = _stores.get(target)
+            if store is None:
+                store = _stores[target] = PacketStore(target)
+    return store
+
+def lookup(path):
+    """Returns the cached .opk path for a source if it is still current, else None."""
+    entry = _resolved.get(os.path.abspath(path))
+    if entry is None:
+        return None
+    mtime, target = entry
+    try:
+        if os.path.getmtime(path) != mtime or not os.path.exists(target):
+            return None
+    except OSError:
+        return None
+    return target
+
+class MappedOpusSource(discord.AudioSource):
+    """
+    Plays a mapped packet store; discord.py sends the packets without re-encoding.
+
+    Frames are sliced out of the shared mmap. read() returns bytes because
+    voice encryption (davey's DAVE session) rejects memoryview; the copy is
+    one ~200 byte packet per 20 ms. Set zero_copy=True to get the views.
+    """
+
+    zero_copy = False
+
+    def __init__(self, store, start_frame=0):
+        self.store = store
+        self._next = start_frame
+
+    def seek(self, frame):
+        """Jumps to any frame in O(1)."""
+        self._next = max(0, min(frame, self.store.frame_count))
+
+    @property
+    def position(self):
+        return self._next
+
+    def read(self):
+        if self._next >= self.store.frame_count:
+            return b""
+        packet = self.store.frame(self._next)
+        self._next += 1
+        return packet if self.zero_copy else bytes(packet)
+
+    def is_opus(self):
+        return True
+
+def audio_source(path, ffmpeg=None, **ffmpeg_opts):
+    """Cached Opus passthrough when available, otherwise FFmpegPCMAudio as before."""
+    started = time.monotonic()
+    target = lookup(path)
+    if target:
+        try:
+            source = MappedOpusSource(load_store(target))
+            metrics.SOURCE_START.observe(time.monotonic() - started, ("opus_cache",))
+            return source
+        except Exception as e:
+            print(f"⚠️ Opus cache read failed for {path}: {e}")
+            metrics.error("opus_cache", e)
+    source = discord.FFmpegPCMAudio(source=path, executable=ffmpeg or "ffmpeg", **ffmpeg_opts)
+    metrics.SOURCE_START.observe(time.monotonic() - started, ("ffmpeg",))
+    return source
@@ -1,8 +1,14 @@
+import time
+# Process start, for the startup time breakdown
+BOOT_STARTED = time.monotonic()
+
 import discord
 from discord import app_commands
-from discord.ext import commands, tasks
+from discord.ext import commands
 import asyncio
+import hmac
 import os
+import signal
 import sys
 import datetime
 import aiohttp
@@ -10,11 +16,32 @@ from dotenv import load_dotenv
 from aiohttp import web
 
 load_dotenv()
-import shutil
-import ctypes.util
-import subprocess
-import imageio_ffmpeg
-import pytz
+
+from prayer_locations import PrayerLocations, load_prayer_config, location_key
+from fanout import fan_out
+import audio_cache
+from audio_cache import audio_source
+from playback import play_and_wait, playback_timeout
+from voice_pool import auxiliary_tokens, build_pool
+from welcome_queue import WelcomeQueue
+from voice_sessions import WarmSessions
+from tts_cache import TTSCache
+from greetings import matcher as greeting_matcher
+from outbound import OutboundQueue, PRIORITY_PRAYER, PRIORITY_COMMAND
+from channel_index import ChannelIndex
+from guild_state import GuildStateStore
+from voice_journal import journal as voice_journal, format_event
+from voice_jobs import VoiceJobEngine
+from command_sync import CommandSync
+from env_probe import EnvProbe, PhaseTimer
+from lifecycle import Lifecycle
+import sharding
+import cache_profile
+from sharding import LeaderLock, ShardDispatcher, event_id
+import metrics
+
+startup = PhaseTimer(BOOT_STARTED)
+startup.mark("imports")
 
 # --- Web Server for Keep Alive (Railway Requirement) ---
 async def handle(request):
@@ -38,18 +65,50 @@ async def keep_alive_task():
                 pass
             await asyncio.sleep(300) # Ping every 5 minutes
 
+async def handle_status(request):
+    """Liveness of every lifecycle service plus gateway state."""
+    return web.json_response({
+        "ready": bot.is_ready(),
+        "latency": bot.latency if bot.is_ready() else None,
+        "uptime": time.monotonic() - BOOT_STARTED,
+        "services": lifecycle.status(),
+        "shards": {"count": bot.shard_count or 1, "local": local_shards(),
+                   "scheduler_leader": leader_lock.held, **shard_dispatcher.stats()},
+    })
+
+async def handle_metrics(request):
+    return web.Response(text=metrics.REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+async def handle_journal(request):
+    """Voice events of one guild: /journal?guild=ID[&limit=N&kind=K&channel=ID], Authorization: Bearer JOURNAL_TOKEN"""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), JOURNAL_TOKEN.encode()):
+        return web.json_response({"error": "forbidden"}, status=403)
+    try:
+        guild_id = int(request.query["guild"])
+        channel_id = int(request.query["channel"]) if "channel" in request.query else None
+        limit = int(request.query.get("limit", 100))
+    except (KeyError, ValueError):
+        return web.json_response({"error": "guild (and optional channel, limit) must be IDs/numbers"}, status=400)
+    events = voice_journal.events(guild_id, limit=limit, kind=request.query.get("kind"), channel_id=channel_id)
+    return web.json_response({"guild": guild_id, "events": events})
+
 async def start_web_server():
+    """Binds the keep-alive/status server; returns the runner (stopped by the lifecycle)."""
     app = web.Application()
     app.router.add_get('/', handle)
+    app.router.add_get('/status', handle_status)
+    app.router.add_get('/metrics', handle_metrics)
+    # Member voice activity: only served when its own secret is set
+    if JOURNAL_TOKEN:
+        app.router.add_get('/journal', handle_journal)
     runner = web.AppRunner(app)
     await runner.setup()
     port = int(os.getenv("PORT", 8080))
     site = web.TCPSite(runner, '0.0.0.0', port)
     await site.start()
     print(f"🌍 Web server started on port {port}")
-    
-    # Start the pinger
-    asyncio.create_task(keep_alive_task())
+    return runner
 
 # Configuration
 TOKEN = os.getenv('DISCORD_TOKEN')
@@ -59,120 +118,91 @@ if not TOKEN:
 else:
     print("✅ Token found, starting bot...")
 
-import ctypes.util
-
-# Debug: Check Environment
+# --- Environment probe (ffmpeg, opus, assets) ---
+# Reused from .env_probe.json when the environment fingerprint matches;
+# re-checked in the background once the bot is ready.
+env = EnvProbe()
+env.load()
 print(f"Current Directory: {os.getcwd()}")
-print(f"Files in dir: {os.listdir('.')}")
-
-# --- Robust FFmpeg Finder ---
-def find_ffmpeg():
-    # 1. Try shutil.which (PATH) - Prioritize system FFmpeg (Docker)
-    path = shutil.which("ffmpeg")
-    if path:
-        return path
-
-    # 2. Try imageio-ffmpeg (Fallback)
-    try:
-        path = imageio_ffmpeg.get_ffmpeg_exe()
-        print(f"✅ Found FFmpeg via imageio-ffmpeg: {path}")
-        return path
-    except Exception as e:
-        print(f"⚠️ imageio-ffmpeg failed: {e}")
-    
-    # 3. Try common Linux/Nix paths
-    common_paths = [
-        "/usr/bin/ffmpeg",
-        "/usr/local/bin/ffmpeg",
-        "/bin/ffmpeg",
-        "/nix/var/nix/profiles/default/bin/ffmpeg",
-    ]
-    for p in common_paths:
-        if os.path.exists(p) and os.access(p, os.X_OK):
-            return p
-            
-    # 4. Search in current directory
-    if os.path.exists("ffmpeg.exe"): return os.path.abspath("ffmpeg.exe")
-    if os.path.exists("ffmpeg"): return os.path.abspath("ffmpeg")
-    
-    return None
+print(f"Audio files: {', '.join(env.data['assets']) or 'none'} (probe: {env.source})")
 
-FFMPEG_PATH = find_ffmpeg()
+FFMPEG_PATH = env.ffmpeg
 print(f"✅ FOUND FFmpeg at: {FFMPEG_PATH}")
 
 if not FFMPEG_PATH:
     print("⚠️ WARNING: FFmpeg not found in any standard location!")
+startup.mark("env probe")
 
-# --- Robust Opus Finder & Loader ---
-def load_opus():
-    if discord.opus.is_loaded():
-        print("✅ Opus is already loaded.")
-        return
+# Clip durations/hashes from the build manifest (build_audio.py); no ffmpeg needed
+audio_cache.load_manifest()
+startup.mark("manifest")
 
-    print("Attempting to load Opus...")
-    
-    # 1. Try ctypes.util.find_library
-    try:
-        lib = ctypes.util.find_library("opus")
-        if lib:
-            discord.opus.load_opus(lib)
-            print(f"✅ Loaded Opus via find_library: {lib}")
-            return
-    except Exception as e:
-        print(f"⚠️ find_library failed: {e}")
-
-    # 2. Try common Linux/Nix paths (Railway/Nixpacks specific)
-    common_lib_paths = [
-        "/usr/lib/libopus.so",
-        "/usr/lib/libopus.so.0",
-        "/usr/local/lib/libopus.so",
-        "/lib/libopus.so",
-    ]
-    
-    # Search in Nix store
-    import glob
-    nix_matches = glob.glob("/nix/store/*-libopus-*/lib/libopus.so.0")
-    if nix_matches:
-        common_lib_paths.extend(nix_matches)
-
-    for lib_path in common_lib_paths:
-        try:
-            discord.opus.load_opus(lib_path)
-            print(f"✅ Loaded Opus manually from: {lib_path}")
-            return
-        except:
-            pass
-            
-    # 3. Try direct names
-    for lib in ["libopus.so.0", "libopus.so", "libopus-0.dll"]:
-        try:
-            discord.opus.load_opus(lib)
-            print(f"✅ Loaded Opus via direct name: {lib}")
-            return
-        except:
-            pass
-            
+# Load Opus at startup (last working library first)
+if env.load_opus():
+    print(f"✅ Loaded Opus: {env.opus}")
+else:
     print("❌ Could not load Opus. Voice will likely fail.")
+startup.mark("opus")
 
-# Load Opus at startup
-load_opus()
+# Intents + caches: CACHE_PROFILE=lean keeps only voice members and no messages (see cache_profile.py)
+client_options = cache_profile.client_options()
+print(f"🧠 Cache profile: {cache_profile.CACHE_PROFILE}")
 
-# Intents setup
-intents = discord.Intents.default()
-intents.message_content = True
-intents.voice_states = True 
+# Web server, pinger, schedulers and workers: each started once, stopped in order
+lifecycle = Lifecycle()
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+# SHARD_COUNT / SHARD_IDS switch to AutoShardedBot (see sharding.py)
+BotBase = commands.AutoShardedBot if sharding.is_sharded() else commands.Bot
 
-# Global variable to control the welcome bot
-bot_active = True
-# Variable to track if welcome is paused due to prayer
-prayer_pause = False
-# Variable to track locked channel (None = Free Mode)
-LOCKED_CHANNEL_ID = None
+class NotificationBot(BotBase):
+    async def setup_hook(self):
+        # Runs once per process, before the first login (reconnects never get here)
+        await lifecycle.start_group("setup")
+        try:
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGTERM, lambda: asyncio.create_task(self.close()))
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: no signal handlers in the event loop
+
+    async def close(self):
+        print("🛑 Shutting down...")
+        await lifecycle.shutdown()
+        await super().close()
+
+bot = NotificationBot(command_prefix="!", **client_options, **sharding.shard_options())
+
+def local_shards():
+    """Shard IDs run by this process ([0] when not sharded)."""
+    return sorted(bot.shards) if isinstance(bot, commands.AutoShardedBot) else [0]
+
+# Main bot + optional auxiliary voice-only tokens (VOICE_WORKER_TOKENS)
+voice_pool = build_pool(bot, FFMPEG_PATH)
+
+# Per-guild welcome on/off, locked channel (None = Free Mode), prayer pause and
+# cooldown settings; reads are a dict lookup, changes are flushed in batches
+guild_state = GuildStateStore()
+print(f"🗂️ Loaded state for {guild_state.load()} guilds")
+# Guilds playing the adhan right now (welcomes wait); runtime only, never persisted
+prayer_paused = set()
+startup.mark("guild state")
+# chat/اذكار/locked channel IDs, cached permissions and voice occupancy per guild
+channel_index = ChannelIndex(locked_channel=lambda guild_id: guild_state.get(guild_id).locked_channel)
+# Slash-command sync that only talks to Discord when the tree changed
+command_sync = CommandSync(bot.tree)
+# Time to ready is logged for the first on_ready only
+ready_logged = False
+
+async def revalidate_env():
+    changed = await asyncio.to_thread(env.revalidate)
+    if changed:
+        print(f"⚠️ Environment changed since the cached probe ({', '.join(changed)}); applies on next start")
 
 # --- Security: Admin Code ---
 ADMIN_CODE = os.getenv("ADMIN_CODE", "th1") # Default code if not set
+# Secret for the /journal web route (sent as "Authorization: Bearer ..."); unset = route disabled
+JOURNAL_TOKEN = os.getenv("JOURNAL_TOKEN", "")
+# How long /lock waits for cancelled voice jobs to disconnect before moving
+LOCK_STOP_TIMEOUT = float(os.getenv("LOCK_STOP_TIMEOUT", 10))
 
 @bot.command(name="fix")
 @commands.has_permissions(administrator=True)
@@ -186,11 +216,10 @@ async def fix_duplicates(ctx, code: str = None):
     
     try:
         # 1. Clear Guild-specific commands ONLY (Removes the duplicate layer)
-        bot.tree.clear_commands(guild=ctx.guild)
-        await bot.tree.sync(guild=ctx.guild)
+        await command_sync.clean_guild(ctx.guild, force=True)
         
         # 2. Re-sync Global to ensure originals are there
-        synced = await bot.tree.sync()
+        synced = await command_sync.sync_global(bot.application_id, force=True)
         
         await ctx.send(f"✅ تم الإصلاح! تم حذف النسخ المكررة والإبقاء على {len(synced)} أمر أساسي.\n(سوي Refresh للديسكورد الآن - Ctrl+R)")
         
@@ -210,7 +239,7 @@ async def sync_commands(interaction: discord.Interaction, code: str):
         
     await interaction.response.defer(ephemeral=True)
     try:
-        synced = await bot.tree.sync()
+        synced = await command_sync.sync_global(bot.application_id, force=True)
         await interaction.followup.send(f"✅ تم تحديث {len(synced)} أمر بنجاح!")
     except Exception as e:
         await interaction.followup.send(f"❌ حدث خطأ: {e}")
@@ -229,25 +258,55 @@ async def debug_bot(interaction: discord.Interaction, code: str):
 
     report = "🔍 **تقرير الفحص:**\n"
     
-    # 1. FFmpeg
+    # 1. FFmpeg (from the environment probe; no subprocess here)
     report += f"- **مسار FFmpeg المستخدم:** `{FFMPEG_PATH}`\n"
     if FFMPEG_PATH:
-        try:
-            result = subprocess.run([FFMPEG_PATH, "-version"], capture_output=True, text=True)
-            version = result.stdout.splitlines()[0] if result.stdout else "Unknown"
-            report += f"- **النسخة:** `{version}`\n"
-        except Exception as e:
-            report += f"- **خطأ في التشغيل:** `{e}`\n"
+        report += f"- **النسخة:** `{env.data.get('ffmpeg_version')}`\n"
     else:
         report += "- **FFmpeg:** ❌ غير موجود نهائياً\n"
         report += f"- **PATH Env:** `{os.environ.get('PATH')}`\n"
     
     # 2. Opus
-    report += f"- **Opus Loaded:** {'✅ نعم' if discord.opus.is_loaded() else '❌ لا'}\n"
+    report += f"- **Opus Loaded:** {'✅ نعم' if discord.opus.is_loaded() else '❌ لا'} (`{env.opus}`)\n"
     
     # 3. Audio Files
-    files = [f for f in os.listdir('.') if f.endswith('.mp3')]
+    files = list(env.data.get("assets", {}))
     report += f"- **ملفات الصوت:** {', '.join(files) if files else '❌ لا يوجد'}\n"
+    report += f"- **الفحص:** {env.source}, age {env.age():.0f}s | startup {startup.summary()}\n"
+
+    # Shards: which ones run here, and whether this process runs the prayer schedulers
+    d = shard_dispatcher.stats()
+    report += (f"- **الشاردات:** {len(d['local'])}/{bot.shard_count or 1} here {d['local']} | "
+               f"scheduler {'👑 leader' if leader_lock.held else 'follower'} | "
+               f"dispatched={d['dispatched']} handled={d['handled']} stale={d['stale']} pruned={d['pruned']}\n")
+
+    # 4. Voice jobs, welcome queue + warm sessions
+    vj = voice_jobs.stats()
+    report += (f"- **مهام الصوت:** running={vj['running']} queued={vj['queued']} done={vj['done']} "
+               f"failed={vj['failed']} cancelled={vj['cancelled']} preempted={vj['preempted']} "
+               f"preemptions={vj['preemptions']}\n")
+    q = welcome_queue.stats()
+    report += (f"- **طابور الترحيب:** depth={q['depth']} handled={q['handled']} "
+               f"coalesced={q['coalesced']} suppressed={q['suppressed']} "
+               f"wait avg={q['wait_avg']:.2f}s max={q['wait_max']:.2f}s\n")
+    w = warm_sessions.stats()
+    report += (f"- **جلسات الصوت:** warm={w['warm']} " +
+               " ".join(f"{k}={w['counts'][k]} (ttfa {w['ttfa'][k]:.2f}s)" for k in w['counts']) + "\n")
+    g = greeting_matcher.stats()
+    j = voice_journal.stats()
+    report += (f"- **سجل الصوت:** guilds={j['guilds']} events={j['events']} recorded={j['recorded']} "
+               f"capacity={j['capacity']}/guild spill={'on' if j['spill'] else 'off'}\n")
+    st = guild_state.stats()
+    report += (f"- **إعدادات السيرفرات:** guilds={st['guilds']} dirty={st['dirty']} "
+               f"log_lines={st['log_lines']} flushes={st['flushes']}\n")
+    report += f"- **ردود التحية:** matched={g['matched']} suppressed={g['suppressed']} cooldown={g['cooldown']:.0f}s\n"
+    c = channel_index.stats()
+    report += (f"- **فهرس الرومات:** guilds={c['guilds']} perms={c['permissions']} "
+               f"hits={c['hits']} misses={c['misses']} invalidations={c['invalidations']}\n")
+    o = outbound.stats()
+    report += (f"- **طابور الرسائل:** depth={o['depth']} sent={o['sent']} coalesced={o['coalesced']} "
+               f"dropped={o['dropped']} failed={o['failed']} 429={o['rate_limited']} " +
+               " ".join(f"{k} avg={v['avg']:.2f}s max={v['max']:.2f}s" for k, v in o['latency'].items()) + "\n")
 
     await interaction.response.send_message(report, ephemeral=True)
 
@@ -255,8 +314,6 @@ async def debug_bot(interaction: discord.Interaction, code: str):
 @app_commands.describe(code="كود الأمان")
 async def stop_bot(interaction: discord.Interaction, code: str):
     """Stops the bot from welcoming users."""
-    global bot_active
-    
     if not interaction.user.guild_permissions.administrator:
         await interaction.response.send_message("عذراً، هذا الأمر للمشرفين فقط 🚫", ephemeral=True)
         return
@@ -265,15 +322,13 @@ async def stop_bot(interaction: discord.Interaction, code: str):
         await interaction.response.send_message("🔒 عذراً، كود الأمان غير صحيح!", ephemeral=True)
         return
 
-    bot_active = False
+    guild_state.update(interaction.guild.id, active=False)
     await interaction.response.send_message("تم إيقاف الترحيب مؤقتاً 🛑")
 
 @bot.tree.command(name="start", description="تفعيل الترحيب من جديد (للمشرفين فقط)")
 @app_commands.describe(code="كود الأمان")
 async def start_bot(interaction: discord.Interaction, code: str):
     """Resumes the bot welcoming users."""
-    global bot_active
-    
     if not interaction.user.guild_permissions.administrator:
         await interaction.response.send_message("عذراً، هذا الأمر للمشرفين فقط 🚫", ephemeral=True)
         return
@@ -282,7 +337,7 @@ async def start_bot(interaction: discord.Interaction, code: str):
         await interaction.response.send_message("🔒 عذراً، كود الأمان غير صحيح!", ephemeral=True)
         return
 
-    bot_active = True
+    guild_state.update(interaction.guild.id, active=True)
     await interaction.response.send_message("تم تفعيل الترحيب من جديد ✅")
 
 @bot.tree.command(name="say", description="جعل البوت يرسل رسالة في روم محدد (للمشرفين فقط)")
@@ -310,8 +365,15 @@ async def say_command(interaction: discord.Interaction, message: str, code: str,
         if image:
             files.append(await image.to_file())
 
-        await target_channel.send(content=message, files=files)
-        await interaction.response.send_message(f"تم إرسال الرسالة بنجاح إلى {target_channel.mention} ✅", ephemeral=True)
+        sent = outbound.submit(target_channel, message, priority=PRIORITY_COMMAND, files=files)
+        await interaction.response.send_message(f"تم إرسال الرسالة إلى {target_channel.mention} ✅", ephemeral=True)
+
+        # The send happens in the background; report failures as a follow-up
+        def report_failure(future):
+            if not future.cancelled() and future.exception():
+                asyncio.create_task(interaction.followup.send(
+                    f"حدث خطأ أثناء الإرسال: {future.exception()}", ephemeral=True))
+        sent.add_done_callback(report_failure)
         
     except Exception as e:
         await interaction.response.send_message(f"حدث خطأ أثناء الإرسال: {e}", ephemeral=True)
@@ -320,8 +382,6 @@ async def say_command(interaction: discord.Interaction, message: str, code: str,
 @app_commands.describe(channel="الروم الصوتي", code="كود الأمان")
 async def lock_channel(interaction: discord.Interaction, channel: discord.VoiceChannel, code: str):
     """Locks the bot to a specific voice channel."""
-    global LOCKED_CHANNEL_ID
-    
     if not interaction.user.guild_permissions.administrator:
         await interaction.response.send_message("عذراً، هذا الأمر للمشرفين فقط 🚫", ephemeral=True)
         return
@@ -330,7 +390,12 @@ async def lock_channel(interaction: discord.Interaction, channel: discord.VoiceC
         await interaction.response.send_message("🔒 عذراً، كود الأمان غير صحيح!", ephemeral=True)
         return
 
-    LOCKED_CHANNEL_ID = channel.id
+    guild_state.update(interaction.guild.id, locked_channel=channel.id)
+    warm_sessions.cancel(interaction.guild.id)
+    await interaction.response.defer(ephemeral=True)
+    # Locked means silent: nothing already queued or playing goes on. A cancelled
+    # broadcast still disconnects on its way out, so let it finish before moving.
+    await voice_jobs.stop_guild(interaction.guild.id, by="lock", timeout=LOCK_STOP_TIMEOUT)
     
     # Move bot to the channel immediately
     try:
@@ -341,16 +406,14 @@ async def lock_channel(interaction: discord.Interaction, channel: discord.VoiceC
         else:
             await channel.connect(self_deaf=True)
             
-        await interaction.response.send_message(f"🔒 **تم حبس البوت في {channel.name}**.\nسيبقى صامتاً ولن يتحرك أو يرحب أو يؤذن حتى يتم فكه بالأمر `/unlock`.", ephemeral=True)
+        await interaction.followup.send(f"🔒 **تم حبس البوت في {channel.name}**.\nسيبقى صامتاً ولن يتحرك أو يرحب أو يؤذن حتى يتم فكه بالأمر `/unlock`.")
     except Exception as e:
-        await interaction.response.send_message(f"⚠️ تم تفعيل القفل ولكن واجهت مشكلة في الدخول: {e}", ephemeral=True)
+        await interaction.followup.send(f"⚠️ تم تفعيل القفل ولكن واجهت مشكلة في الدخول: {e}")
 
 @bot.tree.command(name="unlock", description="فك حبس البوت وإرجاعه للوضع الطبيعي (للمشرفين فقط)")
 @app_commands.describe(code="كود الأمان")
 async def unlock_channel(interaction: discord.Interaction, code: str):
     """Unlocks the bot allowing it to move freely."""
-    global LOCKED_CHANNEL_ID
-    
     if not interaction.user.guild_permissions.administrator:
         await interaction.response.send_message("عذراً، هذا الأمر للمشرفين فقط 🚫", ephemeral=True)
         return
@@ -359,7 +422,8 @@ async def unlock_channel(interaction: discord.Interaction, code: str):
         await interaction.response.send_message("🔒 عذراً، كود الأمان غير صحيح!", ephemeral=True)
         return
 
-    LOCKED_CHANNEL_ID = None
+    guild_state.update(interaction.guild.id, locked_channel=None)
+    warm_sessions.cancel(interaction.guild.id)
     
     # Force disconnect to reset state
     if interaction.guild.voice_client:
@@ -367,6 +431,62 @@ async def unlock_channel(interaction: discord.Interaction, code: str):
 
     await interaction.response.send_message("🔓 **تم فك القفل!**\nالبوت الآن حر وسيقوم بالترحيب والأذان في جميع الرومات كالمعتاد.", ephemeral=True)
 
+@bot.tree.command(name="settings", description="إعدادات هذا السيرفر (للمشرفين فقط)")
+@app_commands.describe(code="كود الأمان", greeting_cooldown="مهلة ردود التحية بالثواني",
+                       sticky="البقاء في الروم بعد الترحيب", sticky_idle="مدة البقاء بالثواني")
+async def settings_command(interaction: discord.Interaction, code: str, greeting_cooldown: float = None,
+                           sticky: bool = None, sticky_idle: float = None):
+    """Shows or changes this guild's settings (saved across restarts)."""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("عذراً، هذا الأمر للمشرفين فقط 🚫", ephemeral=True)
+        return
+
+    if code != ADMIN_CODE:
+        await interaction.response.send_message("🔒 عذراً، كود الأمان غير صحيح!", ephemeral=True)
+        return
+
+    guild_id = interaction.guild.id
+    changes = {"greeting_cooldown": greeting_cooldown, "sticky": sticky, "sticky_idle": sticky_idle}
+    changes = {k: v for k, v in changes.items() if v is not None}
+    if changes:
+        guild_state.update(guild_id, **changes)
+        warm_sessions.set_policy(guild_id, sticky, sticky_idle)
+
+    state = guild_state.get(guild_id)
+    await interaction.response.send_message(
+        f"⚙️ **إعدادات السيرفر**\n"
+        f"- الترحيب: {'✅' if state.active else '🛑'}\n"
+        f"- القفل: {f'<#{state.locked_channel}>' if state.locked_channel else 'لا'}\n"
+        f"- مهلة التحية: {state.greeting_cooldown if state.greeting_cooldown is not None else greeting_matcher.cooldown:.0f}s\n"
+        f"- البقاء في الروم: {'✅' if warm_sessions.is_sticky(guild_id) else '❌'} "
+        f"({warm_sessions.idle_for(guild_id):.0f}s)",
+        ephemeral=True)
+
+@bot.tree.command(name="journal", description="آخر أحداث الصوت في هذا السيرفر (للمشرفين فقط)")
+@app_commands.describe(code="كود الأمان", channel="روم صوتي محدد (اختياري)",
+                       kind="نوع الحدث (join, connect, play_stop, error, timeout, skip...)", limit="عدد الأحداث")
+async def journal_command(interaction: discord.Interaction, code: str, channel: discord.VoiceChannel = None,
+                          kind: str = None, limit: app_commands.Range[int, 1, 100] = 20):
+    """Shows the guild's recent voice events (joins, connects, plays, errors)."""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("عذراً، هذا الأمر للمشرفين فقط 🚫", ephemeral=True)
+        return
+
+    if code != ADMIN_CODE:
+        await interaction.response.send_message("🔒 عذراً، كود الأمان غير صحيح!", ephemeral=True)
+        return
+
+    events = voice_journal.events(interaction.guild.id, limit=limit, kind=kind,
+                                  channel_id=channel.id if channel else None)
+    if not events:
+        await interaction.response.send_message("📭 لا توجد أحداث مسجلة.", ephemeral=True)
+        return
+    # Newest last; drop the oldest lines to stay within one message
+    lines = [format_event(e) for e in events]
+    while len("\n".join(lines)) > 1900:
+        lines.pop(0)
+    await interaction.response.send_message("\n".join(lines), ephemeral=True)
+
 @bot.tree.command(name="deploy", description="نشر التعديلات تلقائياً إلى Railway (للمشرفين فقط)")
 @app_commands.describe(code="كود الأمان")
 async def deploy_command(interaction: discord.Interaction, code: str):
@@ -413,8 +533,6 @@ async def deploy_command(interaction: discord.Interaction, code: str):
 @bot.tree.command(name="ajrr", description="تشغيل مقطع الأجر (صلي على محمد) في جميع الرومات الصوتية النشطة")
 async def ajrr_command(interaction: discord.Interaction):
     """Plays ajrr.mp3 in ALL active voice channels."""
-    global LOCKED_CHANNEL_ID
-    
     guild = interaction.guild
     audio_file = "ajrr.mp3"
     
@@ -423,10 +541,10 @@ async def ajrr_command(interaction: discord.Interaction):
         return
 
     # --- LOCKED MODE LOGIC ---
-    if LOCKED_CHANNEL_ID:
-        channel = guild.get_channel(LOCKED_CHANNEL_ID)
+    if guild_state.get(guild.id).locked_channel:
+        channel = channel_index.channel(guild, "locked")
         if not channel:
-            LOCKED_CHANNEL_ID = None # Reset if deleted
+            guild_state.update(guild.id, locked_channel=None) # Reset if deleted
             await interaction.response.send_message("⚠️ الروم المحبوس لم يعد موجوداً! تم العودة للوضع الطبيعي.", ephemeral=True)
             return
 
@@ -438,82 +556,162 @@ async def ajrr_command(interaction: discord.Interaction):
         # BUT, usually admin commands override. 
         # I will allow /ajrr to work ONLY in the locked channel, as it is a direct command.
         
-        await interaction.response.send_message(f"🔒 البوت محبوس في **{channel.name}**، سيتم التشغيل هناك فقط.", ephemeral=True)
-        
-        try:
-            vc = guild.voice_client
-            if not vc or not vc.is_connected():
-                vc = await channel.connect(self_deaf=True)
-            elif vc.channel.id != channel.id:
-                await vc.move_to(channel)
-            
-            if vc.is_playing():
-                vc.stop()
-                
-            executable = FFMPEG_PATH if FFMPEG_PATH else "ffmpeg"
-            vc.play(discord.FFmpegPCMAudio(source=audio_file, executable=executable))
-            # Don't disconnect in locked mode
-            
-        except Exception as e:
-            await interaction.followup.send(f"❌ خطأ: {e}", ephemeral=True)
+        job = voice_jobs.submit(guild.id, "ajrr", audio_file, [channel.id],
+                                requested_by=interaction.user.id, stay=True)
+        await interaction.response.send_message(
+            f"🔒 البوت محبوس في **{channel.name}**، سيتم التشغيل هناك فقط. (#{job.id})", ephemeral=True)
+        report_job(interaction, job)
         return
 
     # --- NORMAL MODE LOGIC ---
     # Find ALL channels with people (No bots)
-    active_channels = [
-        vc for vc in guild.voice_channels 
-        if len(vc.members) > 0 and any(not m.bot for m in vc.members)
-    ]
+    active_channels = channel_index.active_voice_channels(guild)
 
     if not active_channels:
         await interaction.response.send_message("⚠️ ما فيه أحد في الرومات الصوتية حالياً!", ephemeral=True)
         return
 
-    await interaction.response.send_message(f"جاري نشر الأجر في **{len(active_channels)}** رومات... 🕌✨", ephemeral=True)
+    # Queued behind anything playing in this guild; the reply does not wait for it
+    job = voice_jobs.submit(guild.id, "ajrr", audio_file, [c.id for c in active_channels],
+                            requested_by=interaction.user.id)
+    await interaction.response.send_message(
+        f"جاري نشر الأجر في **{len(active_channels)}** رومات... 🕌✨ (#{job.id}، للإلغاء: `/cancel job:{job.id}`)",
+        ephemeral=True)
+    report_job(interaction, job)
+
+def report_job(interaction, job):
+    """Sends the job's outcome as a follow-up to the command that queued it."""
+    def report(future):
+        job = future.result()
+        if job.state == "done":
+            text = f"✅ تم الانتهاء: {job.summary()}"
+        else:
+            text = f"⚠️ {job.summary()}"
+        asyncio.create_task(interaction.followup.send(text, ephemeral=True))
+    job.future.add_done_callback(report)
 
-    # Loop through all channels
-    for v_channel in active_channels:
-        try:
-            # Force disconnect if stuck
-            if guild.voice_client:
-                await guild.voice_client.disconnect()
-            
-            print(f"Joining {v_channel.name} for AJRR...")
-            
-            # Connect
-            vc = await v_channel.connect(self_deaf=True)
-            
-            # Play
-            executable = FFMPEG_PATH if FFMPEG_PATH else "ffmpeg"
-            # Add reconnect option to prevent stalling
-            ffmpeg_opts = {
-                'options': '-vn -reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
-            }
-            vc.play(discord.FFmpegPCMAudio(source=audio_file, executable=executable, **ffmpeg_opts))
-            
-            # Wait until done with safety timeout
-            start_time = datetime.datetime.now()
-            while vc.is_playing():
-                await asyncio.sleep(1)
-                # Max 5 mins for AJRR
-                if (datetime.datetime.now() - start_time).total_seconds() > 300:
-                    break
-            
-            await asyncio.sleep(0.5) # Quick pause
-            if not LOCKED_CHANNEL_ID: # Only disconnect if not locked (though ajrr logic might vary)
-                 # Actually for AJRR command, we usually disconnect after playing unless locked?
-                 # If locked, we stay. If not locked, we leave.
-                 await vc.disconnect()
-            
-        except Exception as e:
-            print(f"Error in ajrr command for {v_channel.name}: {e}")
-            if guild.voice_client and not LOCKED_CHANNEL_ID:
-                await guild.voice_client.disconnect()
-    
-    await interaction.followup.send("✅ تم الانتهاء من نشر الأجر في جميع الرومات.", ephemeral=True)
+@bot.tree.command(name="jobs", description="حالة مهام الصوت في هذا السيرفر (للمشرفين فقط)")
+@app_commands.describe(code="كود الأمان")
+async def jobs_command(interaction: discord.Interaction, code: str):
+    """Lists the running, queued and recent voice jobs of this guild."""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("عذراً، هذا الأمر للمشرفين فقط 🚫", ephemeral=True)
+        return
 
-# Variable to store recent disconnect logs locally
-recent_disconnects = []
+    if code != ADMIN_CODE:
+        await interaction.response.send_message("🔒 عذراً، كود الأمان غير صحيح!", ephemeral=True)
+        return
+
+    jobs = voice_jobs.guild_jobs(interaction.guild.id)[:15]
+    if not jobs:
+        await interaction.response.send_message("📭 لا توجد مهام صوت.", ephemeral=True)
+        return
+    await interaction.response.send_message("\n".join(f"- {job.summary()}" for job in jobs), ephemeral=True)
+
+@bot.tree.command(name="cancel", description="إلغاء مهمة صوت (أو كل المهام) في هذا السيرفر (للمشرفين فقط)")
+@app_commands.describe(code="كود الأمان", job="رقم المهمة (بدون رقم: إلغاء الكل)")
+async def cancel_command(interaction: discord.Interaction, code: str, job: int = None):
+    """Cancels one voice job, or every queued and running job of this guild."""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("عذراً، هذا الأمر للمشرفين فقط 🚫", ephemeral=True)
+        return
+
+    if code != ADMIN_CODE:
+        await interaction.response.send_message("🔒 عذراً، كود الأمان غير صحيح!", ephemeral=True)
+        return
+
+    by = interaction.user.name
+    if job is None:
+        count = voice_jobs.cancel_guild(interaction.guild.id, by=by)
+        await interaction.response.send_message(f"🛑 تم إلغاء {count} مهمة.", ephemeral=True)
+        return
+    found = voice_jobs.jobs.get(job)
+    if found is None or found.guild_id != interaction.guild.id or not voice_jobs.cancel(job, by=by):
+        await interaction.response.send_message(f"⚠️ لا توجد مهمة نشطة برقم #{job}.", ephemeral=True)
+        return
+    await interaction.response.send_message(f"🛑 تم إلغاء المهمة #{job}.", ephemeral=True)
+
+# --- Metrics (read at scrape time from the components that already count) ---
+metrics.REGISTRY.counter_fn("bot_welcomes_total", "Welcomes played", lambda: welcome_queue.handled)
+metrics.REGISTRY.counter_fn("bot_welcomes_suppressed_total", "Joins not welcomed (duplicate within TTL)",
+                            lambda: welcome_queue.suppressed)
+metrics.REGISTRY.counter_fn("bot_welcomes_coalesced_total", "Joins merged into a pending welcome",
+                            lambda: welcome_queue.coalesced)
+metrics.REGISTRY.counter_fn("bot_messages_sent_total", "Messages sent through the outbound queue",
+                            lambda: {(k,): v["count"] for k, v in outbound.stats()["latency"].items()}, ("priority",))
+metrics.REGISTRY.counter_fn("bot_rate_limited_total", "HTTP 429 responses", lambda: outbound.stats()["rate_limited"])
+metrics.REGISTRY.counter_fn("bot_greetings_total", "Greetings answered / suppressed by cooldown",
+                            lambda: {("replied",): greeting_matcher.matched - greeting_matcher.suppressed,
+                                     ("suppressed",): greeting_matcher.suppressed}, ("result",))
+metrics.REGISTRY.gauge("bot_gateway_latency_seconds", "Discord gateway heartbeat latency",
+                       fn=lambda: bot.latency if bot.is_ready() else None)
+metrics.REGISTRY.gauge("bot_voice_clients", "Connected voice clients (main bot)", fn=lambda: len(bot.voice_clients))
+metrics.REGISTRY.gauge("bot_voice_jobs", "Voice jobs running / queued",
+                       fn=lambda: {("running",): voice_jobs.stats()["running"],
+                                   ("queued",): voice_jobs.stats()["queued"]}, labelnames=("state",))
+metrics.REGISTRY.counter_fn("bot_voice_jobs_finished_total", "Voice jobs by outcome",
+                            lambda: {(k,): voice_jobs.counts[k] for k in voice_jobs.counts}, ("outcome",))
+metrics.REGISTRY.gauge("bot_welcome_queue_depth", "Channels waiting for a welcome", fn=lambda: welcome_queue.depth())
+metrics.REGISTRY.gauge("bot_outbound_queue_depth", "Messages waiting to be sent", fn=lambda: outbound.depth())
+
+@bot.event
+async def on_app_command_completion(interaction, command):
+    elapsed = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+    metrics.COMMAND_LATENCY.observe(max(elapsed, 0.0), (command.qualified_name,))
+
+@bot.tree.error
+async def on_app_command_error(interaction, error):
+    original = getattr(error, "original", error)
+    metrics.error("command", original)
+    # Counting only: discord.py's handler still logs the full traceback
+    await app_commands.CommandTree.on_error(bot.tree, interaction, error)
+
+# --- Channel index invalidation ---
+@bot.event
+async def on_guild_channel_create(channel):
+    channel_index.channel_changed(channel)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    channel_index.channel_changed(after)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    channel_index.channel_deleted(channel)
+    if guild_state.get(channel.guild.id).locked_channel == channel.id:
+        guild_state.update(channel.guild.id, locked_channel=None)
+
+@bot.event
+async def on_guild_role_create(role):
+    channel_index.invalidate_guild(role.guild.id)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    channel_index.invalidate_guild(after.guild.id)
+
+@bot.event
+async def on_guild_role_delete(role):
+    channel_index.invalidate_guild(role.guild.id)
+
+@bot.event
+async def on_member_update(before, after):
+    # Only the bot's own roles affect its permissions (delivered with the members intent;
+    # without it the cache still refreshes on role/channel edits and on reconnect)
+    if after.id == bot.user.id and before.roles != after.roles:
+        channel_index.invalidate_guild(after.guild.id)
+
+@bot.event
+async def on_guild_join(guild):
+    # New guilds may still carry guild-scoped commands from older versions
+    try:
+        await command_sync.clean_guild(guild)
+    except Exception as e:
+        print(f"❌ Failed to clear duplicates for {guild.name}: {e}")
+
+@bot.event
+async def on_guild_remove(guild):
+    channel_index.forget(guild.id)
+    voice_journal.forget(guild.id)
 
 @bot.event
 async def on_message(message):
@@ -521,20 +719,34 @@ async def on_message(message):
     if message.author == bot.user:
         return
     
-    # Check for greeting "السلام عليكم" or "سلام عليكم"
-    message_content = message.content.strip()
-    greetings = ["السلام عليكم", "سلام عليكم", "السلام عليكم ورحمة الله", "السلام عليكم ورحمة الله وبركاته"]
-    
-    if any(greeting in message_content for greeting in greetings):
-        await message.channel.send("وعليكم السلام ورحمة الله وبركاته 🌸")
+    # Greetings ("السلام عليكم" and variants, plus greetings.json); one reply per channel per cooldown
+    cooldown = guild_state.get(message.guild.id).greeting_cooldown if message.guild else None
+    reply = greeting_matcher.reply_for(message.channel.id, message.content, cooldown)
+    if reply:
+        outbound.submit(message.channel, reply)
     
     # Process other commands (needed for prefix commands like !force_sync)
     await bot.process_commands(message)
 
 @bot.event
 async def on_voice_state_update(member, before, after):
-    # Check if bot is active (and not paused for prayer)
-    if not bot_active or prayer_pause:
+    # Occupancy is tracked for every event, even while welcomes are off
+    channel_index.voice_update(member, before, after)
+
+    guild_id = member.guild.id
+    # The bot itself leaving voice (kicked, dropped, or its own disconnect)
+    if member.id == bot.user.id and before.channel is not None and after.channel is None:
+        voice_journal.record(guild_id, "disconnect", before.channel.id)
+    joined = not member.bot and after.channel is not None and before.channel != after.channel
+    if joined:
+        voice_journal.record(guild_id, "join", after.channel.id, detail=member.id)
+
+    # Check if bot is active (and not paused for prayer) in this guild
+    state = guild_state.get(guild_id)
+    if not state.active or guild_id in prayer_paused:
+        if joined:
+            voice_journal.record(guild_id, "skip", after.channel.id,
+                                 detail="prayer pause" if guild_id in prayer_paused else "welcome off")
         return
 
     # Ignore bots
@@ -545,65 +757,102 @@ async def on_voice_state_update(member, before, after):
     if after.channel is not None and before.channel != after.channel:
         
         # --- LOCKED MODE CHECK (STRICT SILENCE) ---
-        if LOCKED_CHANNEL_ID:
+        if state.locked_channel:
             # COMPLETELY IGNORE EVERYTHING if locked.
             # Do not welcome anyone, anywhere. Even in the locked channel.
             print(f"🔒 Locked Mode Active: Ignoring join event for {member.name}")
+            voice_journal.record(guild_id, "skip", after.channel.id, detail="locked")
             return 
         
         voice_channel = after.channel
         # Check permissions
-        permissions = voice_channel.permissions_for(member.guild.me)
-        if not permissions.connect or not permissions.speak:
+        if not channel_index.can_speak(voice_channel):
             print(f"Missing permissions in {voice_channel.name}")
+            voice_journal.record(guild_id, "skip", voice_channel.id, detail="no permission")
             return
 
+        # One welcome at a time per guild; joins to the same channel are merged
+        if not welcome_queue.submit(member.guild, voice_channel.id, member.id):
+            print(f"Skipping welcome for {member.name} (welcomed recently)")
+            voice_journal.record(guild_id, "skip", voice_channel.id, detail="welcomed recently")
+
+async def welcome_channel(guild, channel_id, member_ids):
+    """Plays the welcome once in a channel (called by the per-guild welcome queue)."""
+    # State may have changed while the join was queued
+    state = guild_state.get(guild.id)
+    if not state.active or guild.id in prayer_paused or state.locked_channel:
+        return
+    voice_channel = guild.get_channel(channel_id)
+    if voice_channel is None:
+        return
+    if not any(m.id in member_ids for m in voice_channel.members):
+        return  # Everyone already left
+    if not os.path.exists("welcome.mp3"):
+        print(f"Error: 'welcome.mp3' file not found! Current dir files: {os.listdir('.')}")
+        return
+
+    # Waits behind an adhan or /ajrr in this guild instead of interrupting it
+    job = voice_jobs.submit(guild.id, "welcome", "welcome.mp3", [channel_id])
+    await job.wait()
+
+async def run_voice_job(job):
+    """Plays one voice job (the job engine runs one per guild at a time)."""
+    guild = bot.get_guild(job.guild_id)
+    if guild is None:
+        raise RuntimeError(f"guild {job.guild_id} is not available")
+
+    if job.kind != "welcome" and not job.options.get("stay"):
+        # Several channels: shared out between the main bot and any voice workers
+        warm_sessions.cancel(guild.id)
+        print(f"Broadcasting {job.clip} to {len(job.remaining())} channels (job #{job.id})...")
+        await voice_pool.broadcast(guild.id, job.remaining(), job.clip, results=job.results)
+        for channel_id, status in job.results.items():
+            if status != "ok":
+                print(f"Voice error in {channel_id} (job #{job.id}): {status}")
+        return
+
+    # One channel on the main connection: welcomes, and /ajrr in locked mode (stays connected)
+    channel = guild.get_channel(job.channel_ids[0])
+    if channel is None:
+        job.results[job.channel_ids[0]] = "channel_gone"
+        return
+    try:
+        # Connect, move, or reuse a warm session already in this channel
+        started = time.monotonic()
+        vc, how = await warm_sessions.acquire(guild, channel)
         try:
-            # Connect logic (Handle both Lock and Normal modes)
-            vc = member.guild.voice_client
-            
-            # If not connected, connect
-            if not vc or not vc.is_connected():
-                vc = await voice_channel.connect(self_deaf=True)
-            
-            # If connected but to wrong channel (Normal mode mainly, or fix lock drift)
-            elif vc.channel.id != voice_channel.id:
-                await vc.move_to(voice_channel)
-
-            # Look for audio file
-            if os.path.exists("welcome.mp3"):
-                print("Found welcome.mp3, attempting to play...")
-                try:
-                    if vc.is_playing():
-                        vc.stop()
-                        
-                    executable = FFMPEG_PATH if FFMPEG_PATH else "ffmpeg"
-                    vc.play(discord.FFmpegPCMAudio(source="welcome.mp3", executable=executable))
-                    print("Playing started successfully.")
-                except Exception as e:
-                    print(f"❌ Error playing audio: {e}")
-                
-                # Wait while playing (Timeout 15s for welcome)
-                start_time = datetime.datetime.now()
-                while vc.is_playing():
-                    await asyncio.sleep(1)
-                    if (datetime.datetime.now() - start_time).total_seconds() > 15:
-                        break
-                
-                await asyncio.sleep(1)
-            else:
-                print(f"Error: 'welcome.mp3' file not found! Current dir files: {os.listdir('.')}")
-
-            # Disconnect ONLY if NOT locked
-            if not LOCKED_CHANNEL_ID:
-                await vc.disconnect()
-            
-        except discord.errors.ClientException:
-            pass
+            executable = FFMPEG_PATH if FFMPEG_PATH else "ffmpeg"
+            source = audio_source(job.clip, executable)
+            # Wait while playing (clip length; 15s for an unknown welcome)
+            await play_and_wait(vc, source, timeout=playback_timeout(source, default=15) if job.kind == "welcome"
+                                else playback_timeout(source),
+                                on_first_frame=lambda at: warm_sessions.record_first_audio(how, at - started))
+            job.results[channel.id] = "ok"
         except Exception as e:
-            print(f"An error occurred: {e}")
-            if member.guild.voice_client and not LOCKED_CHANNEL_ID:
-                await member.guild.voice_client.disconnect()
+            print(f"❌ Error playing audio: {e}")
+            job.results[channel.id] = type(e).__name__
+
+        # Disconnect ONLY if NOT locked (or stay warm until idle when sticky)
+        if not job.options.get("stay") and not guild_state.get(guild.id).locked_channel:
+            await warm_sessions.release(guild, vc)
+    except Exception as e:
+        # ClientException (already connecting/playing) leaves the connection to its owner
+        if not isinstance(e, discord.errors.ClientException) \
+                and guild.voice_client and not guild_state.get(guild.id).locked_channel:
+            await guild.voice_client.disconnect()
+        raise
+
+welcome_queue = WelcomeQueue(welcome_channel)
+# Everything played in voice (adhan > ajrr > welcome), one job per guild at a time
+voice_jobs = VoiceJobEngine(run_voice_job)
+# Optional sticky voice sessions for welcomes (STICKY_VOICE, or per guild via /settings)
+warm_sessions = WarmSessions()
+for state in guild_state:
+    warm_sessions.set_policy(state.guild_id, state.sticky, state.sticky_idle)
+# Runtime TTS (custom announcements); hits are a dict lookup
+tts = TTSCache()
+# All bot-initiated channel.send calls (prayer > /say > greetings), per channel
+outbound = OutboundQueue()
 
 # --- Prayer Times Feature (Voice Only) ---
 
@@ -638,23 +887,30 @@ async def send_prayer_notifications(guild, prayer_name_en):
         prayer_ar = prayer_info["ar"]
         prayer_msg = prayer_info["msg"]
         
-        notification_text = f"حان الآن موعد صلاة **{prayer_ar}** حسب توقيت الرياض 🕌\n\n✨ {prayer_msg}\n\n@everyone"
+        city_label = prayer_locations.location_for_guild(guild.id)["label"]
+        notification_text = f"حان الآن موعد صلاة **{prayer_ar}** حسب توقيت {city_label} 🕌\n\n✨ {prayer_msg}\n\n@everyone"
+
+        # Queued ahead of anything else in these channels; a repeat of the
+        # same prayer still waiting to go out is merged into it
+        dedupe = ("prayer", prayer_name_en)
 
         # 1. General Chat (Keep message)
-        chat_channel = discord.utils.get(guild.text_channels, name="chat")
-        if chat_channel and chat_channel.permissions_for(guild.me).send_messages:
-            await chat_channel.send(notification_text, delete_after=1200)
+        chat_channel = channel_index.sendable(guild, "chat")
+        if chat_channel:
+            outbound.submit(chat_channel, notification_text, priority=PRIORITY_PRAYER,
+                            dedupe_key=dedupe, delete_after=1200)
 
         # 2. Athkar Chat (Delete after 20 mins)
-        athkar_channel = discord.utils.get(guild.text_channels, name="اذكار")
-        if athkar_channel and athkar_channel.permissions_for(guild.me).send_messages:
-            await athkar_channel.send(notification_text, delete_after=1200)
+        athkar_channel = channel_index.sendable(guild, "athkar")
+        if athkar_channel:
+            outbound.submit(athkar_channel, notification_text, priority=PRIORITY_PRAYER,
+                            dedupe_key=dedupe, delete_after=1200)
             
     except Exception as e:
         print(f"Notification error in {guild.name}: {e}")
 
-async def play_prayer_audio(guild, prayer_name_en):
-    """Finds active voice channels and plays the prayer audio."""
+async def start_prayer_audio(guild, prayer_name_en):
+    """Finds active voice channels and starts the adhan there; returns its job once it runs (or None)."""
     # Determine audio file
     audio_file = f"{prayer_name_en.lower()}.mp3"
     if not os.path.exists(audio_file):
@@ -662,80 +918,56 @@ async def play_prayer_audio(guild, prayer_name_en):
     
     if not os.path.exists(audio_file):
         print(f"Audio file not found for {prayer_name_en}")
-        return False
+        return None
 
     # --- LOCKED MODE LOGIC ---
-    if LOCKED_CHANNEL_ID:
-        channel = guild.get_channel(LOCKED_CHANNEL_ID)
+    if guild_state.get(guild.id).locked_channel:
+        channel = channel_index.channel(guild, "locked")
         if not channel:
-            return False # Locked channel deleted?
+            return None # Locked channel deleted?
             
         print(f"Locked mode: Prayer time, but staying SILENT in {channel.name}")
+        voice_journal.record(guild.id, "skip", channel.id, detail=f"{prayer_name_en}: locked")
         # User requested: "Don't do anything" in locked mode.
-        # So we just return True (task done) without playing audio.
-        return True
+        # So we just return (task done) without playing audio.
+        return None
 
     # --- NORMAL MODE LOGIC ---
     # Find all voice channels with members (excluding bots)
-    active_voice_channels = [
-        vc for vc in guild.voice_channels 
-        if len(vc.members) > 0 and any(not m.bot for m in vc.members)
-    ]
+    active_voice_channels = channel_index.active_voice_channels(guild)
 
     if not active_voice_channels:
-        return False
+        return None
 
-    for v_channel in active_voice_channels:
+    # Custom wording from prayer_config.json, generated once and cached by text
+    template = prayer_locations.announcement_for(guild.id)
+    if template:
         try:
-            # Disconnect if connected elsewhere
-            if guild.voice_client:
-                await guild.voice_client.disconnect()
-            
-            print(f"Joining {v_channel.name} for {prayer_name_en}...")
-            
-            # Connect
-            vc = await v_channel.connect(self_deaf=True)
-            
-            # Play
-            print(f"Attempting to play {audio_file} in {v_channel.name}...")
-            if not os.path.exists(audio_file):
-                print(f"❌ File not found right before playing: {audio_file}")
-            
-            try:
-                executable = FFMPEG_PATH if FFMPEG_PATH else "ffmpeg"
-                ffmpeg_opts = {
-                    'options': '-vn -reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
-                }
-                vc.play(discord.FFmpegPCMAudio(source=audio_file, executable=executable, **ffmpeg_opts))
-                print(f"Playback started for {audio_file}")
-            except Exception as e:
-                 print(f"❌ FFmpeg Playback Error: {e}")
-
-            # Safety timeout for prayer audio (e.g., 5 minutes max)
-            start_time = datetime.datetime.now()
-            while vc.is_playing():
-                await asyncio.sleep(1)
-                if (datetime.datetime.now() - start_time).total_seconds() > 300:
-                    print("⚠️ Prayer audio timeout, forcing stop.")
-                    vc.stop()
-                    break
-            
-            await asyncio.sleep(1)
-            
-            await vc.disconnect()
+            location = prayer_locations.location_for_guild(guild.id)
+            prayer_ar = PRAYER_DATA.get(prayer_name_en, {}).get("ar", prayer_name_en)
+            custom = await tts.synthesize(template.format(prayer=prayer_ar, city=location["label"]))
+            if await asyncio.to_thread(audio_cache.prepare_file, custom, FFMPEG_PATH):
+                audio_file = custom
         except Exception as e:
-            print(f"Voice prayer error in {v_channel.name}: {e}")
-            if guild.voice_client:
-                await guild.voice_client.disconnect()
-    
-    return True
+            print(f"Custom announcement failed in {guild.name}, using {audio_file}: {e}")
+
+    # The adhan preempts whatever is playing in this guild (a welcome, /ajrr);
+    # each worker (main bot + auxiliary tokens) takes the next free channel
+    job = voice_jobs.submit(guild.id, "adhan", audio_file, [c.id for c in active_voice_channels])
+    print(f"Adhan for {prayer_name_en}: job #{job.id}, {len(active_voice_channels)} channels")
+    # Welcomes wait until the adhan is over (whoever waits for it, or nobody)
+    prayer_paused.add(guild.id)
+    job.future.add_done_callback(lambda _: prayer_paused.discard(guild.id))
+    # Started = a running welcome or /ajrr was stopped and the adhan took over
+    await job.wait_started()
+    return job
 
 @bot.command(name="force_sync")
 @commands.has_permissions(administrator=True)
 async def force_sync_text(ctx):
     """Syncs commands using a text command (prefix !)."""
     try:
-        synced = await bot.tree.sync()
+        synced = await command_sync.sync_global(bot.application_id, force=True)
         await ctx.send(f"✅ تم تحديث {len(synced)} أمر slash بنجاح!")
     except Exception as e:
         await ctx.send(f"❌ خطأ: {e}")
@@ -786,165 +1018,137 @@ async def test_prayer(interaction: discord.Interaction, prayer: app_commands.Cho
         await interaction.response.send_message("🔒 عذراً، كود الأمان غير صحيح!", ephemeral=True)
         return
 
-    # Acknowledge the command immediately
-    prayer_info = PRAYER_DATA.get(prayer.value, {"ar": prayer.name})
-    await interaction.response.send_message(f"جاري الدخول للرومات للأذان لصلاة **{prayer_info['ar']}**... 🚀", ephemeral=True)
-    
     prayer_name_en = prayer.value
     guild = interaction.guild
+    prayer_info = PRAYER_DATA.get(prayer_name_en, {"ar": prayer.name})
 
-    # Send notifications manually for testing
-    await send_prayer_notifications(guild, prayer_name_en)
-    
     # 1. Prepare Audio
     audio_file = f"{prayer_name_en.lower()}.mp3"
     if not os.path.exists(audio_file):
         audio_file = "adhan.mp3" # Fallback
     
     if not os.path.exists(audio_file):
-        await interaction.followup.send(f"⚠️ ملف الصوت غير موجود: {audio_file}", ephemeral=True)
+        await interaction.response.send_message(f"⚠️ ملف الصوت غير موجود: {audio_file}", ephemeral=True)
         return
 
     # 2. Find ALL channels with people (No bots)
-    active_channels = [
-        vc for vc in guild.voice_channels 
-        if len(vc.members) > 0 and any(not m.bot for m in vc.members)
-    ]
-
-    if not active_channels:
-        await interaction.followup.send("⚠️ ما فيه أحد في الرومات الصوتية حالياً!", ephemeral=True)
-        return
-
-    # 3. Join them one by one forcefully
-    for v_channel in active_channels:
-        try:
-            # Force disconnect if stuck
-            if guild.voice_client:
-                await guild.voice_client.disconnect()
-            
-            # Connect
-            vc = await v_channel.connect(self_deaf=True)
-            
-            # Play
-            abs_path = os.path.abspath(audio_file)
-            print(f"Test Prayer: Playing {abs_path}...")
-            
-            if not os.path.exists(abs_path):
-                 await interaction.followup.send(f"⚠️ الملف غير موجود في المسار: {abs_path}", ephemeral=True)
-                 return
+    active_channels = channel_index.active_voice_channels(guild)
+    job = None
+    if active_channels:
+        # 3. Same path as the real adhan: preempts welcomes / ajrr in this guild
+        job = voice_jobs.submit(guild.id, "adhan", audio_file, [c.id for c in active_channels],
+                                requested_by=interaction.user.id)
+        await interaction.response.send_message(
+            f"جاري الدخول للرومات للأذان لصلاة **{prayer_info['ar']}**... 🚀 (#{job.id})", ephemeral=True)
+        report_job(interaction, job)
+    else:
+        await interaction.response.send_message("⚠️ ما فيه أحد في الرومات الصوتية حالياً!", ephemeral=True)
 
-            try:
-                # Explicitly use found FFMPEG_PATH
-                executable = FFMPEG_PATH if FFMPEG_PATH else "ffmpeg"
-                vc.play(discord.FFmpegPCMAudio(source=abs_path, executable=executable, options="-vn"))
-                print(f"Playback started for {audio_file} using {executable}")
-            except Exception as e:
-                print(f"❌ Test Prayer Error: {e}")
-                await interaction.followup.send(f"⚠️ خطأ في تشغيل الصوت: {e}", ephemeral=True)
-            
-            # Wait until done
-            while vc.is_playing():
-                await asyncio.sleep(1)
-            
-            await asyncio.sleep(0.5) # Quick pause
-            await vc.disconnect()
-            
-        except Exception as e:
-            print(f"Error in {v_channel.name}: {e}")
-            if guild.voice_client:
-                await guild.voice_client.disconnect()
-    
-    await interaction.followup.send("✅ تم الانتهاء من الأذان في جميع الرومات.", ephemeral=True)
+    # Send notifications manually for testing
+    await send_prayer_notifications(guild, prayer_name_en)
 
-@tasks.loop(minutes=1)
-async def prayer_task():
-    # Hardcoded Location: Riyadh, SA
-    city = "Riyadh"
-    country = "SA"
-    
-    # Force Riyadh Timezone
-    tz = pytz.timezone('Asia/Riyadh')
-    now = datetime.datetime.now(tz)
-    current_time = now.strftime("%H:%M")
-    
-    print(f"Checking prayer time... Current Riyadh Time: {current_time}")
+async def fire_prayer(location, prayer, scheduled):
+    """Called by the scheduler exactly once per location, at the prayer instant.
+
+    Only the leader process runs schedulers; the prayer is handed to every
+    shard (this process's own shards run it right away).
+    """
+    key = location_key(location)
+    payload = {"location": list(key), "prayer": prayer, "scheduled": scheduled.isoformat()}
+    shard_dispatcher.dispatch(event_id(key, prayer, scheduled), payload, bot.shard_count or 1)
+
+async def run_prayer(shard_ids, payload):
+    """Plays and posts one dispatched prayer in this process's guilds on `shard_ids`."""
+    location = prayer_locations.locations[tuple(payload["location"])]
+    prayer = payload["prayer"]
+    scheduled = datetime.datetime.fromisoformat(payload["scheduled"])
+    guilds = [g for g in prayer_locations.guilds_at(location, bot.guilds) if g.shard_id in shard_ids]
+    print(f"It's {prayer} time in {location['city']}! Checking {len(guilds)} guilds...")
+
+    async def start_guild(guild):
+        # Bounded part: checks, custom announcement and the adhan job starting
+        return await start_prayer_audio(guild, prayer)
+
+    async def finish_guild(guild, job):
+        # Unbounded part: text notifications while the adhan plays out
+        await asyncio.gather(
+            job.wait() if job else asyncio.sleep(0),
+            send_prayer_notifications(guild, prayer)
+        )
 
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"http://api.aladhan.com/v1/timingsByCity?city={city}&country={country}&method=4") as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    timings = data["data"]["timings"]
-                    
-                    prayers_en = ["Fajr", "Dhuhr", "Asr", "Maghrib", "Isha"]
-                    
-                    for prayer in prayers_en:
-                        if timings[prayer] == current_time:
-                            print(f"It's {prayer} time! Checking guilds...")
-                            for guild in bot.guilds:
-                                # Run voice and text notifications concurrently
-                                await asyncio.gather(
-                                    play_prayer_audio(guild, prayer),
-                                    send_prayer_notifications(guild, prayer)
-                                )
-                            
-                            # Wait a bit to prevent double triggering within the same minute
-                            await asyncio.sleep(60) 
-    except Exception as e:
-        print(f"Prayer task error: {e}")
+    # Lag is measured from the scheduled instant to the adhan job starting
+    late_by = (datetime.datetime.now(datetime.timezone.utc) - scheduled).total_seconds()
+    metrics.PRAYER_LAG.observe(max(late_by, 0), (location['city'],))
+    await fan_out(guilds, start_guild, label=f"{prayer} ({location['city']})",
+                  started_at=time.monotonic() - max(late_by, 0), finish=finish_guild)
+
+# One scheduler leader across all shard processes (flock), prayers handed to shards as files
+leader_lock = LeaderLock()
+shard_dispatcher = ShardDispatcher(run_prayer)
+
+# Per-guild locations from prayer_config.json (Riyadh by default).
+# One monthly calendar + deadline scheduler per distinct location.
+prayer_locations = PrayerLocations(load_prayer_config(), fire_prayer)
+
+# --- Lifecycle registrations (shutdown runs bottom to top) ---
+lifecycle.service("web server", "setup", start_web_server, stop=lambda runner: runner.cleanup())
+lifecycle.task("pinger", "setup", keep_alive_task)
+lifecycle.task("loop lag sampler", "setup", metrics.sample_loop_lag)
+# Write-behind for guild_state.jsonl (flushes what is pending when stopped)
+lifecycle.task("guild state writer", "setup", guild_state.run_writer)
+# Prayers dispatched to this process's shards (by whichever process leads)
+lifecycle.task("shard dispatch", "ready", lambda: shard_dispatcher.serve(local_shards()))
+# Calendar refreshers + prayer schedulers (one pair per location), leader only
+lifecycle.task("prayer schedulers", "ready", lambda: leader_lock.lead(prayer_locations.start))
+# Auxiliary voice workers log in once
+lifecycle.task("voice workers", "ready", lambda: voice_pool.start_auxiliary(auxiliary_tokens(), FFMPEG_PATH),
+               stop=lambda _: voice_pool.close())
 
 @bot.event
 async def on_ready():
-    # Start web server
-    await start_web_server()
+    global ready_logged
+    first_ready = not ready_logged
+    if first_ready:
+        startup.mark("login")
 
     print(f'Logged in as {bot.user.name}')
+    # Anything cached before a reconnect may be stale
+    channel_index.forget()
+
+    # Build any clip the manifest does not cover yet (no-op after build_audio.py).
+    # Once per process: a reconnect does not change the clips on disk.
+    if first_ready:
+        await asyncio.to_thread(audio_cache.prepare_all, FFMPEG_PATH)
+        startup.mark("audio cache")
     
-    # --- IMMEDIATE FORCE SYNC (Old Reliable Way) ---
-    # No clearing, no complex logic. Just sync everything NOW.
-    print("🔄 Starting immediate command sync...")
-    try:
-        synced = await bot.tree.sync()
-        print(f"✅ Synced {len(synced)} commands globally!")
-        print("📜 Active Commands:")
-        for cmd in synced:
-            print(f" - /{cmd.name}")
-    except Exception as e:
-        print(f"⚠️ Global sync error: {e}")
-
-    # --- CLEANUP DUPLICATES (The Safe Way) ---
-    # We remove guild-specific commands so only the Global ones remain.
-    # This fixes duplicates without wiping the bot.
-    for guild in bot.guilds:
-        try:
-            bot.tree.clear_commands(guild=guild)
-            await bot.tree.sync(guild=guild)
-            print(f"🧹 Cleared local duplicate commands for: {guild.name}")
-        except Exception as e:
-            print(f"❌ Failed to clear duplicates for {guild.name}: {e}")
-
-    if not prayer_task.is_running():
-        prayer_task.start()
-
+    # --- COMMAND SYNC ---
+    # Global sync only when the command tree hash changed since the last sync;
+    # guild-specific duplicates are removed once per guild (only if present).
+    # Reconnects skip this entirely. /sync and !fix force a full sync.
+    # With several shard processes, the one running shard 0 syncs
+    if command_sync.last_report is None and 0 in local_shards():
+        report = await command_sync.run(bot.application_id, bot.guilds)
+        print(f"🔄 Commands: global {report['global']}, {report['checked']} new guilds checked, "
+              f"{report['cleaned']} cleaned ({report['seconds']:.2f}s)")
+        startup.mark("command sync")
+
+    # Schedulers and voice workers: started on the first ready, no-op on reconnects
+    # (a service that died is started again)
+    await lifecycle.start_group("ready")
+
+    if first_ready:
+        ready_logged = True
+        startup.mark("workers")
+        print(f"⏱️ Ready in {startup.summary()}")
+        # Cached probe results are re-checked off the event loop
+        if env.source == "cache":
+            lifecycle.task("env probe", "background", revalidate_env)
+            await lifecycle.start_group("background")
     print('Bot is ready to welcome and pray!')
 
 if __name__ == "__main__":
+    startup.mark("setup")
     try:
         bot.run(TOKEN)
     except Exception as e:
-        print(f"Error starting bot: {e}")#   = = =   F8'E  '.*J'1  'D#/H'1  'D*A'9DJ  = = =  
-  
- @ b o t . e v e n t  
- a s y n c   d e f   o n _ r a w _ r e a c t i o n _ a d d ( p a y l o a d ) :  
-         i f   p a y l o a d . u s e r _ i d   = =   b o t . u s e r . i d :  
-                 r e t u r n  
-         g u i l d   =   b o t . g e t _ g u i l d ( p a y l o a d . g u i l d _ i d )  
-         i f   n o t   g u i l d :  
-                 r e t u r n  
-         m e m b e r   =   g u i l d . g e t _ m e m b e r ( p a y l o a d . u s e r _ i d )  
-         i f   n o t   m e m b e r :  
-                 r e t u r n  
-         #   '.*J'1  'DEF5'* 
-         i f   p a y l o a d . m e s s a g e _ i d   = =   1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 :   #   :J1  'D1BE  D13'D*C 
-                 r o l e s   =   {  
- 
\ No newline at end of file
+        print(f"Error starting bot: {e}")
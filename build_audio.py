@@ -0,0 +1,111 @@
+"""
+Audio asset build: one step for every clip.
+
+1. Generates TTS clips (prayer announcements) through the content-addressed
+   TTS cache; a clip is regenerated when its text changes. Recorded clips
+   (welcome.mp3) are only generated from text when the file is missing.
+2. Trims silence, normalizes loudness and encodes every *.mp3 to 48 kHz
+   stereo Opus packet stores, in parallel and incrementally (audio_cache).
+3. Writes .audio_cache/manifest.json (duration, frames, loudness, hashes).
+
+Usage: python build_audio.py [--workers N]
+"""
+import json
+import os
+import shutil
+import sys
+
+import audio_cache
+from env_probe import find_ffmpeg
+from tts_cache import TTSCache, tts_key, TTS_BACKEND
+
+# Clips generated from text (regenerated when the text changes)
+TTS_CLIPS = {
+    "fajr.mp3": "حان الآن موعد أذان الفجر",
+    "dhuhr.mp3": "حان الآن موعد أذان الظهر",
+    "asr.mp3": "حان الآن موعد أذان العصر",
+    "maghrib.mp3": "حان الآن موعد أذان المغرب",
+    "isha.mp3": "حان الآن موعد أذان العشاء",
+}
+
+# Recorded clips: the file in the repo wins; the text is only a stand-in when it is missing
+RECORDED_CLIPS = {
+    "welcome.mp3": "مرحباً بك في السيرفر، نتمنى لك وقتاً ممتعاً!",
+}
+
+# Which TTS key each committed clip was made from (commit this with the clips)
+TTS_INDEX_PATH = os.path.join(audio_cache.BASE_DIR, "tts_index.json")
+
+def _read_index():
+    try:
+        with open(TTS_INDEX_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def generate_missing(clips=TTS_CLIPS, language="ar", backend=TTS_BACKEND):
+    """
+    Makes every clip match its text: missing or outdated clips are generated
+    in parallel via the TTS cache and copied into place. A clip already on disk
+    without an index entry is adopted as-is for the current text.
+    """
+    index = _read_index()
+    todo = []
+    for filename, text in clips.items():
+        key = tts_key(text, language, None, backend)
+        path = os.path.join(audio_cache.BASE_DIR, filename)
+        if os.path.exists(path) and index.get(filename, key) == key:
+            index[filename] = key
+            print(f"{filename} is up to date.")
+            continue
+        todo.append((filename, key, {"text": text, "language": language, "backend": backend}))
+
+    if todo:
+        print(f"Generating {len(todo)} clips...")
+        results = TTSCache(backend=backend).generate_many([req for _, _, req in todo])
+        for (filename, key, _), generated in zip(todo, results):
+            if generated is None:
+                continue
+            ext = os.path.splitext(generated)[1]
+            if ext != os.path.splitext(filename)[1]:
+                print(f"⚠️ {filename}: backend produced {ext}, keeping the old clip")
+                continue
+            shutil.copyfile(generated, os.path.join(audio_cache.BASE_DIR, filename))
+            index[filename] = key
+            print(f"Created {filename}")
+
+    with open(TTS_INDEX_PATH, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+def generate_absent(clips=RECORDED_CLIPS, language="ar", backend=TTS_BACKEND):
+    """Generates recorded clips that are missing; an existing file is never touched."""
+    for filename, text in clips.items():
+        path = os.path.join(audio_cache.BASE_DIR, filename)
+        if os.path.exists(path):
+            continue
+        try:
+            generated = TTSCache(backend=backend).generate(text, language)
+        except Exception as e:
+            print(f"Error creating TTS stand-in for {filename}: {e}")
+            continue
+        if generated is not None and os.path.splitext(generated)[1] == os.path.splitext(filename)[1]:
+            shutil.copyfile(generated, path)
+            print(f"Created {filename} (TTS stand-in for the recording)")
+
+def main(argv=None, clips=TTS_CLIPS):
+    argv = sys.argv[1:] if argv is None else argv
+    workers = None
+    if "--workers" in argv:
+        workers = int(argv[argv.index("--workers") + 1])
+
+    generate_missing(clips)
+    generate_absent()
+    built = audio_cache.prepare_all(find_ffmpeg(), workers=workers)
+    for name, entry in sorted(built.items()):
+        loudness = f"{entry['output_lufs']:.1f} LUFS" if "output_lufs" in entry else "?"
+        print(f" - {name}: {entry['duration']:.2f}s, {entry['frames']} frames, {loudness}")
+    return 0 if built else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
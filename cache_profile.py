@@ -0,0 +1,162 @@
+"""
+Gateway intents and cache settings ("profiles").
+
+The bot only reads voice states, guild channels (and the roles behind their
+permissions) and the text of new messages. CACHE_PROFILE=lean asks Discord for
+just those events and keeps only what they need:
+
+    intents              guilds, voice_states, guild_messages, message_content
+    max_messages=None    no message cache
+    member_cache_flags   voice only: members are cached while they are in a
+                         voice channel (plus the bot itself)
+    chunking             off
+
+What reads each cache, and the fallback in the lean profile:
+
+    message cache      Nothing. Greetings and prefix commands use the message in
+                       the event. on_message_edit/on_message_delete would only
+                       fire through on_raw_* (the bot has no such handlers).
+    members            Voice occupancy, welcomes and the adhan fan-out use the
+                       members of voice channels, which the voice flag keeps.
+                       Admin checks use interaction.user / ctx.author from the
+                       payload. Any other member lookup must use
+                       guild.fetch_member (one API call) instead of get_member.
+    emojis, stickers   Nothing (the emojis_and_stickers intent is off, so
+                       discord.py does not store them).
+    reactions, typing,
+    invites, DMs, ...  Not handled by the bot; those events are no longer sent.
+
+CACHE_PROFILE=default keeps discord.py's defaults (what the bot always used).
+
+`python cache_profile.py [guilds]` loads synthetic guilds into each profile (in
+a fresh process each) and reports resident memory per 1k guilds.
+"""
+import os
+
+import discord
+
+CACHE_PROFILE = os.getenv("CACHE_PROFILE", "default").strip().lower()
+PROFILES = ("default", "lean")
+
+def client_options(profile=CACHE_PROFILE):
+    """Keyword arguments for the bot/client constructor."""
+    if profile == "lean":
+        intents = discord.Intents.none()
+        intents.guilds = True
+        intents.voice_states = True
+        intents.guild_messages = True
+        intents.message_content = True
+        flags = discord.MemberCacheFlags.none()
+        flags.voice = True
+        return {"intents": intents, "max_messages": None, "member_cache_flags": flags,
+                "chunk_guilds_at_startup": False}
+    if profile != "default":
+        print(f"⚠️ Unknown CACHE_PROFILE {profile!r}, using default")
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.voice_states = True
+    return {"intents": intents}
+
+# --- Memory benchmark (synthetic GUILD_CREATE + MESSAGE_CREATE payloads) ---
+BOT_ID = 1 << 40
+TEXT_CHANNELS = 25
+VOICE_CHANNELS = 15
+ROLES = 30
+EMOJIS = 40
+VOICE_MEMBERS = 8       # Members in voice when the guild is loaded
+MEMBERS = 60            # Members present in the payload (bot + voice + recent speakers)
+MESSAGES = 40           # Messages seen per guild after start
+
+def _user(user_id):
+    return {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0",
+            "global_name": None, "avatar": None, "bot": user_id == BOT_ID}
+
+def _member(user_id, roles):
+    return {"user": _user(user_id), "roles": roles, "joined_at": "2024-01-01T00:00:00+00:00",
+            "deaf": False, "mute": False, "flags": 0}
+
+def guild_payload(index):
+    guild_id = (index + 1) << 23
+    roles = [{"id": str(guild_id), "name": "@everyone", "permissions": "104324673", "position": 0,
+              "color": 0, "hoist": False, "managed": False, "mentionable": False}]
+    roles += [{"id": str(guild_id + 1000 + r), "name": f"role {r}", "permissions": "0", "position": r + 1,
+               "color": 0, "hoist": False, "managed": False, "mentionable": False} for r in range(ROLES)]
+    channels = [{"id": str(guild_id + 1 + c), "type": 0, "name": "chat" if c == 0 else f"text {c}",
+                 "position": c, "permission_overwrites": [], "topic": None}
+                for c in range(TEXT_CHANNELS)]
+    voice = [str(guild_id + 1 + TEXT_CHANNELS + c) for c in range(VOICE_CHANNELS)]
+    channels += [{"id": v, "type": 2, "name": f"voice {c}", "position": c, "permission_overwrites": [],
+                  "bitrate": 64000, "user_limit": 0} for c, v in enumerate(voice)]
+    member_ids = [BOT_ID] + [guild_id + 10000 + m for m in range(MEMBERS - 1)]
+    members = [_member(m, [str(guild_id + 1000 + (m % ROLES))]) for m in member_ids]
+    voice_states = [{"user_id": str(m), "channel_id": voice[i % VOICE_CHANNELS], "session_id": "s",
+                     "deaf": False, "mute": False, "self_deaf": False, "self_mute": False,
+                     "self_video": False, "suppress": False, "request_to_speak_timestamp": None}
+                    for i, m in enumerate(member_ids[1:VOICE_MEMBERS + 1])]
+    emojis = [{"id": str(guild_id + 5000 + e), "name": f"emoji{e}", "roles": [], "require_colons": True,
+               "managed": False, "animated": False, "available": True} for e in range(EMOJIS)]
+    return {"id": str(guild_id), "name": f"guild {index}", "owner_id": str(member_ids[1]),
+            "roles": roles, "channels": channels, "members": members, "voice_states": voice_states,
+            "emojis": emojis, "stickers": [], "threads": [], "features": [], "member_count": 5000,
+            "large": True, "unavailable": False, "verification_level": 0, "explicit_content_filter": 0,
+            "default_message_notifications": 0, "mfa_level": 0, "premium_tier": 0,
+            "preferred_locale": "en-US", "nsfw_level": 0, "system_channel_flags": 0}
+
+def message_payload(guild, n):
+    guild_id = int(guild["id"])
+    author = guild["members"][1 + n % (MEMBERS - 1)]
+    return {"id": str(guild_id + 100000 + n), "channel_id": guild["channels"][0]["id"],
+            "guild_id": guild["id"], "author": author["user"],
+            "member": {k: v for k, v in author.items() if k != "user"},
+            "content": "السلام عليكم ورحمة الله" if n % 5 == 0 else f"message {n} " + "x" * 60,
+            "timestamp": "2024-01-01T00:00:00+00:00", "edited_timestamp": None, "tts": False,
+            "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [],
+            "embeds": [], "pinned": False, "type": 0, "flags": 0}
+
+def _rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def measure(profile, guilds):
+    """Loads `guilds` synthetic guilds (and their messages); returns RSS growth in bytes."""
+    import gc
+
+    client = discord.Client(**client_options(profile))
+    state = client._connection
+    state.user = discord.ClientUser(state=state, data=_user(BOT_ID))
+    gc.collect()
+    before = _rss()
+    # Payloads are built one guild at a time so only what the cache keeps adds up
+    for i in range(guilds):
+        payload = guild_payload(i)
+        state._add_guild_from_data(payload)
+        for n in range(MESSAGES):
+            state.parse_message_create(message_payload(payload, n))
+    del payload
+    gc.collect()
+    cached = sum(len(g._members) for g in client.guilds)
+    return _rss() - before, cached, len(state._messages or ())
+
+if __name__ == "__main__":
+    import subprocess
+    import sys
+
+    if len(sys.argv) > 2 and sys.argv[1] == "--measure":
+        grown, members, messages = measure(sys.argv[2], int(sys.argv[3]))
+        print(grown, members, messages)
+        sys.exit(0)
+
+    guilds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"{guilds} synthetic guilds: {TEXT_CHANNELS + VOICE_CHANNELS} channels, {ROLES} roles, "
+          f"{EMOJIS} emojis, {MEMBERS} members in the payload ({VOICE_MEMBERS} in voice), "
+          f"{MESSAGES} messages each")
+    results = {}
+    for profile in PROFILES:
+        out = subprocess.run([sys.executable, __file__, "--measure", profile, str(guilds)],
+                             capture_output=True, text=True, check=True).stdout.split()
+        grown, members, messages = (int(x) for x in out[-3:])
+        results[profile] = grown
+        print(f"{profile:>8}: {grown / guilds * 1000 / 2**20:7.1f} MiB per 1k guilds "
+              f"({grown / 2**20:.1f} MiB total, {members} members, {messages} messages cached)")
+    saved = 1 - results["lean"] / results["default"] if results["default"] else 0
+    print(f"lean saves {saved:.0%}")
@@ -0,0 +1,146 @@
+"""
+Per-guild channel index.
+
+Resolves the channels the bot writes to by role ("chat", "athkar", "locked"),
+caches the bot's permissions per channel, and tracks which voice channels
+have people in them, so prayer-time lookups are dict reads instead of scans
+of every channel and member.
+
+Everything is built lazily per guild and dropped on the gateway events that
+can change it (channel/role create, update, delete; the bot's own roles).
+"""
+
+# Role -> text channel name (first match in channel order, like discord.utils.get)
+TEXT_CHANNEL_ROLES = {
+    "chat": "chat",
+    "athkar": "اذكار",
+}
+
+class ChannelIndex:
+    """Role -> channel ID, channel -> bot permissions, voice channel -> humans present."""
+
+    def __init__(self, locked_channel=lambda guild_id: None, text_roles=TEXT_CHANNEL_ROLES):
+        self.text_roles = text_roles
+        self.locked_channel = locked_channel     # guild_id -> locked voice channel ID (guild state)
+        self._roles = {}    # guild_id -> {role: channel_id}
+        self._perms = {}    # guild_id -> {channel_id: discord.Permissions}
+        self._voice = {}    # guild_id -> {voice channel_id: set(member_id)} (humans only)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # --- Roles ---
+    def _build_roles(self, guild):
+        by_name = {}
+        for channel in guild.text_channels:
+            by_name.setdefault(channel.name, channel.id)
+        roles = {role: by_name[name] for role, name in self.text_roles.items() if name in by_name}
+        self._roles[guild.id] = roles
+        return roles
+
+    def channel(self, guild, role):
+        """The channel with this role in `guild`, or None."""
+        if role == "locked":
+            channel_id = self.locked_channel(guild.id)
+        else:
+            roles = self._roles.get(guild.id)
+            if roles is None:
+                roles = self._build_roles(guild)
+            channel_id = roles.get(role)
+        return guild.get_channel(channel_id) if channel_id else None
+
+    # --- Permissions ---
+    def permissions(self, channel):
+        """The bot's permissions in `channel` (cached until a channel/role event)."""
+        perms = self._perms.setdefault(channel.guild.id, {})
+        cached = perms.get(channel.id)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        cached = perms[channel.id] = channel.permissions_for(channel.guild.me)
+        return cached
+
+    def can_send(self, channel):
+        return self.permissions(channel).send_messages
+
+    def can_speak(self, channel):
+        perms = self.permissions(channel)
+        return perms.connect and perms.speak
+
+    def sendable(self, guild, role):
+        """The channel with this role if the bot may post there, else None."""
+        channel = self.channel(guild, role)
+        return channel if channel is not None and self.can_send(channel) else None
+
+    # --- Voice occupancy ---
+    def _build_voice(self, guild):
+        occupancy = {}
+        for channel in guild.voice_channels:
+            humans = {m.id for m in channel.members if not m.bot}
+            if humans:
+                occupancy[channel.id] = humans
+        self._voice[guild.id] = occupancy
+        return occupancy
+
+    def voice_update(self, member, before, after):
+        """Keeps occupancy current from on_voice_state_update (call for every event)."""
+        occupancy = self._voice.get(member.guild.id)
+        if occupancy is None or member.bot:
+            return
+        if before.channel is not None:
+            humans = occupancy.get(before.channel.id)
+            if humans is not None:
+                humans.discard(member.id)
+                if not humans:
+                    del occupancy[before.channel.id]
+        if after.channel is not None:
+            occupancy.setdefault(after.channel.id, set()).add(member.id)
+
+    def active_voice_channels(self, guild):
+        """Voice channels with at least one non-bot member, in channel order."""
+        occupancy = self._voice.get(guild.id)
+        if occupancy is None:
+            occupancy = self._build_voice(guild)
+        channels = [guild.get_channel(channel_id) for channel_id in occupancy]
+        channels = [c for c in channels if c is not None]
+        channels.sort(key=lambda c: (c.position, c.id))
+        return channels
+
+    # --- Invalidation ---
+    def invalidate_guild(self, guild_id):
+        """Roles or overwrites changed somewhere in the guild: drop names and permissions."""
+        self.invalidations += 1
+        self._roles.pop(guild_id, None)
+        self._perms.pop(guild_id, None)
+
+    def channel_changed(self, channel):
+        # A rename can move a role; a category overwrite change affects its children
+        self.invalidate_guild(channel.guild.id)
+
+    def channel_deleted(self, channel):
+        self.invalidate_guild(channel.guild.id)
+        occupancy = self._voice.get(channel.guild.id)
+        if occupancy is not None:
+            occupancy.pop(channel.id, None)
+
+    def forget(self, guild_id=None):
+        """Drops everything for a guild (or all guilds, e.g. after a reconnect)."""
+        if guild_id is None:
+            self._roles.clear()
+            self._perms.clear()
+            self._voice.clear()
+            return
+        self._roles.pop(guild_id, None)
+        self._perms.pop(guild_id, None)
+        self._voice.pop(guild_id, None)
+
+    def stats(self):
+        return {
+            "guilds": len(self._roles),
+            "permissions": sum(len(p) for p in self._perms.values()),
+            "voice_guilds": len(self._voice),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
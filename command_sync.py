@@ -0,0 +1,115 @@
+"""
+Incremental slash-command sync.
+
+The global command tree is serialized the same way tree.sync() sends it and
+hashed; the hash is kept in command_sync.json, and the global sync only runs
+when it differs from the last successful sync for this application. Guilds
+are checked for stale guild-scoped commands once (one GET each) and remembered
+as clean, so a reconnect or restart costs no API calls at all when nothing
+changed. /sync and !fix still force a full sync.
+"""
+import hashlib
+import json
+import os
+import time
+
+from storage import CONFIG_DIR, atomic_write_json
+
+SYNC_STATE_PATH = os.path.join(CONFIG_DIR, "command_sync.json")
+
+def tree_payload(tree):
+    """The global command payload tree.sync() would send."""
+    return [command.to_dict(tree) for command in tree.get_commands()]
+
+def tree_hash(tree):
+    data = json.dumps(tree_payload(tree), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+class CommandSync:
+    """Syncs the command tree only when it changed, cleans each guild only once."""
+
+    def __init__(self, tree, path=SYNC_STATE_PATH):
+        self.tree = tree
+        self.path = path
+        self.state = self._load()
+        self.last_report = None
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"⚠️ Could not read {self.path}, commands will be re-synced: {e}")
+            return {}
+
+    def _save(self):
+        try:
+            atomic_write_json(self.path, self.state)
+        except Exception as e:
+            print(f"⚠️ Could not save {self.path}: {e}")
+
+    def _app_state(self, application_id):
+        # Guard against a different bot token reusing the same checkout
+        app = str(application_id)
+        if self.state.get("application_id") != app:
+            self.state = {"application_id": app, "hash": None, "clean_guilds": []}
+        return self.state
+
+    async def sync_global(self, application_id, force=False):
+        """Returns the synced commands, or None when the stored hash already matches."""
+        state = self._app_state(application_id)
+        digest = tree_hash(self.tree)
+        if not force and state.get("hash") == digest:
+            return None
+        synced = await self.tree.sync()
+        state["hash"] = digest
+        state["synced_at"] = time.time()
+        self._save()
+        return synced
+
+    async def clean_guild(self, guild, force=False, save=True):
+        """Removes guild-scoped commands if there are any; returns True if it had to."""
+        clean = set(self.state.get("clean_guilds", []))
+        if not force and guild.id in clean:
+            return False
+        stale = force or bool(await self.tree.fetch_commands(guild=guild))
+        if stale:
+            self.tree.clear_commands(guild=guild)
+            await self.tree.sync(guild=guild)
+        clean.add(guild.id)
+        self.state["clean_guilds"] = sorted(clean)
+        if save:
+            self._save()
+        return stale
+
+    async def run(self, application_id, guilds):
+        """Startup sync: global tree if changed, then guilds not yet known to be clean."""
+        started = time.monotonic()
+        report = {"global": "unchanged", "checked": 0, "cleaned": 0, "errors": 0}
+        try:
+            synced = await self.sync_global(application_id)
+            if synced is not None:
+                report["global"] = f"synced {len(synced)}"
+        except Exception as e:
+            report["global"] = f"error: {e}"
+
+        known = set(self.state.get("clean_guilds", []))
+        for guild in guilds:
+            if guild.id in known:
+                continue
+            report["checked"] += 1
+            try:
+                if await self.clean_guild(guild, save=False):
+                    report["cleaned"] += 1
+                    print(f"🧹 Cleared local duplicate commands for: {guild.name}")
+            except Exception as e:
+                report["errors"] += 1
+                print(f"❌ Failed to clear duplicates for {guild.name}: {e}")
+
+        if report["checked"]:
+            self._save()
+        report["seconds"] = time.monotonic() - started
+        self.last_report = report
+        return report
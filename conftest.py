@@ -0,0 +1 @@
+# Lets tests/ import the bot's top-level modules
@@ -0,0 +1,237 @@
+"""
+Cached environment probe.
+
+Finding ffmpeg (possibly via imageio-ffmpeg), asking it for its version,
+finding libopus (find_library, fixed paths, a /nix/store glob) and listing the
+audio assets is slow enough to matter on every cold start. The results are
+kept in .env_probe.json keyed by a fingerprint of the environment (Python,
+discord.py, PATH, library paths, deploy commit). A start with a matching
+fingerprint reuses them after a few stat() calls and re-probes in the
+background; a mismatch or a missing file means a full probe.
+
+`python env_probe.py` runs a full probe and writes the cache (done in the
+Docker build so the image ships with it).
+"""
+import ctypes.util
+import glob
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+from storage import CONFIG_DIR, atomic_write_json
+
+PROBE_PATH = os.path.join(CONFIG_DIR, ".env_probe.json")
+PROBE_VERSION = "1"
+
+# Environment variables that change what the probe would find
+FINGERPRINT_ENV = ("PATH", "LD_LIBRARY_PATH", "NIX_PROFILES", "RAILWAY_GIT_COMMIT_SHA", "SOURCE_COMMIT")
+
+FFMPEG_PATHS = [
+    "/usr/bin/ffmpeg",
+    "/usr/local/bin/ffmpeg",
+    "/bin/ffmpeg",
+    "/nix/var/nix/profiles/default/bin/ffmpeg",
+]
+OPUS_PATHS = [
+    "/usr/lib/libopus.so",
+    "/usr/lib/libopus.so.0",
+    "/usr/local/lib/libopus.so",
+    "/lib/libopus.so",
+]
+OPUS_NAMES = ["libopus.so.0", "libopus.so", "libopus-0.dll"]
+
+class PhaseTimer:
+    """Startup time per phase, in the order the phases ran."""
+
+    def __init__(self, started=None):
+        self.started = time.monotonic() if started is None else started
+        self.phases = []
+        self._mark = self.started
+
+    def mark(self, name):
+        """Ends the current phase (everything since the previous mark) as `name`."""
+        now = time.monotonic()
+        self.phases.append((name, now - self._mark))
+        self._mark = now
+
+    def total(self):
+        return self._mark - self.started
+
+    def summary(self):
+        parts = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases)
+        return f"{self.total():.2f}s ({parts})"
+
+def fingerprint():
+    try:
+        import discord
+        discord_version = discord.__version__
+    except Exception:
+        discord_version = None
+    # Not platform.platform(): it carries the kernel release, which changes on
+    # every host update without changing anything the probe results depend on
+    parts = [PROBE_VERSION, sys.version, platform.machine(), " ".join(platform.libc_ver()), discord_version]
+    parts += [os.getenv(name, "") for name in FINGERPRINT_ENV]
+    return hashlib.sha256("\x00".join(map(str, parts)).encode("utf-8")).hexdigest()[:24]
+
+# --- Probes ---
+def find_ffmpeg():
+    # 1. PATH - Prioritize system FFmpeg (Docker)
+    path = shutil.which("ffmpeg")
+    if path:
+        return path
+    # 2. imageio-ffmpeg (Fallback)
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception as e:
+        print(f"⚠️ imageio-ffmpeg failed: {e}")
+    # 3. Common Linux/Nix paths
+    for p in FFMPEG_PATHS:
+        if os.path.exists(p) and os.access(p, os.X_OK):
+            return p
+    # 4. Current directory
+    for name in ("ffmpeg.exe", "ffmpeg"):
+        if os.path.exists(name):
+            return os.path.abspath(name)
+    return None
+
+def ffmpeg_version(path):
+    if not path:
+        return None
+    try:
+        result = subprocess.run([path, "-version"], capture_output=True, text=True, timeout=10)
+        return result.stdout.splitlines()[0] if result.stdout else "Unknown"
+    except Exception as e:
+        return f"error: {e}"
+
+def opus_candidates():
+    """Library names/paths worth trying, best first."""
+    candidates = []
+    lib = ctypes.util.find_library("opus")
+    if lib:
+        candidates.append(lib)
+    candidates += OPUS_PATHS
+    candidates += glob.glob("/nix/store/*-libopus-*/lib/libopus.so.0")
+    candidates += OPUS_NAMES
+    return candidates
+
+def load_opus(candidates):
+    """Loads libopus into discord.py; returns the name/path that worked or None."""
+    import discord
+    if discord.opus.is_loaded():
+        return "preloaded"
+    for lib in candidates:
+        try:
+            discord.opus.load_opus(lib)
+            return lib
+        except Exception:
+            pass
+    return None
+
+def asset_inventory(directory=CONFIG_DIR):
+    """Audio clips shipped next to the bot: {name: size}."""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return {}
+    return {n: os.path.getsize(os.path.join(directory, n)) for n in sorted(names) if n.endswith(".mp3")}
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+        return [st.st_size, int(st.st_mtime)]
+    except (OSError, TypeError):
+        return None
+
+def full_probe():
+    """Everything from scratch (blocking; runs ffmpeg once)."""
+    ffmpeg = find_ffmpeg()
+    return {
+        "fingerprint": fingerprint(),
+        "probed_at": time.time(),
+        "ffmpeg": ffmpeg,
+        "ffmpeg_stat": _stat_key(ffmpeg),
+        "ffmpeg_version": ffmpeg_version(ffmpeg),
+        "opus_candidates": opus_candidates(),
+        "assets": asset_inventory(),
+    }
+
+class EnvProbe:
+    """Probe results for this process: from the cache when still valid, else probed now."""
+
+    def __init__(self, path=PROBE_PATH):
+        self.path = path
+        self.data = None
+        self.source = None
+        self.opus = None
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"⚠️ Could not read {self.path}: {e}")
+            return None
+
+    def _valid(self, data):
+        if not data or data.get("fingerprint") != fingerprint():
+            return False
+        # The binary the cache points at must still be the same file
+        return data.get("ffmpeg") is None or _stat_key(data["ffmpeg"]) == data.get("ffmpeg_stat")
+
+    def _save(self):
+        try:
+            atomic_write_json(self.path, self.data)
+        except Exception as e:
+            print(f"⚠️ Could not save {self.path}: {e}")
+
+    def load(self):
+        """Cached results if the fingerprint matches, otherwise a full probe."""
+        cached = self._read()
+        if self._valid(cached):
+            self.data, self.source = cached, "cache"
+        else:
+            self.data, self.source = full_probe(), "probe"
+            self._save()
+        return self.data
+
+    def load_opus(self):
+        """Tries the library that worked last time first, then the probed candidates."""
+        known = self.data.get("opus")
+        candidates = [known] if known else []
+        candidates += [c for c in self.data.get("opus_candidates", []) if c != known]
+        self.opus = load_opus(candidates)
+        if self.opus != known:
+            self.data["opus"] = self.opus
+            self._save()
+        return self.opus
+
+    @property
+    def ffmpeg(self):
+        return self.data.get("ffmpeg")
+
+    def revalidate(self):
+        """Blocking full probe; updates the cache and returns the fields that changed."""
+        fresh = full_probe()
+        fresh["opus"] = self.opus
+        changed = [k for k in ("ffmpeg", "ffmpeg_version", "assets") if fresh.get(k) != self.data.get(k)]
+        self.data, self.source = fresh, "probe"
+        self._save()
+        return changed
+
+    def age(self):
+        return time.time() - self.data.get("probed_at", time.time())
+
+if __name__ == "__main__":
+    probe = EnvProbe()
+    probe.data = full_probe()
+    probe.load_opus()
+    probe._save()
+    print(json.dumps({k: v for k, v in probe.data.items() if k != "opus_candidates"}, indent=2))
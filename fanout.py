@@ -0,0 +1,79 @@
+"""
+Bounded concurrent fan-out: runs one coroutine per guild at the same time,
+limited by a semaphore, with a per-guild timeout and per-guild error isolation.
+
+Only the start of each guild's work holds a slot. What follows (`finish`,
+e.g. waiting for a broadcast to end) runs without one, so guild #11 never
+waits for guild #1's adhan to finish playing.
+"""
+import asyncio
+import os
+import time
+
+import metrics
+
+# Guilds being started at once (voice connects share the gateway rate limit)
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", 10))
+# Hard limit for one guild's work (adhan in every active channel of that guild)
+FANOUT_GUILD_TIMEOUT = float(os.getenv("FANOUT_GUILD_TIMEOUT", 900))
+
+class FanoutReport:
+    """Per-guild outcome of one fan-out: start lag (until started), duration and status."""
+
+    def __init__(self, label):
+        self.label = label
+        self.results = {}   # guild_id -> (start_lag, duration, status)
+
+    def record(self, guild, start_lag, duration, status):
+        self.results[guild.id] = (start_lag, duration, status)
+
+    def summary(self):
+        if not self.results:
+            return f"{self.label}: no guilds"
+        lags = sorted(r[0] for r in self.results.values())
+        statuses = {}
+        for _, _, status in self.results.values():
+            statuses[status] = statuses.get(status, 0) + 1
+        median = lags[len(lags) // 2]
+        counts = ", ".join(f"{k}={v}" for k, v in sorted(statuses.items()))
+        return (f"{self.label}: {len(lags)} guilds, start lag min={lags[0]:.2f}s "
+                f"median={median:.2f}s max={lags[-1]:.2f}s ({counts})")
+
+async def fan_out(guilds, work, label="fan-out", concurrency=FANOUT_CONCURRENCY,
+                  timeout=FANOUT_GUILD_TIMEOUT, started_at=None, finish=None):
+    """
+    Awaits `work(guild)` for every guild, at most `concurrency` at a time, then
+    `finish(guild, result)` (if given) without holding a slot.
+    Start lag is from `started_at` (time.monotonic(), default: now) until
+    work(guild) returns. `timeout` covers both parts.
+    One guild failing or timing out never affects the others.
+    """
+    started_at = time.monotonic() if started_at is None else started_at
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    report = FanoutReport(label)
+
+    async def run_one(guild):
+        begin = time.monotonic()
+        start_lag = None
+        status = "ok"
+        try:
+            async with semaphore:
+                result = await asyncio.wait_for(work(guild), timeout=timeout)
+            start_lag = time.monotonic() - started_at
+            if finish is not None:
+                await asyncio.wait_for(finish(guild, result), timeout=max(0, timeout - (time.monotonic() - begin)))
+        except asyncio.TimeoutError:
+            status = "timeout"
+            metrics.error("fanout", "timeout")
+            print(f"⚠️ {label}: {guild.name} timed out after {timeout:.0f}s")
+        except Exception as e:
+            status = type(e).__name__
+            metrics.error("fanout", e)
+            print(f"❌ {label}: {guild.name} failed: {e}")
+        if start_lag is None:
+            start_lag = time.monotonic() - started_at
+        report.record(guild, start_lag, time.monotonic() - begin, status)
+
+    await asyncio.gather(*(run_one(g) for g in guilds))
+    print(f"📊 {report.summary()}")
+    return report
@@ -1,15 +1,5 @@
-from gtts import gTTS
-import os
+import build_audio
 
-text = "مرحباً بك في السيرفر، نتمنى لك وقتاً ممتعاً!"
-language = 'ar'
-
-if not os.path.exists("welcome.mp3"):
-    try:
-        tts = gTTS(text=text, lang=language, slow=False)
-        tts.save("welcome.mp3")
-        print("welcome.mp3 created successfully.")
-    except Exception as e:
-        print(f"Error creating audio: {e}")
-else:
-    print("welcome.mp3 already exists.")
+# Welcome clip only: a TTS stand-in, generated just when welcome.mp3 is missing.
+# The Opus cache is built by `python build_audio.py` (or by the bot on startup).
+build_audio.generate_absent()
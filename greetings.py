@@ -0,0 +1,170 @@
+"""
+Greeting auto-replies for on_message.
+
+Triggers are normalized (tashkeel, tatweel, alef forms, punctuation, emoji and
+repeated spaces removed) and compiled at import into one regex that tolerates
+those variants, so each message is matched in a single pass without copying.
+Each channel gets at most one reply per GREETING_COOLDOWN seconds, so a flood
+of salams produces one reply.
+
+Extra trigger -> reply pairs can be added in greetings.json:
+    {
+        "cooldown": 30,
+        "replies": {"صباح الخير": "صباح النور ☀️"}
+    }
+
+`python greetings.py [messages]` benchmarks the old and new matcher.
+"""
+import json
+import os
+import re
+import time
+
+from storage import CONFIG_DIR
+
+GREETINGS_PATH = os.path.join(CONFIG_DIR, "greetings.json")
+GREETING_COOLDOWN = float(os.getenv("GREETING_COOLDOWN", 30))
+
+SALAM_REPLY = "وعليكم السلام ورحمة الله وبركاته 🌸"
+DEFAULT_REPLIES = {
+    "السلام عليكم": SALAM_REPLY,
+    "سلام عليكم": SALAM_REPLY,
+}
+
+# Tashkeel, Quranic marks and tatweel are dropped; alef/yeh variants folded
+_DROP = dict.fromkeys(
+    [*range(0x064B, 0x0660), 0x0670, *range(0x06D6, 0x06EE), 0x0640], None
+)
+_FOLD = {ord(c): "ا" for c in "أإآٱ"}
+_FOLD[ord("ى")] = "ي"
+_TABLE = {**_DROP, **_FOLD}
+# Anything that is not a letter, digit or space (punctuation, emoji)
+_SYMBOLS = re.compile(r"[^\w\s]+")
+
+def normalize(text):
+    """Folds a message to the form triggers are matched in."""
+    text = _SYMBOLS.sub(" ", text.translate(_TABLE))
+    return " ".join(text.split()).lower()
+
+def load_replies(path=GREETINGS_PATH):
+    """Returns (replies, cooldown) from greetings.json merged over the defaults."""
+    replies = dict(DEFAULT_REPLIES)
+    cooldown = GREETING_COOLDOWN
+    try:
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        replies.update(config.get("replies") or {})
+        cooldown = float(config.get("cooldown", cooldown))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"⚠️ Could not read {path}, using default greetings: {e}")
+    return replies, cooldown
+
+# Characters that may sit between the letters of a trigger in raw text
+_MARKS = "[\u0640\u064B-\u065F\u0670\u06D6-\u06ED]*"
+_VARIANTS = {"ا": "[اأإآٱ]", "ي": "[يى]"}
+
+def _raw_pattern(trigger):
+    """Regex matching a normalized trigger directly in unnormalized text."""
+    parts = []
+    for ch in trigger:
+        if ch == " ":
+            parts.append("(?:[^\\w]|\u0640)+")
+        else:
+            parts.append(_VARIANTS.get(ch, re.escape(ch)) + _MARKS)
+    return "".join(parts)
+
+class GreetingMatcher:
+    """Maps a message to its reply (or None) with one regex scan."""
+
+    def __init__(self, replies, cooldown=GREETING_COOLDOWN, max_channels=10000):
+        self.replies = {}
+        for trigger, reply in replies.items():
+            key = normalize(trigger)
+            if key:
+                self.replies[key] = reply
+        # A trigger containing a shorter one with the same reply never changes
+        # the answer; leaving it out keeps the regex small
+        needed = [
+            t for t in self.replies
+            if not any(o != t and o in t and self.replies[o] == self.replies[t] for o in self.replies)
+        ]
+        # One group per trigger, longest first so the most specific reply wins.
+        # The pattern folds the normalization in, so messages are never copied.
+        self._ordered = sorted(needed, key=len, reverse=True)
+        self.pattern = None
+        if self._ordered:
+            self.pattern = re.compile(
+                "|".join(f"({_raw_pattern(t)})" for t in self._ordered), re.IGNORECASE)
+        self.cooldown = cooldown
+        self.max_channels = max_channels
+        self._last_reply = {}   # channel_id -> monotonic time of last reply
+        self.matched = 0
+        self.suppressed = 0
+
+    def match(self, text):
+        if self.pattern is None or not text:
+            return None
+        found = self.pattern.search(text)
+        return self.replies[self._ordered[found.lastindex - 1]] if found else None
+
+    def reply_for(self, channel_id, text, cooldown=None):
+        """The reply to send in `channel_id`, or None (no greeting or on cooldown).
+
+        `cooldown` overrides the default for this call (per-guild setting).
+        """
+        reply = self.match(text)
+        if reply is None:
+            return None
+        self.matched += 1
+        now = time.monotonic()
+        last = self._last_reply.get(channel_id)
+        if last is not None and now - last < (self.cooldown if cooldown is None else cooldown):
+            self.suppressed += 1
+            return None
+        if len(self._last_reply) >= self.max_channels:
+            self._prune(now)
+        self._last_reply[channel_id] = now
+        return reply
+
+    def _prune(self, now):
+        self._last_reply = {c: t for c, t in self._last_reply.items() if now - t < self.cooldown}
+
+    def stats(self):
+        return {"triggers": len(self.replies), "matched": self.matched,
+                "suppressed": self.suppressed, "cooldown": self.cooldown}
+
+matcher = GreetingMatcher(*load_replies())
+
+if __name__ == "__main__":
+    import random
+    import sys
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    samples = [
+        "السلام عليكم",
+        "السَّلَامُ عَلَيْكُمْ وَرَحْمَةُ اللهِ",
+        "السـلام   عليكم 🌹",
+        "سلام عليكم!!",
+        "كيف الحال يا شباب؟",
+        "وش رايكم نلعب الحين",
+        "good morning everyone",
+        "https://example.com/some/long/link?with=query&and=more " * 3,
+        "هلا والله، نورت السيرفر 😂😂",
+        "ابي اعرف متى الاجتماع",
+    ]
+    rng = random.Random(1)
+    messages = [rng.choice(samples) for _ in range(count)]
+
+    def before(content):
+        content = content.strip()
+        greetings = ["السلام عليكم", "سلام عليكم", "السلام عليكم ورحمة الله", "السلام عليكم ورحمة الله وبركاته"]
+        return any(greeting in content for greeting in greetings)
+
+    bench = GreetingMatcher(DEFAULT_REPLIES)
+    for label, fn in (("before", before), ("after", bench.match)):
+        start = time.perf_counter()
+        hits = sum(1 for m in messages if fn(m))
+        elapsed = time.perf_counter() - start
+        print(f"{label:>6}: {count / elapsed:,.0f} msgs/sec, {hits} greetings matched")
@@ -0,0 +1,205 @@
+"""
+Per-guild bot state: welcome on/off, lock channel and cooldown settings.
+
+Reads are a dict lookup (guilds never configured share one default object).
+Changes are appended to guild_state.jsonl by a write-behind task that flushes
+every STATE_FLUSH_SECONDS in one write; when the log grows well past the
+number of guilds it is compacted into a fresh file and swapped in with
+os.replace, so a crash leaves either the old or the new file, never half.
+Loading parses the whole file in one json.loads call.
+
+guild_state.jsonl (one full snapshot per line, last line per guild wins):
+    {"guild": 123, "active": false, "locked_channel": 456}
+"""
+import asyncio
+import json
+import os
+import tempfile
+import threading
+
+from storage import CONFIG_DIR
+
+STATE_PATH = os.path.join(CONFIG_DIR, "guild_state.jsonl")
+STATE_FLUSH_SECONDS = float(os.getenv("STATE_FLUSH_SECONDS", 2))
+
+class GuildState:
+    __slots__ = ("guild_id", "active", "locked_channel",
+                 "greeting_cooldown", "sticky", "sticky_idle")
+
+    # Field -> default; None for the cooldown settings means "use the global default"
+    DEFAULTS = {
+        "active": True,
+        "locked_channel": None,
+        "greeting_cooldown": None,
+        "sticky": None,
+        "sticky_idle": None,
+    }
+
+    def __init__(self, guild_id, **fields):
+        self.guild_id = guild_id
+        for name, default in self.DEFAULTS.items():
+            setattr(self, name, fields.get(name, default))
+
+    def to_dict(self):
+        data = {"guild": self.guild_id}
+        for name, default in self.DEFAULTS.items():
+            value = getattr(self, name)
+            if value != default:
+                data[name] = value
+        return data
+
+    def is_default(self):
+        return len(self.to_dict()) == 1
+
+class GuildStateStore:
+    """In-memory guild states with batched, append-only persistence."""
+
+    def __init__(self, path=STATE_PATH, flush_seconds=STATE_FLUSH_SECONDS):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self._states = {}
+        self._default = GuildState(0)
+        self._dirty = set()
+        self._log_lines = 0
+        self._wake = None
+        self._io_lock = threading.Lock()    # One writer at a time: writer thread, shutdown flush, compact
+        self.flushes = 0
+
+    # --- Reads ---
+    def get(self, guild_id):
+        """The guild's state; never-configured guilds share a read-only default."""
+        return self._states.get(guild_id, self._default)
+
+    def __iter__(self):
+        return iter(self._states.values())
+
+    # --- Writes ---
+    def update(self, guild_id, **fields):
+        unknown = set(fields) - set(GuildState.DEFAULTS)
+        if unknown:
+            raise KeyError(f"unknown guild state fields: {', '.join(sorted(unknown))}")
+        state = self._states.get(guild_id)
+        if state is None:
+            state = self._states[guild_id] = GuildState(guild_id)
+        for name, value in fields.items():
+            setattr(state, name, value)
+        self._dirty.add(guild_id)
+        if self._wake is not None:
+            self._wake.set()
+        return state
+
+    # --- Persistence ---
+    def load(self):
+        """Reads the log (last snapshot per guild wins); returns the number of guilds."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            return 0
+        lines = [line for line in text.split("\n") if line.strip()]
+        try:
+            records = json.loads("[" + ",".join(lines) + "]")
+        except ValueError:
+            # A torn last line after a crash: fall back to line by line
+            records = []
+            for line in lines:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    print(f"⚠️ Skipping a damaged line in {self.path}")
+        for record in records:
+            guild_id = record.pop("guild")
+            self._states[guild_id] = GuildState(guild_id, **record)
+        for guild_id in [g for g, s in self._states.items() if s.is_default()]:
+            del self._states[guild_id]
+        self._log_lines = len(lines)
+        return len(self._states)
+
+    def _collect(self):
+        """Serializes dirty guilds on the event loop; returns (lines, full snapshot or None)."""
+        dirty, self._dirty = self._dirty, set()
+        lines = []
+        for guild_id in dirty:
+            state = self._states.get(guild_id)
+            if state is None:
+                continue
+            lines.append(json.dumps(state.to_dict(), ensure_ascii=False))
+            if state.is_default():
+                del self._states[guild_id]
+        snapshot = None
+        if lines and self._log_lines + len(lines) > 2 * len(self._states) + 1000:
+            snapshot = [json.dumps(s.to_dict(), ensure_ascii=False) for s in self._states.values()]
+        return lines, snapshot
+
+    def _write(self, lines, snapshot):
+        """File I/O only (safe to run in a thread)."""
+        with self._io_lock:
+            if snapshot is not None:
+                self._replace(snapshot)
+                self._log_lines = len(snapshot)
+            elif lines:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._log_lines += len(lines)
+            if lines:
+                self.flushes += 1
+        return len(lines)
+
+    def flush(self):
+        """Blocking flush of every pending change (used at shutdown)."""
+        return self._write(*self._collect())
+
+    def compact(self):
+        """Rewrites the log as one line per configured guild."""
+        snapshot = [json.dumps(s.to_dict(), ensure_ascii=False) for s in self._states.values()]
+        with self._io_lock:
+            self._replace(snapshot)
+            self._log_lines = len(snapshot)
+
+    def _replace(self, lines):
+        # Temp file in the same directory + os.replace: readers see old or new, never half
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".jsonl", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                if lines:
+                    f.write("\n".join(lines) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    async def run_writer(self):
+        """Write-behind loop (lifecycle task): batches changes every flush_seconds."""
+        self._wake = asyncio.Event()
+        if self._dirty:
+            self._wake.set()
+        pending = None
+        try:
+            while True:
+                await self._wake.wait()
+                await asyncio.sleep(self.flush_seconds)
+                self._wake.clear()
+                # Serialize here, write in a thread (shielded: a cancel must not orphan the write)
+                pending = asyncio.ensure_future(asyncio.to_thread(self._write, *self._collect()))
+                await asyncio.shield(pending)
+                pending = None
+        finally:
+            # Shutdown: let an in-flight write finish, then whatever is still dirty goes out
+            if pending is not None:
+                try:
+                    await pending
+                except Exception as e:
+                    print(f"⚠️ Guild state write failed: {e}")
+            self.flush()
+
+    def stats(self):
+        return {"guilds": len(self._states), "dirty": len(self._dirty),
+                "log_lines": self._log_lines, "flushes": self.flushes}
@@ -0,0 +1,136 @@
+"""
+Lifecycle of the bot's long-lived pieces (web server, pinger, prayer
+schedulers, voice workers, ...).
+
+Each piece is registered once with a group ("setup" runs from setup_hook,
+"ready" from the first on_ready). Starting a group again is a no-op for
+everything still running, so gateway reconnects cannot bind the port twice or
+multiply background tasks. Shutdown stops everything in reverse start order.
+"""
+import asyncio
+import time
+
+class Service:
+    """One named piece: either a resource (start -> handle, stop(handle)) or background task(s)."""
+
+    def __init__(self, name, group, start, stop=None, task=False):
+        self.name = name
+        self.group = group
+        self._start = start
+        self._stop = stop
+        self.is_task = task
+        self.handle = None
+        self.tasks = []
+        self.state = "idle"     # idle | running | done | failed | stopped
+        self.error = None
+        self.started_at = None
+        self.starts = 0
+
+    def alive(self):
+        if self.state != "running":
+            return False
+        # A task service that had nothing to start (e.g. no worker tokens) stays "running"
+        return not self.is_task or not self.tasks or any(not t.done() for t in self.tasks)
+
+    def _task_done(self, task):
+        if task.cancelled() or self.state != "running":
+            return
+        error = task.exception()
+        if error is not None:
+            self.state, self.error = "failed", repr(error)
+            print(f"❌ {self.name} stopped with an error: {error!r}")
+        elif all(t.done() for t in self.tasks):
+            self.state = "done"
+
+    async def start(self):
+        if self.alive():
+            return False
+        self.error = None
+        try:
+            result = self._start()
+            if asyncio.iscoroutine(result) and not self.is_task:
+                result = await result
+        except Exception as e:
+            self.state, self.error = "failed", repr(e)
+            print(f"❌ Failed to start {self.name}: {e}")
+            return False
+
+        if self.is_task:
+            # A coroutine, a task, or a list of tasks
+            items = result if isinstance(result, (list, tuple)) else [result]
+            self.tasks = [t if isinstance(t, asyncio.Future) else asyncio.create_task(t, name=self.name)
+                          for t in items]
+            for t in self.tasks:
+                t.add_done_callback(self._task_done)
+        else:
+            self.handle = result
+        self.state = "running"
+        self.started_at = time.time()
+        self.starts += 1
+        return True
+
+    async def stop(self, timeout=10):
+        if self.state in ("idle", "stopped"):
+            return
+        self.state = "stopped"
+        try:
+            # Graceful stop first (e.g. log clients out), then cancel what is left
+            if self._stop is not None:
+                await asyncio.wait_for(self._stop(self.handle), timeout=timeout)
+            if self.is_task:
+                for t in self.tasks:
+                    t.cancel()
+                if self.tasks:
+                    await asyncio.wait(self.tasks, timeout=timeout)
+        except Exception as e:
+            print(f"⚠️ Error stopping {self.name}: {e}")
+
+    def status(self):
+        return {
+            "state": self.state,
+            "alive": self.alive(),
+            "tasks": len(self.tasks),
+            "starts": self.starts,
+            "started_at": self.started_at,
+            "error": self.error,
+        }
+
+class Lifecycle:
+    """Registry of services; start_group() is idempotent, shutdown() runs once in reverse."""
+
+    def __init__(self):
+        self.services = {}
+        self._started = []      # start order, for shutdown
+        self._shutdown = None
+
+    def service(self, name, group, start, stop=None):
+        """Registers a resource: `start()` returns a handle, `stop(handle)` releases it."""
+        self.services[name] = Service(name, group, start, stop)
+
+    def task(self, name, group, factory, stop=None):
+        """Registers background work: `factory()` returns a coroutine, task or list of tasks."""
+        self.services[name] = Service(name, group, factory, stop, task=True)
+
+    async def start_group(self, group):
+        for service in self.services.values():
+            if service.group == group and await service.start():
+                if service not in self._started:
+                    self._started.append(service)
+                print(f"▶️ Started {service.name}")
+
+    def get(self, name):
+        return self.services[name]
+
+    async def shutdown(self):
+        """Stops services in reverse start order; concurrent callers share one shutdown."""
+        if self._shutdown is None:
+            self._shutdown = asyncio.ensure_future(self._stop_all())
+        await asyncio.shield(self._shutdown)
+
+    async def _stop_all(self):
+        for service in reversed(self._started):
+            print(f"⏹️ Stopping {service.name}")
+            await service.stop()
+
+    def status(self):
+        return {name: s.status() for name, s in self.services.items()}
@@ -0,0 +1,173 @@
+"""
+Prometheus-style metrics, served as text at /metrics.
+
+Recording is a dict lookup plus an integer add on the event loop thread; no
+locks, no background work. Counters that other components already keep
+(welcome queue, outbound queue, ...) are read at scrape time through
+callbacks instead of being counted twice. Values recorded from the audio
+player thread are handed to the event loop first (see playback.py).
+"""
+import asyncio
+import time
+from bisect import bisect_left
+
+# Seconds; covers sub-millisecond source starts up to multi-minute adhans
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, labels=(), amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self.values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+class Gauge:
+    """Set directly, or computed at scrape time by `fn` (a number or {labels: value})."""
+
+    def __init__(self, name, help, labelnames=(), fn=None, kind="gauge"):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+        self.kind = kind
+        self.values = {}
+
+    def set(self, value, labels=()):
+        self.values[labels] = value
+
+    def render(self):
+        values = self.values
+        if self.fn is not None:
+            try:
+                result = self.fn()
+            except Exception:
+                return
+            if result is None:
+                return
+            values = result if isinstance(result, dict) else {(): result}
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for labels, value in values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}    # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, labels=()):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, labels=()):
+        return _Timer(self, labels)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in self.series.items():
+            cumulative = 0
+            names = self.labelnames + ("le",)
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.monotonic() - self.start, self.labels)
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.add(Counter(name, help, labelnames))
+
+    def counter_fn(self, name, help, fn, labelnames=()):
+        """A counter someone else already keeps, read at scrape time."""
+        return self.add(Gauge(name, help, labelnames, fn=fn, kind="counter"))
+
+    def gauge(self, name, help, labelnames=(), fn=None):
+        return self.add(Gauge(name, help, labelnames, fn=fn))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.add(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# --- Voice ---
+VOICE_CONNECT = REGISTRY.histogram(
+    "bot_voice_connect_seconds", "Time to connect or move to a voice channel", ("how",))
+SOURCE_START = REGISTRY.histogram(
+    "bot_audio_source_start_seconds", "Time to open an audio source", ("kind",))
+FIRST_PACKET = REGISTRY.histogram(
+    "bot_audio_first_packet_seconds", "Time from vc.play() to the first audio frame read")
+PLAYBACK = REGISTRY.histogram(
+    "bot_playback_seconds", "Playback duration by outcome", ("outcome",))
+
+# --- Prayer / commands ---
+PRAYER_LAG = REGISTRY.histogram(
+    "bot_prayer_fire_lag_seconds", "Delay between the scheduled prayer instant and firing", ("location",))
+COMMAND_LATENCY = REGISTRY.histogram(
+    "bot_command_seconds", "Slash command handler latency (from interaction creation)", ("command",))
+
+# --- Counters ---
+ERRORS = REGISTRY.counter("bot_errors_total", "Errors by component and exception type", ("where", "type"))
+
+# --- Event loop ---
+LOOP_LAG = REGISTRY.gauge("bot_event_loop_lag_seconds", "Last measured event loop scheduling delay")
+
+def error(where, exc):
+    ERRORS.inc((where, type(exc).__name__ if isinstance(exc, BaseException) else str(exc)))
+
+async def sample_loop_lag(interval=1.0):
+    """Measures how late a 1 s sleep wakes up (lifecycle task)."""
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        LOOP_LAG.set(max(0.0, time.monotonic() - start - interval))
@@ -0,0 +1,176 @@
+"""
+Outbound message queue.
+
+Every channel.send goes through one background worker per channel (Discord
+rate-limits message sends per channel), so handlers return immediately and a
+burst at prayer time never stalls the event handlers. Within a channel,
+prayer notifications go before command output, which goes before greeting
+replies; an identical send that is still pending is merged into the first.
+
+429s are counted from discord.py's HTTP log (it sleeps and retries them
+itself) and from RateLimited errors when max_ratelimit_timeout is set.
+
+OUTBOUND_MAX_PENDING=50   queued sends per channel before greetings are dropped
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+
+import discord
+
+import metrics
+
+OUTBOUND_MAX_PENDING = int(os.getenv("OUTBOUND_MAX_PENDING", 50))
+
+PRIORITY_PRAYER = 0
+PRIORITY_COMMAND = 1
+PRIORITY_GREETING = 2
+PRIORITY_NAMES = {PRIORITY_PRAYER: "prayer", PRIORITY_COMMAND: "command", PRIORITY_GREETING: "greeting"}
+
+class _RateLimitCounter(logging.Filter):
+    """Counts discord.py's "We are being rate limited" warnings without hiding them."""
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING and str(record.msg).startswith("We are being rate limited"):
+            self.count += 1
+        return True
+
+class _Send:
+    __slots__ = ("priority", "channel", "kwargs", "key", "future", "enqueued_at")
+
+    def __init__(self, priority, channel, kwargs, key, future):
+        self.priority = priority
+        self.channel = channel
+        self.kwargs = kwargs
+        self.key = key
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+def _consume(future):
+    # Fire-and-forget sends must not log "exception was never retrieved"
+    if not future.cancelled():
+        future.exception()
+
+class OutboundQueue:
+    """Per-channel send queues with priorities, coalescing and latency stats."""
+
+    def __init__(self, max_pending=OUTBOUND_MAX_PENDING):
+        self.max_pending = max_pending
+        self._heaps = {}        # channel_id -> [(priority, seq, _Send)]
+        self._keys = {}         # channel_id -> {dedupe key: _Send}
+        self._workers = {}      # channel_id -> asyncio.Task
+        self._seq = itertools.count()
+        self._http_429 = _RateLimitCounter()
+        logging.getLogger("discord.http").addFilter(self._http_429)
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self._latency = {p: [0, 0.0, 0.0] for p in PRIORITY_NAMES}   # count, total, max
+
+    def submit(self, channel, content=None, *, priority=PRIORITY_GREETING, dedupe_key=None, **kwargs):
+        """
+        Queues channel.send(content, **kwargs) and returns a future for the
+        sent message. Sends without attachments are merged with an identical
+        pending one; `dedupe_key` overrides what counts as identical.
+        """
+        kwargs["content"] = content
+        key = dedupe_key
+        if key is None and "file" not in kwargs and "files" not in kwargs:
+            key = (content, priority)
+
+        keys = self._keys.setdefault(channel.id, {})
+        pending = keys.get(key) if key is not None else None
+        if pending is not None:
+            self.coalesced += 1
+            return pending.future
+
+        heap = self._heaps.setdefault(channel.id, [])
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume)
+        if len(heap) >= self.max_pending and priority >= PRIORITY_GREETING:
+            self.dropped += 1
+            future.set_result(None)
+            return future
+
+        item = _Send(priority, channel, kwargs, key, future)
+        heapq.heappush(heap, (priority, next(self._seq), item))
+        if key is not None:
+            keys[key] = item
+
+        worker = self._workers.get(channel.id)
+        if worker is None or worker.done():
+            self._workers[channel.id] = asyncio.create_task(self._run(channel.id))
+        return future
+
+    async def _run(self, channel_id):
+        heap = self._heaps[channel_id]
+        keys = self._keys[channel_id]
+        while heap:
+            _, seq, item = heapq.heappop(heap)
+            try:
+                message = await item.channel.send(**item.kwargs)
+            except discord.RateLimited as e:
+                # Only raised when max_ratelimit_timeout is set; wait it out and retry
+                self.rate_limited += 1
+                if "file" in item.kwargs or "files" in item.kwargs:
+                    self._fail(keys, item, e)
+                    continue
+                await asyncio.sleep(e.retry_after)
+                heapq.heappush(heap, (item.priority, seq, item))
+                continue
+            except Exception as e:
+                if isinstance(e, discord.HTTPException) and e.status == 429:
+                    self.rate_limited += 1
+                self._fail(keys, item, e)
+                continue
+
+            if item.key is not None:
+                keys.pop(item.key, None)
+            self.sent += 1
+            latency = time.monotonic() - item.enqueued_at
+            entry = self._latency[item.priority]
+            entry[0] += 1
+            entry[1] += latency
+            entry[2] = max(entry[2], latency)
+            if not item.future.done():
+                item.future.set_result(message)
+        self._heaps.pop(channel_id, None)
+        self._keys.pop(channel_id, None)
+        self._workers.pop(channel_id, None)
+
+    def _fail(self, keys, item, error):
+        if item.key is not None:
+            keys.pop(item.key, None)
+        self.failed += 1
+        metrics.error("outbound", error)
+        print(f"Send to #{getattr(item.channel, 'name', item.channel.id)} failed: {error}")
+        if not item.future.done():
+            item.future.set_exception(error)
+
+    def depth(self):
+        return sum(len(h) for h in self._heaps.values())
+
+    def stats(self):
+        latency = {
+            PRIORITY_NAMES[p]: {"count": c, "avg": total / c if c else 0.0, "max": peak}
+            for p, (c, total, peak) in self._latency.items()
+        }
+        return {
+            "depth": self.depth(),
+            "busy_channels": len(self._workers),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited + self._http_429.count,
+            "latency": latency,
+        }
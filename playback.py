@@ -0,0 +1,106 @@
+"""
+Awaitable voice playback: resolves from discord.py's `after=` callback instead
+of polling `vc.is_playing()`, with a timeout taken from the clip's real length.
+"""
+import asyncio
+import time
+
+import discord
+
+import metrics
+from voice_journal import journal
+
+# Extra time allowed on top of the clip length (network jitter, slow start)
+TIMEOUT_SLACK = 5.0
+# Used when the clip length is unknown (runtime FFmpeg decoding)
+DEFAULT_TIMEOUT = 300.0
+
+class PlaybackError(Exception):
+    """Playback failed inside the audio player thread."""
+
+class PlaybackTimeout(PlaybackError):
+    """Playback did not finish within the expected time and was stopped."""
+
+def clip_duration(source):
+    """Length in seconds for mapped Opus sources, None when unknown."""
+    store = getattr(source, "store", None)
+    return store.duration if store is not None else None
+
+def playback_timeout(source, default=DEFAULT_TIMEOUT):
+    duration = clip_duration(source)
+    if duration is None:
+        return default
+    return duration * 1.1 + TIMEOUT_SLACK
+
+class _FirstFrame(discord.AudioSource):
+    """Pass-through source that notes when the player thread gets the first frame."""
+
+    def __init__(self, source):
+        self.source = source
+        self.first_read = None
+
+    def read(self):
+        data = self.source.read()
+        if self.first_read is None and data:
+            self.first_read = time.monotonic()
+        return data
+
+    def is_opus(self):
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.source.cleanup()
+
+async def play_and_wait(vc, source, timeout=None, on_first_frame=None):
+    """
+    Plays `source` on `vc` and returns when it finishes.
+    Raises PlaybackError if the player reports an error, PlaybackTimeout
+    (after stopping playback) if it runs past the timeout.
+    `on_first_frame(monotonic)` gets the time the player read the first frame.
+    """
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+
+    def _finish(error):
+        if not done.done():
+            done.set_result(error)
+
+    def after(error):
+        # Runs on the audio player thread
+        loop.call_soon_threadsafe(_finish, error)
+
+    if timeout is None:
+        timeout = playback_timeout(source)
+
+    if vc.is_playing():
+        vc.stop()
+    # Timestamps only; the histograms are updated here on the event loop
+    tracked = _FirstFrame(source)
+    guild_id, channel_id = vc.guild.id, vc.channel.id
+    started = time.monotonic()
+    vc.play(tracked, after=after)
+    journal.record(guild_id, "play_start", channel_id)
+    outcome = "ok"
+    try:
+        error = await asyncio.wait_for(done, timeout=timeout)
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        vc.stop()
+        raise
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        vc.stop()
+        raise PlaybackTimeout(f"playback exceeded {timeout:.0f}s") from None
+    finally:
+        if tracked.first_read is not None:
+            metrics.FIRST_PACKET.observe(tracked.first_read - started)
+            if on_first_frame is not None:
+                on_first_frame(tracked.first_read)
+        if outcome == "ok" and error:
+            outcome = "error"
+        elapsed = time.monotonic() - started
+        metrics.PLAYBACK.observe(elapsed, (outcome,))
+        kind = outcome if outcome in ("timeout", "error") else "play_stop"
+        journal.record(guild_id, kind, channel_id, elapsed, str(error) if outcome == "error" else outcome)
+    if error:
+        raise PlaybackError(str(error)) from error
@@ -0,0 +1,182 @@
+"""
+Monthly prayer calendar: fetches aladhan `calendarByCity` once per month,
+keeps it in memory and on disk, and serves lookups without any I/O.
+
+Locations with their own coordinates (not those of a known city) are fetched
+by coordinates (`calendar`). A month whose timezone (meta.timezone) is not the
+configured one is refused: its times would be read in the wrong zone.
+"""
+import asyncio
+import datetime
+import json
+import os
+
+import aiohttp
+import pytz
+
+import prayer_times
+from storage import CONFIG_DIR, atomic_write_json
+
+API_URL = "http://api.aladhan.com/v1/calendarByCity"
+API_COORDINATES_URL = "http://api.aladhan.com/v1/calendar"
+
+# Start fetching next month this many days before it begins
+PREFETCH_DAYS = 5
+# Retry delay after a failed fetch (doubles up to the max)
+RETRY_DELAY = 60
+RETRY_DELAY_MAX = 3600
+
+def _month_key(year, month):
+    return f"{year:04d}-{month:02d}"
+
+def _next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+class PrayerCalendar:
+    """Month-by-month timings for one location, with stale-while-revalidate."""
+
+    def __init__(self, city, country, method=4, school=0, latitude=None, longitude=None,
+                 tz_name="Asia/Riyadh", cache_dir=CONFIG_DIR, high_lat="AngleBased"):
+        self.city = city
+        self.country = country
+        self.method = method
+        self.school = school
+        self.high_lat = high_lat
+        self.tz_name = tz_name
+        self.latitude = latitude
+        self.longitude = longitude
+        known = prayer_times.resolve_city(city, country)
+        if (latitude is None or longitude is None) and known:
+            self.latitude, self.longitude, _ = known
+        # Own coordinates: fetch by coordinates and keep a separate cache file
+        self.by_coordinates = self.latitude is not None and (not known or (self.latitude, self.longitude) != known[:2])
+
+        safe_city = "".join(c for c in city.lower() if c.isalnum()) or "city"
+        place = f"{safe_city}_{country.lower()}"
+        if self.by_coordinates:
+            place += f"_{self.latitude:.4f}_{self.longitude:.4f}"
+        if high_lat != "AngleBased":
+            place += f"_{high_lat.lower()}"
+        self.cache_path = os.path.join(cache_dir, f"prayer_calendar_{place}_{method}_{school}.json")
+        self.days = {}          # "YYYY-MM-DD" -> {"Fajr": "HH:MM", ...}
+        self.months = set()     # "YYYY-MM" fetched from the API
+        self.last_refresh = None
+        self.last_error = None
+        self._refresh_lock = asyncio.Lock()
+        self.load()
+
+    # --- Disk cache ---
+    def load(self):
+        """Loads the last good calendar from disk (no network)."""
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.days = data.get("days", {})
+            self.months = set(data.get("months", []))
+            print(f"📅 Loaded prayer calendar from disk: {len(self.days)} days ({self.city})")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ Prayer calendar cache unreadable, ignoring: {e}")
+
+    def save(self):
+        atomic_write_json(self.cache_path, {
+            "city": self.city,
+            "country": self.country,
+            "method": self.method,
+            "school": self.school,
+            "months": sorted(self.months),
+            "days": self.days,
+        })
+
+    # --- Hot path (memory only) ---
+    def timings(self, date):
+        """Returns timings for a date from memory, falling back to the local calculator."""
+        day = self.days.get(date.isoformat())
+        if day is not None:
+            return day
+        # The offline engine implements Umm al-Qura (method 4) only
+        if self.latitude is not None and self.method == 4:
+            return prayer_times.get_timings(date, self.latitude, self.longitude, self.tz_name, self.school,
+                                            self.high_lat)
+        return None
+
+    # --- Fetching ---
+    async def fetch_month(self, session, year, month):
+        params = {
+            "method": self.method,
+            "school": self.school,
+            "month": month,
+            "year": year,
+        }
+        if self.high_lat != "None":
+            params["latitudeAdjustmentMethod"] = prayer_times.HIGH_LAT_RULES.index(self.high_lat)
+        if self.by_coordinates:
+            url = API_COORDINATES_URL
+            params.update(latitude=self.latitude, longitude=self.longitude)
+        else:
+            url = API_URL
+            params.update(city=self.city, country=self.country)
+        async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=30)) as resp:
+            if resp.status != 200:
+                raise RuntimeError(f"aladhan returned HTTP {resp.status}")
+            payload = await resp.json()
+
+        zone = payload["data"][0]["meta"]["timezone"] if payload["data"] else self.tz_name
+        if zone != self.tz_name:
+            raise RuntimeError(f"aladhan times for {self.city} are in {zone}, configured timezone is {self.tz_name}")
+        days = {}
+        for row in payload["data"]:
+            d, m, y = (int(x) for x in row["date"]["gregorian"]["date"].split("-"))
+            timings = {k: v.split(" ")[0] for k, v in row["timings"].items()}
+            days[datetime.date(y, m, d).isoformat()] = timings
+        return days
+
+    async def refresh(self, months):
+        """Fetches the given (year, month) pairs; keeps serving old data on failure."""
+        async with self._refresh_lock:
+            missing = [(y, m) for y, m in months if _month_key(y, m) not in self.months]
+            if not missing:
+                return True
+            try:
+                async with aiohttp.ClientSession() as session:
+                    for year, month in missing:
+                        days = await self.fetch_month(session, year, month)
+                        self.days.update(days)
+                        self.months.add(_month_key(year, month))
+                        print(f"📅 Prayer calendar fetched for {self.city} {_month_key(year, month)}")
+                self._prune()
+                await asyncio.to_thread(self.save)
+                self.last_refresh = datetime.datetime.now(datetime.timezone.utc)
+                self.last_error = None
+                return True
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"⚠️ Prayer calendar refresh failed ({self.city}), serving cached data: {e}")
+                return False
+
+    def _prune(self):
+        """Drops days older than last month to keep the cache small."""
+        today = datetime.date.today()
+        cutoff = (today.replace(day=1) - datetime.timedelta(days=1)).replace(day=1).isoformat()
+        self.days = {k: v for k, v in self.days.items() if k >= cutoff}
+        self.months = {m for m in self.months if m >= cutoff[:7]}
+
+    def wanted_months(self, today):
+        months = [(today.year, today.month)]
+        next_first = datetime.date(*_next_month(today.year, today.month), 1)
+        if (next_first - today).days <= PREFETCH_DAYS:
+            months.append((next_first.year, next_first.month))
+        return months
+
+    async def run_refresher(self):
+        """Background loop: keeps this and (near month end) next month cached."""
+        delay = RETRY_DELAY
+        while True:
+            today = datetime.datetime.now(pytz.timezone(self.tz_name)).date()
+            if await self.refresh(self.wanted_months(today)):
+                delay = RETRY_DELAY
+                await asyncio.sleep(6 * 3600)
+            else:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RETRY_DELAY_MAX)
@@ -0,0 +1,192 @@
+"""
+Per-guild prayer locations loaded from prayer_config.json.
+
+Guilds are grouped by location key (city, country, method, school, timezone,
+coordinates, high_lat); each distinct location gets one calendar and one
+scheduler, so the cost scales with the number of locations rather than the
+number of guilds.
+
+Cities outside prayer_times.KNOWN_CITIES need a "timezone": aladhan returns
+local times and the scheduler must read them in the same zone. An entry
+without one is rejected (the guild keeps the default location).
+
+prayer_config.json:
+    {
+        "city": "Riyadh", "country": "SA",          # Default for every guild
+        "method": 4, "school": 0, "timezone": "Asia/Riyadh",
+        "high_lat": "AngleBased",                    # Fajr rule where the sun stays high:
+                                                     # None, MiddleOfTheNight, OneSeventh, AngleBased
+        "guilds": {
+            "123456789012345678": {"city": "Jeddah"},
+            "234567890123456789": {"city": "Cairo", "country": "EG", "method": 5,
+                                   "timezone": "Africa/Cairo", "label": "القاهرة",
+                                   "announcement": "حان وقت صلاة {prayer} في {city}"}
+        }
+    }
+
+"announcement" (top level or per guild) replaces the prayer clip with a TTS
+announcement in that wording; {prayer} and {city} are filled in.
+"""
+import asyncio
+import hashlib
+import json
+import os
+
+import prayer_times
+from prayer_calendar import PrayerCalendar
+from prayer_scheduler import PrayerScheduler
+from storage import CONFIG_DIR
+
+CONFIG_PATH = os.path.join(CONFIG_DIR, "prayer_config.json")
+
+DEFAULT_LOCATION = {
+    "city": "Riyadh",
+    "country": "SA",
+    "method": 4,
+    "school": 0,
+    "timezone": None,
+    "latitude": None,
+    "longitude": None,
+    "label": None,
+    "high_lat": "AngleBased",
+}
+
+# Arabic names used in notifications ("حسب توقيت ...")
+CITY_LABELS = {
+    "riyadh": "الرياض",
+    "makkah": "مكة المكرمة",
+    "mecca": "مكة المكرمة",
+    "madinah": "المدينة المنورة",
+    "medina": "المدينة المنورة",
+    "jeddah": "جدة",
+    "dammam": "الدمام",
+    "khobar": "الخبر",
+    "taif": "الطائف",
+    "tabuk": "تبوك",
+    "abha": "أبها",
+    "buraidah": "بريدة",
+    "hail": "حائل",
+}
+
+LOCATION_FIELDS = tuple(DEFAULT_LOCATION)
+
+def load_prayer_config(path=CONFIG_PATH):
+    """Reads prayer_config.json; a missing or broken file means Riyadh for everyone."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"⚠️ Could not read {path}, using defaults: {e}")
+        return {}
+
+def normalize_location(raw, base=DEFAULT_LOCATION):
+    """Merges `raw` over `base` and fills in timezone/coordinates/label."""
+    loc = dict(base)
+    loc.update({k: v for k, v in raw.items() if k in LOCATION_FIELDS})
+    # Coordinates from the base location do not apply to a different city
+    if "city" in raw and "latitude" not in raw:
+        loc["latitude"] = loc["longitude"] = None
+        if "timezone" not in raw:
+            loc["timezone"] = None
+        if "label" not in raw:
+            loc["label"] = None
+
+    known = prayer_times.resolve_city(loc["city"], loc["country"])
+    if known:
+        if loc["latitude"] is None:
+            loc["latitude"], loc["longitude"] = known[0], known[1]
+        if not loc["timezone"]:
+            loc["timezone"] = known[2]
+    if not loc["timezone"]:
+        raise ValueError(f"no timezone for {loc['city']}, {loc['country']}: "
+                         f"add \"timezone\" (e.g. \"Europe/London\") to prayer_config.json")
+    if loc["high_lat"] not in prayer_times.HIGH_LAT_RULES:
+        raise ValueError(f"unknown high_lat {loc['high_lat']!r}: use one of {', '.join(prayer_times.HIGH_LAT_RULES)}")
+    if not loc["label"]:
+        loc["label"] = CITY_LABELS.get(str(loc["city"]).lower(), loc["city"])
+    return loc
+
+def fired_path(key, directory=CONFIG_DIR):
+    """File recording the prayers already fired at one location."""
+    digest = hashlib.sha1(json.dumps(list(key)).encode("utf-8")).hexdigest()[:10]
+    return os.path.join(directory, f"prayer_fired_{digest}.json")
+
+def location_key(loc):
+    return (str(loc["city"]).lower(), str(loc["country"]).lower(), loc["method"], loc["school"], loc["timezone"],
+            loc["latitude"], loc["longitude"], loc["high_lat"])
+
+class PrayerLocations:
+    """Maps guilds to locations and owns one calendar + scheduler per distinct location."""
+
+    def __init__(self, config, fire, state_dir=CONFIG_DIR):
+        """`fire(location, prayer, scheduled)` is awaited once per location per prayer."""
+        try:
+            self.default = normalize_location(config)
+        except ValueError as e:
+            print(f"⚠️ Default prayer location rejected, using Riyadh: {e}")
+            self.default = normalize_location({})
+        self.locations = {location_key(self.default): self.default}
+        self.guild_keys = {}
+        self.default_announcement = config.get("announcement")
+        self.announcements = {}
+        for guild_id, override in (config.get("guilds") or {}).items():
+            try:
+                loc = normalize_location(override, self.default)
+            except ValueError as e:
+                print(f"⚠️ Prayer location for guild {guild_id} rejected, using the default: {e}")
+                continue
+            key = location_key(loc)
+            self.locations.setdefault(key, loc)
+            self.guild_keys[int(guild_id)] = key
+            if override.get("announcement"):
+                self.announcements[int(guild_id)] = override["announcement"]
+
+        self.default_key = location_key(self.default)
+        self.calendars = {}
+        self.schedulers = {}
+        for key, loc in self.locations.items():
+            calendar = PrayerCalendar(
+                loc["city"], loc["country"], method=loc["method"], school=loc["school"],
+                latitude=loc["latitude"], longitude=loc["longitude"], tz_name=loc["timezone"],
+                high_lat=loc["high_lat"], cache_dir=state_dir,
+            )
+            self.calendars[key] = calendar
+            self.schedulers[key] = PrayerScheduler(
+                calendar, self._fire_for(loc, fire), name=f"{loc['city']}/{loc['timezone']}",
+                state_path=fired_path(key, state_dir),
+            )
+        print(f"🕌 Prayer locations: {len(self.locations)} distinct for {len(self.guild_keys)} configured guilds")
+
+    @staticmethod
+    def _fire_for(loc, fire):
+        async def _fire(prayer, scheduled):
+            await fire(loc, prayer, scheduled)
+        return _fire
+
+    def key_for_guild(self, guild_id):
+        return self.guild_keys.get(guild_id, self.default_key)
+
+    def location_for_guild(self, guild_id):
+        return self.locations[self.key_for_guild(guild_id)]
+
+    def calendar_for_guild(self, guild_id):
+        return self.calendars[self.key_for_guild(guild_id)]
+
+    def announcement_for(self, guild_id):
+        """Custom TTS wording for a guild's prayer announcement, or None."""
+        return self.announcements.get(guild_id, self.default_announcement)
+
+    def guilds_at(self, loc, guilds):
+        """Filters `guilds` down to those that use location `loc`."""
+        key = location_key(loc)
+        return [g for g in guilds if self.key_for_guild(g.id) == key]
+
+    def start(self):
+        """Starts one refresher and one scheduler per location; returns the task handles."""
+        tasks = []
+        for key in self.locations:
+            tasks.append(asyncio.create_task(self.calendars[key].run_refresher()))
+            tasks.append(asyncio.create_task(self.schedulers[key].run()))
+        return tasks
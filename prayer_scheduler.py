@@ -0,0 +1,153 @@
+"""
+Deadline-driven prayer scheduler.
+
+Computes the next prayer instant in the location's timezone, sleeps until
+exactly then and fires once. Sleeps are measured on the monotonic clock and
+re-checked against the wall clock, so NTP jumps or a suspended container
+cannot make it drift; events missed by less than `catch_up` seconds still fire.
+
+Fired prayers are written to `state_path` before they play, so a restart
+inside the catch-up window does not play the same adhan a second time.
+"""
+import asyncio
+import datetime
+import json
+import time
+
+import pytz
+
+import prayer_times
+from storage import atomic_write_json
+
+# Longest single sleep; the wall clock is re-checked after each one
+MAX_SLEEP = 900
+# How late an event may be and still fire (e.g. after a reconnect or restart)
+CATCH_UP_SECONDS = 120
+
+def local_instant(tz, date, hhmm):
+    """Converts a local date + "HH:MM" to an aware UTC datetime (DST safe)."""
+    h, m = (int(x) for x in hhmm.split(":"))
+    naive = datetime.datetime(date.year, date.month, date.day, h, m)
+    try:
+        local = tz.localize(naive, is_dst=None)
+    except pytz.exceptions.AmbiguousTimeError:
+        local = tz.localize(naive, is_dst=True)    # Repeated hour: first occurrence
+    except pytz.exceptions.NonExistentTimeError:
+        local = tz.normalize(tz.localize(naive, is_dst=False))  # Skipped hour: shift forward
+    return local.astimezone(pytz.utc)
+
+def upcoming_events(calendar, now_utc, days=2):
+    """Returns sorted [(instant_utc, prayer, local_date)] for today and the next days."""
+    tz = pytz.timezone(calendar.tz_name)
+    today = now_utc.astimezone(tz).date()
+    events = []
+    for offset in range(-1, days):
+        date = today + datetime.timedelta(days=offset)
+        timings = calendar.timings(date)
+        if not timings:
+            continue
+        for prayer in prayer_times.PRAYERS:
+            value = timings.get(prayer)
+            if not value or ":" not in value:
+                continue  # e.g. "-----" when the sun never reaches the angle
+            events.append((local_instant(tz, date, value), prayer, date))
+    events.sort()
+    return events
+
+class PrayerScheduler:
+    """Sleeps until each prayer of one calendar and calls `fire(prayer, scheduled_utc)` once."""
+
+    def __init__(self, calendar, fire, catch_up=CATCH_UP_SECONDS, name=None, state_path=None):
+        self.calendar = calendar
+        self.fire = fire
+        self.catch_up = catch_up
+        self.name = name or calendar.city
+        self.state_path = state_path
+        self.fired = set()      # (local_date, prayer)
+        self.next_event = None
+        self.last_lag = None
+        self._running = set()   # Strong refs to in-flight fire tasks
+        self.load()
+
+    # --- Fired prayers on disk ---
+    def load(self):
+        """Reads the prayers already fired (by this process or an earlier one)."""
+        if not self.state_path:
+            return
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.fired |= {(datetime.date.fromisoformat(d), p) for d, p in data.get("fired", [])}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ [{self.name}] Fired prayers file unreadable, ignoring: {e}")
+
+    def save(self):
+        if self.state_path:
+            atomic_write_json(self.state_path, {"fired": sorted([d.isoformat(), p] for d, p in self.fired)})
+
+    def _next(self, now_utc):
+        for instant, prayer, date in upcoming_events(self.calendar, now_utc):
+            if (date, prayer) in self.fired:
+                continue
+            if (now_utc - instant).total_seconds() > self.catch_up:
+                continue  # Too late to catch up
+            return instant, prayer, date
+        return None
+
+    async def _sleep_until(self, instant):
+        """Sleeps until `instant` (UTC), re-checking the wall clock between chunks."""
+        while True:
+            remaining = (instant - datetime.datetime.now(pytz.utc)).total_seconds()
+            if remaining <= 0:
+                return
+            chunk = min(remaining, MAX_SLEEP)
+            start = time.monotonic()
+            await asyncio.sleep(chunk)
+            overslept = time.monotonic() - start - chunk
+            if overslept > 5:
+                print(f"⚠️ [{self.name}] Event loop overslept by {overslept:.1f}s")
+
+    def _forget_old(self, today):
+        cutoff = today - datetime.timedelta(days=2)
+        self.fired = {k for k in self.fired if k[0] >= cutoff}
+
+    async def run(self):
+        # A new scheduler leader picks up what the previous one fired
+        self.load()
+        while True:
+            now = datetime.datetime.now(pytz.utc)
+            upcoming = self._next(now)
+            if not upcoming:
+                # Nothing known yet (empty calendar); look again later
+                self.next_event = None
+                await asyncio.sleep(MAX_SLEEP)
+                continue
+
+            instant, prayer, date = upcoming
+            self.next_event = (prayer, instant)
+            await self._sleep_until(instant)
+
+            # Timetable may have been refreshed while sleeping; re-validate
+            if self._next(datetime.datetime.now(pytz.utc)) != upcoming:
+                continue
+
+            self.fired.add((date, prayer))
+            self._forget_old(date)
+            try:
+                self.save()
+            except OSError as e:
+                print(f"⚠️ [{self.name}] Could not save fired prayers: {e}")
+            lag = (datetime.datetime.now(pytz.utc) - instant).total_seconds()
+            self.last_lag = lag
+            print(f"🕌 [{self.name}] {prayer} fired (lag {lag:+.2f}s)")
+            task = asyncio.create_task(self._fire(prayer, instant))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _fire(self, prayer, instant):
+        try:
+            await self.fire(prayer, instant)
+        except Exception as e:
+            print(f"Prayer fire error ({self.name} {prayer}): {e}")
@@ -0,0 +1,281 @@
+"""
+Offline prayer-time calculator (Umm al-Qura / aladhan method 4).
+
+Same astronomical model as api.aladhan.com (PrayTimes): sun declination and
+equation of time from the date, Fajr at 18.5 degrees, Maghrib at sunset and
+Isha a fixed 90 minutes after Maghrib (120 in Ramadan, by the Umm al-Qura
+calendar).
+"""
+import datetime
+import math
+from functools import lru_cache
+
+import pytz
+
+try:
+    from hijridate import Gregorian
+except ImportError:
+    Gregorian = None    # Tabular calendar only (can be a day off around Ramadan)
+
+PRAYERS = ["Fajr", "Dhuhr", "Asr", "Maghrib", "Isha"]
+
+# Umm al-Qura parameters (aladhan method=4)
+FAJR_ANGLE = 18.5
+ISHA_MINUTES = 90
+ISHA_MINUTES_RAMADAN = 120
+
+# Asr juristic method (aladhan "school"): 0 = Standard (Shafi'i/Maliki/Hanbali), 1 = Hanafi
+ASR_FACTORS = {0: 1, 1: 2}
+
+# High latitude rules (aladhan "latitudeAdjustmentMethod" 1..3; 0 = none)
+HIGH_LAT_RULES = ("None", "MiddleOfTheNight", "OneSeventh", "AngleBased")
+
+RECORD_URL = "http://api.aladhan.com/v1/calendarByCity/{year}/{month}"
+
+# Cities we can resolve without a geocoder: (latitude, longitude, timezone)
+KNOWN_CITIES = {
+    ("riyadh", "sa"): (24.7136, 46.6753, "Asia/Riyadh"),
+    ("makkah", "sa"): (21.3891, 39.8579, "Asia/Riyadh"),
+    ("mecca", "sa"): (21.3891, 39.8579, "Asia/Riyadh"),
+    ("madinah", "sa"): (24.5247, 39.5692, "Asia/Riyadh"),
+    ("medina", "sa"): (24.5247, 39.5692, "Asia/Riyadh"),
+    ("jeddah", "sa"): (21.4858, 39.1925, "Asia/Riyadh"),
+    ("dammam", "sa"): (26.4207, 50.0888, "Asia/Riyadh"),
+    ("khobar", "sa"): (26.2172, 50.1971, "Asia/Riyadh"),
+    ("taif", "sa"): (21.2703, 40.4158, "Asia/Riyadh"),
+    ("tabuk", "sa"): (28.3835, 36.5662, "Asia/Riyadh"),
+    ("abha", "sa"): (18.2164, 42.5053, "Asia/Riyadh"),
+    ("buraidah", "sa"): (26.3592, 43.9818, "Asia/Riyadh"),
+    ("hail", "sa"): (27.5114, 41.7208, "Asia/Riyadh"),
+}
+
+def resolve_city(city, country):
+    """Returns (latitude, longitude, timezone) for a known city, or None."""
+    return KNOWN_CITIES.get((str(city).strip().lower(), str(country).strip().lower()))
+
+# --- Degree based trigonometry ---
+def _dsin(d): return math.sin(math.radians(d))
+def _dcos(d): return math.cos(math.radians(d))
+def _dtan(d): return math.tan(math.radians(d))
+def _darcsin(x): return math.degrees(math.asin(x))
+def _darccos(x): return math.degrees(math.acos(x))
+def _darctan2(y, x): return math.degrees(math.atan2(y, x))
+def _darccot(x): return math.degrees(math.atan(1.0 / x))
+
+def _fix(a, b):
+    if math.isnan(a):
+        return a
+    a = a - b * math.floor(a / b)
+    return a + b if a < 0 else a
+
+def _julian(year, month, day):
+    if month <= 2:
+        year -= 1
+        month += 12
+    a = math.floor(year / 100)
+    b = 2 - a + math.floor(a / 4)
+    return math.floor(365.25 * (year + 4716)) + math.floor(30.6001 * (month + 1)) + day + b - 1524.5
+
+def sun_position(jd):
+    """Returns (declination, equation_of_time) for a julian date."""
+    d = jd - 2451545.0
+    g = _fix(357.529 + 0.98560028 * d, 360)
+    q = _fix(280.459 + 0.98564736 * d, 360)
+    lon = _fix(q + 1.915 * _dsin(g) + 0.020 * _dsin(2 * g), 360)
+    e = 23.439 - 0.00000036 * d
+    ra = _darctan2(_dcos(e) * _dsin(lon), _dcos(lon)) / 15
+    eqt = q / 15 - _fix(ra, 24)
+    decl = _darcsin(_dsin(e) * _dsin(lon))
+    return decl, eqt
+
+# --- Hijri month (used only for the Ramadan Isha rule) ---
+def hijri_month(date):
+    """Returns the Umm al-Qura Hijri month number for a Gregorian date."""
+    if Gregorian is not None:
+        try:
+            return Gregorian(date.year, date.month, date.day).to_hijri().month
+        except OverflowError:
+            pass    # Outside the Umm al-Qura tables (1343-1500 AH)
+    return _tabular_hijri_month(date)
+
+def _tabular_hijri_month(date):
+    """Arithmetic (tabular) Hijri month: within a day or two of Umm al-Qura."""
+    jd = math.floor(_julian(date.year, date.month, date.day) + 0.5)
+    l = jd - 1948440 + 10632
+    n = (l - 1) // 10631
+    l = l - 10631 * n + 354
+    j = ((10985 - l) // 5316) * ((50 * l) // 17719) + (l // 5670) * ((43 * l) // 15238)
+    l = l - ((30 - j) // 15) * ((17719 * j) // 50) - (j // 16) * ((15238 * j) // 43) + 29
+    return (24 * l) // 709
+
+class _Day:
+    """Sun geometry for one date/location, expressed in local solar hours."""
+
+    def __init__(self, date, latitude, longitude):
+        self.lat = latitude
+        self.jdate = _julian(date.year, date.month, date.day) - longitude / (15 * 24)
+
+    def mid_day(self, t):
+        _, eqt = sun_position(self.jdate + t)
+        return _fix(12 - eqt, 24)
+
+    def sun_angle_time(self, angle, t, ccw=False):
+        decl, _ = sun_position(self.jdate + t)
+        noon = self.mid_day(t)
+        cos_t = (-_dsin(angle) - _dsin(decl) * _dsin(self.lat)) / (_dcos(decl) * _dcos(self.lat))
+        if cos_t < -1 or cos_t > 1:
+            return float("nan")  # Sun never reaches this angle (high latitudes)
+        t = _darccos(cos_t) / 15
+        return noon + (-t if ccw else t)
+
+    def asr_time(self, factor, t):
+        decl, _ = sun_position(self.jdate + t)
+        angle = -_darccot(factor + _dtan(abs(self.lat - decl)))
+        return self.sun_angle_time(angle, t)
+
+def _adjust_high_lat(time, base, angle, night, rule, ccw=False):
+    if rule == "AngleBased":
+        portion = angle / 60.0
+    elif rule == "OneSeventh":
+        portion = 1.0 / 7.0
+    else:
+        portion = 0.5
+    portion *= night
+    if math.isnan(time):
+        return base + (-portion if ccw else portion)
+    diff = _fix(base - time, 24) if ccw else _fix(time - base, 24)
+    if diff > portion:
+        return base + (-portion if ccw else portion)
+    return time
+
+def compute_day(date, latitude, longitude, utc_offset, asr_school=0,
+                high_lat="AngleBased", elevation=0, isha_minutes=None):
+    """Computes prayer times as fractional local hours for one date."""
+    day = _Day(date, latitude, longitude)
+    rise_angle = 0.833 + 0.0347 * math.sqrt(max(elevation, 0))
+    factor = ASR_FACTORS.get(asr_school, 1)
+
+    # One refinement pass starting from rough guesses (same as aladhan)
+    p = {k: v / 24.0 for k, v in {"Fajr": 5, "Sunrise": 6, "Dhuhr": 12, "Asr": 13, "Sunset": 18}.items()}
+    times = {
+        "Fajr": day.sun_angle_time(FAJR_ANGLE, p["Fajr"], ccw=True),
+        "Sunrise": day.sun_angle_time(rise_angle, p["Sunrise"], ccw=True),
+        "Dhuhr": day.mid_day(p["Dhuhr"]),
+        "Asr": day.asr_time(factor, p["Asr"]),
+        "Sunset": day.sun_angle_time(rise_angle, p["Sunset"]),
+    }
+    shift = utc_offset - longitude / 15.0
+    for k in times:
+        times[k] += shift
+
+    if high_lat != "None":
+        night = _fix(times["Sunrise"] - times["Sunset"], 24)
+        times["Fajr"] = _adjust_high_lat(times["Fajr"], times["Sunrise"], FAJR_ANGLE, night, high_lat, ccw=True)
+
+    if isha_minutes is None:
+        isha_minutes = ISHA_MINUTES_RAMADAN if hijri_month(date) == 9 else ISHA_MINUTES
+    times["Maghrib"] = times["Sunset"]
+    times["Isha"] = times["Maghrib"] + isha_minutes / 60.0
+    return times
+
+def format_time(hours):
+    """Rounds fractional hours to the nearest minute as HH:MM (aladhan format)."""
+    if math.isnan(hours):
+        return "-----"
+    hours = _fix(hours + 0.5 / 60, 24)
+    h = int(hours)
+    m = int((hours - h) * 60)
+    return f"{h:02d}:{m:02d}"
+
+def utc_offset_hours(date, tz_name):
+    """UTC offset of tz_name at local noon of date, in hours (DST aware)."""
+    tz = pytz.timezone(tz_name)
+    noon = tz.localize(datetime.datetime(date.year, date.month, date.day, 12))
+    return noon.utcoffset().total_seconds() / 3600.0
+
+@lru_cache(maxsize=512)
+def get_timings(date, latitude, longitude, tz_name="Asia/Riyadh", asr_school=0,
+                high_lat="AngleBased", elevation=0):
+    """Returns {"Fajr": "HH:MM", ...} like aladhan's `timings`. Cached per date/location."""
+    offset = utc_offset_hours(date, tz_name)
+    times = compute_day(date, latitude, longitude, offset, asr_school, high_lat, elevation)
+    return {k: format_time(v) for k, v in times.items()}
+
+def compare_with_recorded(rows, latitude, longitude, tz_name="Asia/Riyadh", asr_school=0,
+                          high_lat="AngleBased"):
+    """
+    Compares against recorded aladhan rows (calendarByCity `data` items).
+    Returns a list of (date, prayer, recorded, computed, diff_minutes) for every prayer.
+    """
+    results = []
+    for row in rows:
+        d, m, y = (int(x) for x in row["date"]["gregorian"]["date"].split("-"))
+        date = datetime.date(y, m, d)
+        computed = get_timings(date, latitude, longitude, tz_name, asr_school, high_lat)
+        for prayer in PRAYERS:
+            recorded = row["timings"][prayer].split(" ")[0]  # drop " (+03)" suffix
+            rh, rm = (int(x) for x in recorded.split(":"))
+            ch, cm = (int(x) for x in computed[prayer].split(":"))
+            diff = (ch * 60 + cm) - (rh * 60 + rm)
+            results.append((date, prayer, recorded, computed[prayer], diff))
+    return results
+
+def compare_with_fixture(recorded):
+    """compare_with_recorded for a month saved by record_month (location and settings included)."""
+    rule = HIGH_LAT_RULES[recorded.get("latitudeAdjustmentMethod", 3)]
+    return compare_with_recorded(recorded["data"], recorded["latitude"], recorded["longitude"],
+                                 recorded["timezone"], recorded.get("school", 0), rule)
+
+def record_month(city, country, year, month, method=4, school=0, high_lat=3):
+    """Fetches one aladhan calendarByCity month, with the location aladhan resolved."""
+    import json
+    import urllib.parse
+    import urllib.request
+
+    params = urllib.parse.urlencode({"city": city, "country": country, "method": method,
+                                     "school": school, "latitudeAdjustmentMethod": high_lat})
+    with urllib.request.urlopen(RECORD_URL.format(year=year, month=month) + "?" + params, timeout=30) as resp:
+        rows = json.load(resp)["data"]
+    meta = rows[0]["meta"]
+    return {"source": f"api.aladhan.com calendarByCity, recorded {datetime.date.today()}",
+            "city": city, "country": country, "method": method, "school": school,
+            "latitudeAdjustmentMethod": high_lat, "latitude": meta["latitude"],
+            "longitude": meta["longitude"], "timezone": meta["timezone"],
+            "data": [{"timings": r["timings"], "date": {"gregorian": {"date": r["date"]["gregorian"]["date"]}}}
+                     for r in rows]}
+
+if __name__ == "__main__":
+    # Usage: python prayer_times.py                -> today's Riyadh timings
+    #        python prayer_times.py recorded.json  -> regression check vs a recorded calendar
+    #        python prayer_times.py --record CITY COUNTRY YEAR MONTH out.json
+    #                                              -> record an aladhan month
+    #                                                 (tests/fixtures/aladhan_<city>_<yyyy>_<mm>.json)
+    import json
+    import sys
+
+    lat, lng, tz_name = KNOWN_CITIES[("riyadh", "sa")]
+    if len(sys.argv) < 2:
+        today = datetime.datetime.now(pytz.timezone(tz_name)).date()
+        print(f"Riyadh {today}: {get_timings(today, lat, lng, tz_name)}")
+        sys.exit(0)
+
+    if sys.argv[1] == "--record":
+        city, country, year, month, out = sys.argv[2:7]
+        recorded = record_month(city, country, int(year), int(month))
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(recorded, f, ensure_ascii=False, indent=1)
+        print(f"✅ {len(recorded['data'])} days of {city} saved to {out}")
+        sys.exit(0)
+
+    with open(sys.argv[1], encoding="utf-8") as f:
+        recorded = json.load(f)
+    if isinstance(recorded, dict) and "latitude" in recorded:
+        results = compare_with_fixture(recorded)
+    else:
+        rows = recorded["data"] if isinstance(recorded, dict) else recorded
+        results = compare_with_recorded(rows, lat, lng, tz_name)
+    bad = [r for r in results if abs(r[4]) > 1]
+    for date, prayer, rec, comp, diff in bad:
+        print(f"❌ {date} {prayer}: aladhan={rec} local={comp} ({diff:+d} min)")
+    print(f"{'✅' if not bad else '⚠️'} {len(results) - len(bad)}/{len(results)} timings within 1 minute")
+    sys.exit(1 if bad else 0)
@@ -0,0 +1,339 @@
+"""
+Sharded operation: one or more processes, one prayer scheduler.
+
+SHARD_COUNT=4        run as AutoShardedBot with 4 shards ("auto": Discord's
+                     recommended count, single process only)
+SHARD_IDS=0,1        shards run by this process (default: all of them); start one
+                     process per group, on the same host and checkout (they share
+                     CONFIG_DIR) and each with its own PORT
+
+Every process runs shards, but only the holder of an exclusive lock on
+.scheduler.lock (fcntl.flock) runs the prayer schedulers. The OS drops the lock
+when that process exits or dies, and a waiting process takes over within
+LEADER_POLL_SECONDS; the scheduler's catch-up window covers the gap, so a
+restart never skips a prayer.
+
+The leader plays nothing itself. Each prayer becomes one file per shard in
+.shard_dispatch/<shard>/, named after the event. The process owning the shard
+claims it (renames it to .done) and runs the prayer for its own guilds:
+immediately when the shard is local to the leader, within
+DISPATCH_POLL_SECONDS otherwise. A file that already exists, pending or done,
+is never written again, so a new leader catching up on an event the previous
+one already dispatched does nothing: each shard gets each prayer at most once.
+The leader prunes hourly: unclaimed files once they are too old to play (a
+shard nobody runs any more), claimed ones after DISPATCH_KEEP_SECONDS.
+
+`python sharding.py [processes] [shards] [seconds]` checks the changeover with
+simulated shard processes (the leader is killed halfway through).
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None    # Windows: no flock, every process leads (run one process there)
+
+from storage import CONFIG_DIR, atomic_write_json
+from prayer_scheduler import CATCH_UP_SECONDS
+
+SHARD_COUNT = os.getenv("SHARD_COUNT", "").strip().lower()
+SHARD_IDS = os.getenv("SHARD_IDS", "")
+LEADER_LOCK_PATH = os.path.join(CONFIG_DIR, ".scheduler.lock")
+DISPATCH_DIR = os.path.join(CONFIG_DIR, ".shard_dispatch")
+LEADER_POLL_SECONDS = float(os.getenv("LEADER_POLL_SECONDS", 2))
+DISPATCH_POLL_SECONDS = float(os.getenv("DISPATCH_POLL_SECONDS", 0.5))
+# Claimed event files are kept this long (duplicate protection), then removed
+DISPATCH_KEEP_SECONDS = 2 * 86400
+
+def is_sharded():
+    return bool(SHARD_COUNT) and SHARD_COUNT not in ("0", "1")
+
+def shard_options():
+    """Extra bot constructor arguments: shard_count and shard_ids when set."""
+    if not is_sharded() or SHARD_COUNT == "auto":
+        return {}
+    options = {"shard_count": int(SHARD_COUNT)}
+    ids = [int(s) for s in SHARD_IDS.split(",") if s.strip()]
+    if ids:
+        options["shard_ids"] = ids
+    return options
+
+def event_id(location_key, prayer, scheduled):
+    """File-name-safe ID of one prayer at one location."""
+    digest = hashlib.sha1(json.dumps(list(location_key)).encode("utf-8")).hexdigest()[:10]
+    return f"{scheduled:%Y%m%dT%H%M}-{prayer}-{digest}"
+
+class LeaderLock:
+    """Exclusive, crash-safe leadership through flock on a local file."""
+
+    def __init__(self, path=LEADER_LOCK_PATH):
+        self.path = path
+        self._fd = None
+        self.since = None
+        self.elections = 0
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def try_acquire(self):
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self._fd = fd
+        self.since = time.time()
+        self.elections += 1
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+        self.since = None
+
+    def holder(self):
+        """PID written by the current (or last) leader, or None."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return int(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+    async def lead(self, start, poll=LEADER_POLL_SECONDS):
+        """Waits for the lock, then runs `start()` (a list of tasks) until cancelled (lifecycle task)."""
+        tasks = []
+        try:
+            while not self.try_acquire():
+                await asyncio.sleep(poll)
+            print(f"👑 Prayer scheduler leader (pid {os.getpid()})")
+            tasks = start()
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.release()
+
+class ShardDispatcher:
+    """Leader -> shard hand-off through per-shard event files, claimed at most once."""
+
+    def __init__(self, handle, directory=DISPATCH_DIR, max_age=CATCH_UP_SECONDS):
+        """`handle(shard_ids, payload)` is awaited for each claimed event (once per process)."""
+        self.handle = handle
+        self.directory = directory
+        self.max_age = max_age
+        self.local = set()
+        self._wake = None
+        self._running = set()
+        self._pruned = 0.0
+        self.pruned = 0
+        self.dispatched = 0
+        self.duplicates = 0
+        self.handled = 0
+        self.stale = 0
+
+    def _shard_dir(self, shard):
+        path = os.path.join(self.directory, str(shard))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    # --- Leader side ---
+    def dispatch(self, event, payload, shard_count):
+        """Writes the event for every shard that has not seen it; returns the number written."""
+        payload = dict(payload, event=event, at=time.time())
+        written = 0
+        for shard in range(shard_count):
+            path = os.path.join(self._shard_dir(shard), event + ".json")
+            if os.path.exists(path) or os.path.exists(path + ".done"):
+                self.duplicates += 1
+                continue
+            atomic_write_json(path, payload)
+            written += 1
+        self.dispatched += written
+        if written and self._wake is not None:
+            self._wake.set()
+        self._prune()
+        return written
+
+    def _prune(self, force=False):
+        now = time.time()
+        if not force and now - self._pruned < 3600:
+            return
+        self._pruned = now
+        for shard in os.listdir(self.directory):
+            directory = os.path.join(self.directory, shard)
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                # Claimed: kept for duplicate protection; pending or temp: useless once stale
+                keep = DISPATCH_KEEP_SECONDS if name.endswith(".done") else self.max_age
+                try:
+                    if now - os.path.getmtime(path) > keep:
+                        os.remove(path)
+                        self.pruned += 1
+                except OSError:
+                    pass
+
+    # --- Shard side ---
+    async def serve(self, local_shards, poll=DISPATCH_POLL_SECONDS):
+        """Claims and runs events for this process's shards (lifecycle task)."""
+        self.local = set(local_shards)
+        self._wake = asyncio.Event()
+        while True:
+            self._drain()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=poll)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def _claim(self):
+        events = {}     # event -> [payload, shard ids]
+        for shard in self.local:
+            directory = self._shard_dir(shard)
+            for name in os.listdir(directory):
+                # Skip claimed events and atomic_write_json temp files
+                if not name.endswith(".json") or name.startswith("."):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    os.rename(path, path + ".done")
+                    with open(path + ".done", encoding="utf-8") as f:
+                        payload = json.load(f)
+                except (OSError, ValueError):
+                    continue    # Claimed by someone else, or unreadable
+                events.setdefault(name[:-5], [payload, set()])[1].add(shard)
+        return events
+
+    def _drain(self):
+        for event, (payload, shards) in self._claim().items():
+            age = time.time() - payload["at"]
+            if age > self.max_age:
+                self.stale += 1
+                print(f"⚠️ Dropping {event} for shards {sorted(shards)}: {age:.0f}s old")
+                continue
+            self.handled += 1
+            task = asyncio.create_task(self._run(event, shards, payload))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, event, shards, payload):
+        try:
+            await self.handle(shards, payload)
+        except Exception as e:
+            print(f"❌ Dispatched {event} failed on shards {sorted(shards)}: {e}")
+
+    def stats(self):
+        return {"local": sorted(self.local), "dispatched": self.dispatched, "duplicates": self.duplicates,
+                "handled": self.handled, "stale": self.stale, "pruned": self.pruned}
+
+# --- Changeover check with simulated shard processes ---
+TICK = 0.2          # One simulated "prayer" every TICK seconds
+CATCH_UP_TICKS = 10
+
+def _shard_process(shards, workdir, shard_count):
+    """One simulated process: runs `shards`, competes for leadership, logs what it plays."""
+
+    async def main():
+        log_path = os.path.join(workdir, "played.log")
+
+        async def handle(shard_ids, payload):
+            with open(log_path, "a", encoding="utf-8") as f:
+                for shard in sorted(shard_ids):
+                    f.write(f"{payload['event']} {shard} {os.getpid()}\n")
+
+        dispatcher = ShardDispatcher(handle, os.path.join(workdir, "dispatch"), max_age=30)
+        lock = LeaderLock(os.path.join(workdir, "leader.lock"))
+
+        async def scheduler():
+            # Like PrayerScheduler: fires every tick, catching up on recent ticks after a takeover
+            tick = int(time.time() / TICK) - CATCH_UP_TICKS
+            while True:
+                now_tick = int(time.time() / TICK)
+                while tick <= now_tick:
+                    dispatcher.dispatch(f"tick-{tick:012d}", {}, shard_count)
+                    tick += 1
+                await asyncio.sleep(TICK / 4)
+
+        serving = asyncio.create_task(dispatcher.serve(shards, poll=TICK / 4))
+        await lock.lead(lambda: [asyncio.create_task(scheduler())], poll=TICK / 2)
+        await serving
+
+    asyncio.run(main())
+
+def changeover_check(processes=3, shard_count=6, seconds=4.0):
+    import multiprocessing
+    import shutil
+    import signal
+    import tempfile
+
+    workdir = tempfile.mkdtemp(prefix="shards-")
+    groups = [list(range(shard_count))[i::processes] for i in range(processes)]
+    procs = {}
+
+    def spawn(i):
+        p = multiprocessing.Process(target=_shard_process, args=(groups[i], workdir, shard_count), daemon=True)
+        p.start()
+        procs[i] = p
+
+    try:
+        for i in range(processes):
+            spawn(i)
+        time.sleep(seconds / 2)
+        # Kill the leader without any cleanup, restart it a little later
+        leader_pid = LeaderLock(os.path.join(workdir, "leader.lock")).holder()
+        index = next(i for i, p in procs.items() if p.pid == leader_pid)
+        os.kill(leader_pid, signal.SIGKILL)
+        procs[index].join()
+        time.sleep(0.5)
+        spawn(index)
+        time.sleep(seconds / 2)
+        new_leader = LeaderLock(os.path.join(workdir, "leader.lock")).holder()
+    finally:
+        for p in procs.values():
+            p.kill()
+            p.join()
+
+    played = {}
+    with open(os.path.join(workdir, "played.log"), encoding="utf-8") as f:
+        for line in f:
+            event, shard, _ = line.split()
+            played.setdefault(event, []).append(int(shard))
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    events = sorted(played)
+    # The last few ticks may not have reached every shard before the processes were stopped
+    settled = [e for e in events if int(e.split("-")[1]) * TICK < time.time() - seconds / 4]
+    first, last = int(events[0].split("-")[1]), int(settled[-1].split("-")[1])
+    missing_ticks = (last - first + 1) - len([e for e in settled if first <= int(e.split("-")[1]) <= last])
+    duplicates = sum(len(s) - len(set(s)) for s in played.values())
+    incomplete = [e for e in settled if sorted(played[e]) != list(range(shard_count))]
+    print(f"{processes} processes, {shard_count} shards, leader pid {leader_pid} killed, "
+          f"new leader pid {new_leader}")
+    print(f"events: {len(settled)} settled, ticks missing: {missing_ticks}, "
+          f"duplicate plays: {duplicates}, events not on every shard: {len(incomplete)}")
+    ok = not missing_ticks and not duplicates and not incomplete and new_leader != leader_pid
+    print("✅ exactly once per shard across the changeover" if ok else "❌ changeover check failed")
+    return ok
+
+if __name__ == "__main__":
+    import sys
+
+    args = [float(a) for a in sys.argv[1:]]
+    processes = int(args[0]) if args else 3
+    shards = int(args[1]) if len(args) > 1 else 6
+    seconds = args[2] if len(args) > 2 else 4.0
+    sys.exit(0 if changeover_check(processes, shards, seconds) else 1)
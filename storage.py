@@ -0,0 +1,25 @@
+"""
+Shared on-disk state helpers: where state files live and how they are written.
+"""
+import json
+import os
+import tempfile
+
+CONFIG_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def atomic_write_json(path, data):
+    """Writes JSON to a temp file in the same directory, then renames it over `path`."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,41 @@
+import asyncio
+from types import SimpleNamespace
+
+from fanout import fan_out
+
+def test_finish_does_not_hold_a_slot():
+    guilds = [SimpleNamespace(id=i, name=f"g{i}") for i in range(11)]
+    release = None
+    started = []
+
+    async def start(guild):
+        started.append(guild.id)
+        return guild.id
+
+    async def finish(guild, result):
+        # Every broadcast keeps playing until the last guild has started
+        await release.wait()
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        task = asyncio.create_task(fan_out(guilds, start, concurrency=2, timeout=5, finish=finish))
+        await asyncio.sleep(0.05)
+        assert len(started) == 11
+        release.set()
+        return await task
+
+    report = asyncio.run(main())
+    assert [r[2] for r in report.results.values()] == ["ok"] * 11
+
+def test_timeout_covers_finish():
+    guild = SimpleNamespace(id=1, name="g1")
+
+    async def start(guild):
+        return None
+
+    async def finish(guild, result):
+        await asyncio.sleep(1)
+
+    report = asyncio.run(fan_out([guild], start, timeout=0.05, finish=finish))
+    assert report.results[1][2] == "timeout"
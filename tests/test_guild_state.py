@@ -0,0 +1,50 @@
+import asyncio
+import threading
+import time
+
+from guild_state import GuildStateStore
+
+def test_shutdown_waits_for_the_write_in_flight(tmp_path):
+    store = GuildStateStore(str(tmp_path / "state.jsonl"), flush_seconds=0)
+    inside = threading.Event()
+    overlaps = []
+    write = store._write
+
+    def slow_write(lines, snapshot):
+        if inside.is_set():
+            overlaps.append(lines)
+        inside.set()
+        try:
+            time.sleep(0.05)
+            return write(lines, snapshot)
+        finally:
+            inside.clear()
+
+    store._write = slow_write
+
+    async def main():
+        writer = asyncio.create_task(store.run_writer())
+        await asyncio.sleep(0)
+        store.update(1, active=False)
+        await asyncio.sleep(0.01)       # Write of guild 1 now in its thread
+        store.update(2, locked_channel=5)
+        writer.cancel()
+        await asyncio.gather(writer, return_exceptions=True)
+
+    asyncio.run(main())
+    assert not overlaps
+    reloaded = GuildStateStore(store.path)
+    assert reloaded.load() == 2
+    assert reloaded.get(1).active is False and reloaded.get(2).locked_channel == 5
+
+def test_compaction_keeps_the_last_snapshot_per_guild(tmp_path):
+    store = GuildStateStore(str(tmp_path / "state.jsonl"))
+    for channel in range(5):
+        store.update(7, locked_channel=channel)
+        store.flush()
+    store.update(8, active=False)
+    store.update(8, active=True)        # Back to defaults: not kept
+    store.flush()
+    store.compact()
+    with open(store.path, encoding="utf-8") as f:
+        assert f.read().splitlines() == ['{"guild": 7, "locked_channel": 4}']
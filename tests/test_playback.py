@@ -0,0 +1,39 @@
+import asyncio
+import time
+
+import discord
+
+from playback import play_and_wait
+from voice_pool import FakeGatewayClient
+
+class SlowStartSource(discord.AudioSource):
+    """First frame is only produced after `delay` seconds (e.g. FFmpeg spin-up)."""
+
+    def __init__(self, delay, frames=3):
+        self.delay = delay
+        self.frames = frames
+
+    def read(self):
+        if self.delay:
+            time.sleep(self.delay)
+            self.delay = 0
+        if self.frames <= 0:
+            return b""
+        self.frames -= 1
+        return b"\xf8\xff\xfe"
+
+    def is_opus(self):
+        return True
+
+def test_first_frame_time_includes_player_start():
+    async def main():
+        client = FakeGatewayClient(connect_delay=0, speed=10.0)
+        vc = await client.get_guild(1).get_channel(2).connect()
+        seen = []
+        started = time.monotonic()
+        await play_and_wait(vc, SlowStartSource(0.1), timeout=5, on_first_frame=lambda at: seen.append(at - started))
+        await vc.disconnect()
+        return seen
+
+    seen = asyncio.run(main())
+    assert len(seen) == 1 and seen[0] >= 0.1
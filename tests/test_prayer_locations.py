@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+from prayer_locations import PrayerLocations, location_key, normalize_location
+
+async def _fire(location, prayer, scheduled):
+    pass
+
+def test_unknown_city_without_timezone_is_rejected():
+    with pytest.raises(ValueError):
+        normalize_location({"city": "London", "country": "GB", "method": 2})
+
+def test_rejected_guild_keeps_the_default_location(tmp_path):
+    locations = PrayerLocations({"guilds": {"1": {"city": "London", "country": "GB"}}}, _fire, str(tmp_path))
+    assert locations.location_for_guild(1)["city"] == "Riyadh"
+
+def test_same_city_with_different_coordinates_gets_its_own_calendar(tmp_path):
+    a = {"city": "London", "country": "GB", "timezone": "Europe/London", "latitude": 51.5, "longitude": -0.12}
+    b = dict(a, latitude=51.4, longitude=-0.3)
+    assert location_key(normalize_location(a)) != location_key(normalize_location(b))
+    locations = PrayerLocations({"guilds": {"1": a, "2": b}}, _fire, str(tmp_path))
+    first, second = locations.calendar_for_guild(1), locations.calendar_for_guild(2)
+    assert first is not second
+    assert first.cache_path != second.cache_path
+    # Nothing read from (or written to) the checkout
+    assert os.path.dirname(first.cache_path) == str(tmp_path) and not first.days
+    assert os.path.dirname(locations.schedulers[location_key(normalize_location(a))].state_path) == str(tmp_path)
+
+def test_high_latitude_rule_is_configurable():
+    loc = normalize_location({"city": "London", "country": "GB", "timezone": "Europe/London",
+                              "latitude": 51.5, "longitude": -0.12, "high_lat": "OneSeventh"})
+    assert loc["high_lat"] == "OneSeventh"
+    assert location_key(loc) != location_key(dict(loc, high_lat="AngleBased"))
+    with pytest.raises(ValueError):
+        normalize_location({"high_lat": "Sometimes"})
@@ -0,0 +1,44 @@
+import asyncio
+import datetime
+
+import pytz
+
+from prayer_scheduler import PrayerScheduler
+
+class FakeCalendar:
+    """Fajr 30 seconds ago (inside the catch-up window), nothing else."""
+
+    city = "Riyadh"
+    tz_name = "Asia/Riyadh"
+
+    def __init__(self):
+        now = datetime.datetime.now(pytz.timezone(self.tz_name)) - datetime.timedelta(seconds=30)
+        self.date, self.hhmm = now.date(), now.strftime("%H:%M")
+
+    def timings(self, date):
+        return {"Fajr": self.hhmm} if date == self.date else {}
+
+async def _run_once(calendar, path):
+    fired = []
+
+    async def fire(prayer, scheduled):
+        fired.append(prayer)
+
+    scheduler = PrayerScheduler(calendar, fire, catch_up=120, state_path=path)
+    task = asyncio.create_task(scheduler.run())
+    await asyncio.sleep(0.1)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return fired
+
+def test_restart_inside_catch_up_window_does_not_fire_again(tmp_path):
+    calendar = FakeCalendar()
+    path = str(tmp_path / "fired.json")
+    assert asyncio.run(_run_once(calendar, path)) == ["Fajr"]
+    # A fresh process (new scheduler) within the window
+    assert asyncio.run(_run_once(calendar, path)) == []
+
+def test_without_state_path_a_restart_fires_again():
+    calendar = FakeCalendar()
+    assert asyncio.run(_run_once(calendar, None)) == ["Fajr"]
+    assert asyncio.run(_run_once(calendar, None)) == ["Fajr"]
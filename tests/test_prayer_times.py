@@ -0,0 +1,52 @@
+"""
+Offline calculator checks.
+
+- tests/fixtures/aladhan_*.json: months recorded from api.aladhan.com with
+  `python prayer_times.py --record` (regression: within 1 minute).
+- tests/fixtures/crosscheck_adhanpy_*.json: the same months computed by
+  adhanpy, an independent implementation (cross-check, not aladhan output).
+"""
+import datetime
+import glob
+import json
+import os
+
+import pytest
+
+import prayer_times
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+RECORDED = sorted(glob.glob(os.path.join(FIXTURES_DIR, "aladhan_*.json")))
+CROSS_CHECKS = sorted(glob.glob(os.path.join(FIXTURES_DIR, "crosscheck_*.json")))
+RIYADH = prayer_times.KNOWN_CITIES[("riyadh", "sa")]
+
+def _off_by_more_than_a_minute(path):
+    with open(path, encoding="utf-8") as f:
+        month = json.load(f)
+    results = prayer_times.compare_with_fixture(month)
+    assert len(results) == len(month["data"]) * len(prayer_times.PRAYERS)
+    return [f"{date} {prayer}: expected {rec}, computed {comp} ({diff:+d} min)"
+            for date, prayer, rec, comp, diff in results if abs(diff) > 1]
+
+@pytest.mark.skipif(not RECORDED, reason="no aladhan month recorded yet (python prayer_times.py --record)")
+@pytest.mark.parametrize("path", RECORDED, ids=os.path.basename)
+def test_within_one_minute_of_recorded_aladhan(path):
+    off = _off_by_more_than_a_minute(path)
+    assert not off, "\n".join(off)
+
+@pytest.mark.parametrize("path", CROSS_CHECKS, ids=os.path.basename)
+def test_cross_check_against_adhanpy(path):
+    off = _off_by_more_than_a_minute(path)
+    assert not off, "\n".join(off)
+
+@pytest.mark.parametrize("date, minutes", [
+    (datetime.date(2025, 2, 28), 90),     # 29 Sha'ban 1446
+    (datetime.date(2025, 3, 1), 120),     # 1 Ramadan
+    (datetime.date(2025, 3, 29), 120),    # 29 Ramadan
+    (datetime.date(2025, 3, 30), 90),     # 1 Shawwal (the tabular calendar still says Ramadan)
+    (datetime.date(2026, 3, 19), 120),    # 30 Ramadan 1447
+    (datetime.date(2026, 3, 20), 90),     # 1 Shawwal 1447
+])
+def test_isha_follows_the_umm_al_qura_ramadan(date, minutes):
+    times = prayer_times.compute_day(date, RIYADH[0], RIYADH[1], 3)
+    assert round((times["Isha"] - times["Maghrib"]) * 60) == minutes
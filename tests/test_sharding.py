@@ -0,0 +1,71 @@
+import asyncio
+import os
+import time
+
+import sharding
+from sharding import LeaderLock, ShardDispatcher
+
+def _files(directory):
+    return sorted(name for _, _, names in os.walk(directory) for name in names)
+
+def test_event_is_written_once_per_shard_and_claimed_once(tmp_path):
+    handled = []
+
+    async def handle(shard_ids, payload):
+        handled.append((payload["event"], sorted(shard_ids)))
+
+    async def main():
+        dispatcher = ShardDispatcher(handle, str(tmp_path), max_age=60)
+        serving = asyncio.create_task(dispatcher.serve([0, 1], poll=0.01))
+        await asyncio.sleep(0)
+        assert dispatcher.dispatch("e1", {}, 3) == 3
+        assert dispatcher.dispatch("e1", {}, 3) == 0       # A new leader catching up
+        await asyncio.sleep(0.1)
+        assert dispatcher.dispatch("e1", {}, 3) == 0       # Claimed files still count
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+
+    asyncio.run(main())
+    assert handled == [("e1", [0, 1])]
+    # Shard 2 is not run by this process: its file stays pending
+    assert _files(tmp_path / "2") == ["e1.json"]
+
+def test_prune_removes_stale_pending_and_old_claimed_files(tmp_path):
+    async def handle(shard_ids, payload):
+        pass
+
+    dispatcher = ShardDispatcher(handle, str(tmp_path), max_age=60)
+    dispatcher.dispatch("old", {}, 2)
+    dispatcher.dispatch("fresh", {}, 2)
+    done = tmp_path / "0" / "claimed.json.done"
+    done.write_text("{}")
+    hour_ago = time.time() - 3600
+    for name in ("old.json",):
+        for shard in ("0", "1"):
+            os.utime(tmp_path / shard / name, (hour_ago, hour_ago))
+    os.utime(done, (hour_ago, hour_ago))
+
+    dispatcher._prune(force=True)
+    # Pending files past max_age are gone (nobody may play them any more);
+    # claimed ones are kept for DISPATCH_KEEP_SECONDS
+    assert _files(tmp_path) == ["claimed.json.done", "fresh.json", "fresh.json"]
+    assert dispatcher.pruned == 2
+
+    old = time.time() - sharding.DISPATCH_KEEP_SECONDS - 60
+    os.utime(done, (old, old))
+    dispatcher._prune(force=True)
+    assert "claimed.json.done" not in _files(tmp_path)
+
+def test_leader_lock_is_exclusive(tmp_path):
+    path = str(tmp_path / "leader.lock")
+    first, second = LeaderLock(path), LeaderLock(path)
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    first.release()
+    assert second.try_acquire()
+    assert second.holder() == os.getpid()
+    second.release()
+
+def test_leader_changeover_plays_every_event_once_per_shard():
+    # Real processes; the leader is SIGKILLed halfway and restarted
+    assert sharding.changeover_check(processes=3, shard_count=6, seconds=3.0)
@@ -0,0 +1,29 @@
+import asyncio
+
+import voice_jobs
+from voice_jobs import VoiceJobEngine
+
+def test_stop_guild_waits_for_the_running_job_to_clean_up(monkeypatch):
+    monkeypatch.setattr(voice_jobs.journal, "record", lambda *a, **k: None)
+    events = []
+
+    async def runner(job):
+        try:
+            await asyncio.sleep(10)
+        finally:
+            # Like VoiceWorker.play disconnecting on its way out
+            await asyncio.sleep(0.05)
+            events.append(f"disconnected #{job.id}")
+
+    async def main():
+        engine = VoiceJobEngine(runner)
+        running = engine.submit(1, "adhan", "adhan.mp3", [10])
+        queued = engine.submit(1, "ajrr", "ajrr.mp3", [10])
+        await running.wait_started()
+        assert await engine.stop_guild(1, by="lock") == 2
+        events.append("moved")
+        return running, queued
+
+    running, queued = asyncio.run(main())
+    assert events == ["disconnected #1", "moved"]
+    assert running.state == queued.state == "cancelled"
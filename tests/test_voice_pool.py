@@ -0,0 +1,93 @@
+"""
+VoicePool broadcasts through the fake gateway: real VoiceWorker.play and
+play_and_wait, fake connections and player threads.
+"""
+import asyncio
+
+import discord
+import pytest
+
+import playback
+import voice_pool
+from voice_pool import FakeVoiceWorker, VoicePool
+
+class FrameSource(discord.AudioSource):
+    """`frames` Opus frames, then EOF."""
+
+    def __init__(self, frames=5):
+        self.frames = frames
+
+    def read(self):
+        if self.frames <= 0:
+            return b""
+        self.frames -= 1
+        return b"\xf8\xff\xfe"
+
+    def is_opus(self):
+        return True
+
+@pytest.fixture(autouse=True)
+def short_clips(monkeypatch):
+    monkeypatch.setattr(voice_pool.audio_cache, "audio_source", lambda path, ffmpeg=None: FrameSource())
+
+def _workers(n, **gateway):
+    gateway.setdefault("connect_delay", 0.01)
+    gateway.setdefault("speed", 10.0)
+    return [FakeVoiceWorker(f"fake-{i + 1}", **gateway) for i in range(n)]
+
+def test_broadcast_plays_every_channel_exactly_once():
+    workers = _workers(3)
+    channels = list(range(100, 107))
+    results = asyncio.run(VoicePool(workers).broadcast(1, channels, "adhan.mp3"))
+    assert results == {c: "ok" for c in channels}
+    played = sorted(c for w in workers for _, c in w.played)
+    assert played == channels
+    # The channels were spread over the workers
+    assert all(w.played for w in workers)
+    # Every connection was closed again
+    assert all(w.client.connected[1] == 0 for w in workers)
+
+def test_broadcast_skips_workers_outside_the_guild():
+    inside, outside = _workers(1)[0], FakeVoiceWorker("outside", guild_ids={2}, connect_delay=0.01, speed=10.0)
+    results = asyncio.run(VoicePool([inside, outside]).broadcast(1, [1, 2, 3], "adhan.mp3"))
+    assert set(results.values()) == {"ok"}
+    assert len(inside.played) == 3 and not outside.played
+
+def test_no_worker_in_guild_reports_every_channel():
+    workers = [FakeVoiceWorker("elsewhere", guild_ids={2})]
+    assert asyncio.run(VoicePool(workers).broadcast(1, [1, 2], "adhan.mp3")) == {1: "no_worker", 2: "no_worker"}
+
+def test_failed_channel_does_not_stop_the_others():
+    workers = _workers(2, fail_channels={2})
+    results = asyncio.run(VoicePool(workers).broadcast(1, [1, 2, 3, 4], "adhan.mp3"))
+    assert results == {1: "ok", 2: "ClientException", 3: "ok", 4: "ok"}
+
+def test_one_connection_per_worker_and_guild_across_concurrent_broadcasts():
+    workers = _workers(2)
+    pool = VoicePool(workers)
+
+    async def main():
+        # Two broadcasts in guild 1 and one in guild 2 at the same time
+        return await asyncio.gather(pool.broadcast(1, [1, 2, 3], "adhan.mp3"),
+                                    pool.broadcast(1, [4, 5, 6], "ajrr.mp3"),
+                                    pool.broadcast(2, [7, 8], "adhan.mp3"))
+
+    results = asyncio.run(main())
+    assert all(set(r.values()) == {"ok"} for r in results)
+    for worker in workers:
+        assert worker.client.peak[1] == 1
+        assert worker.client.peak[2] == 1
+    assert sorted(c for w in workers for g, c in w.played if g == 1) == [1, 2, 3, 4, 5, 6]
+
+def test_guild_lock_is_per_guild():
+    worker = _workers(1)[0]
+    assert worker.lock_for(1) is worker.lock_for(1)
+    assert worker.lock_for(1) is not worker.lock_for(2)
+
+def test_playback_timeout_stops_and_disconnects(monkeypatch):
+    monkeypatch.setattr(playback, "TIMEOUT_SLACK", 0.1)
+    monkeypatch.setattr(playback, "clip_duration", lambda source: 0.05)
+    workers = _workers(1, hang=True)
+    results = asyncio.run(VoicePool(workers).broadcast(1, [1, 2], "adhan.mp3"))
+    assert results == {1: "PlaybackTimeout", 2: "PlaybackTimeout"}
+    assert workers[0].client.connected[1] == 0
@@ -0,0 +1,50 @@
+import asyncio
+
+from welcome_queue import WelcomeQueue
+
+class Guild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.name = f"guild {guild_id}"
+
+def test_workers_are_dropped_once_their_guild_drains():
+    welcomed = []
+
+    async def handler(guild, channel_id, member_ids):
+        await asyncio.sleep(0.01)
+        welcomed.append((guild.id, channel_id, member_ids))
+
+    async def main():
+        queue = WelcomeQueue(handler, dedupe_seconds=60, dedupe_max=100)
+        for guild_id in range(50):
+            queue.submit(Guild(guild_id), 1, guild_id)
+        assert queue.stats()["busy_guilds"] == 50
+        await asyncio.sleep(0.1)
+        assert not queue._workers and not queue._pending
+        # A later join in a drained guild starts a new worker
+        queue.submit(Guild(0), 2, 999)
+        await asyncio.sleep(0.05)
+        return queue
+
+    queue = asyncio.run(main())
+    assert len(welcomed) == 51
+    assert queue.stats()["busy_guilds"] == 0
+
+def test_joins_to_one_channel_coalesce_while_the_guild_is_busy():
+    calls = []
+
+    async def handler(guild, channel_id, member_ids):
+        calls.append((channel_id, list(member_ids)))
+        await asyncio.sleep(0.02)
+
+    async def main():
+        queue = WelcomeQueue(handler, dedupe_seconds=60, dedupe_max=100)
+        guild = Guild(1)
+        queue.submit(guild, 1, 10)
+        await asyncio.sleep(0)
+        for member_id in (11, 12, 12):
+            queue.submit(guild, 2, member_id)
+        await asyncio.sleep(0.1)
+
+    asyncio.run(main())
+    assert calls == [(1, [10]), (2, [11, 12])]
@@ -0,0 +1,153 @@
+"""
+Content-addressed text-to-speech cache.
+
+Clips are stored under .tts_cache/ by hash(backend, voice, language, text), so
+changing the wording produces a new clip instead of reusing a stale file.
+Missing clips are generated concurrently on a worker pool; hits are a dict
+lookup.
+
+Backends:
+    gtts    Google TTS (network, mp3) - default
+    espeak  espeak-ng / espeak (local, offline, wav)
+    stub    short silent wav, for tests and dry runs
+
+TTS_BACKEND=gtts|espeak|stub   TTS_WORKERS=4
+"""
+import asyncio
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(BASE_DIR, ".tts_cache"))
+TTS_BACKEND = os.getenv("TTS_BACKEND", "gtts")
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", 4))
+
+# --- Backends ---
+class GTTSBackend:
+    name = "gtts"
+    extension = "mp3"
+
+    def synthesize(self, text, language, voice, path):
+        from gtts import gTTS
+        # gTTS has no voices; `voice` selects the Google domain (e.g. "com.sa")
+        tts = gTTS(text=text, lang=language, slow=False, tld=voice or "com")
+        tts.save(path)
+
+class EspeakBackend:
+    name = "espeak"
+    extension = "wav"
+
+    def synthesize(self, text, language, voice, path):
+        exe = shutil.which("espeak-ng") or shutil.which("espeak")
+        if not exe:
+            raise RuntimeError("espeak-ng is not installed")
+        subprocess.run([exe, "-v", voice or language, "-w", path, text],
+                       check=True, capture_output=True)
+
+class StubBackend:
+    name = "stub"
+    extension = "wav"
+
+    def synthesize(self, text, language, voice, path):
+        # 50 ms of silence per word, 48 kHz mono
+        frames = 2400 * max(1, len(text.split()))
+        with wave.open(path, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(48000)
+            w.writeframes(b"\x00\x00" * frames)
+
+BACKENDS = {b.name: b for b in (GTTSBackend(), EspeakBackend(), StubBackend())}
+
+def tts_key(text, language="ar", voice=None, backend=TTS_BACKEND):
+    h = hashlib.sha256()
+    for part in (backend, voice or "", language, text):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()[:24]
+
+class TTSCache:
+    """Maps (text, language, voice, backend) to a generated audio file."""
+
+    def __init__(self, directory=TTS_CACHE_DIR, backend=TTS_BACKEND, workers=TTS_WORKERS):
+        self.directory = directory
+        self.backend = backend
+        self.workers = workers
+        self._paths = {}          # key -> path (hits never touch the disk)
+        self._inflight = {}       # key -> asyncio.Future
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._scan()
+
+    def _scan(self):
+        try:
+            for name in os.listdir(self.directory):
+                key, _, ext = name.partition(".")
+                if ext and not name.endswith(".tmp"):
+                    self._paths[key] = os.path.join(self.directory, name)
+        except FileNotFoundError:
+            pass
+
+    def path_for(self, text, language="ar", voice=None, backend=None):
+        """Cached file for this request, or None."""
+        return self._paths.get(tts_key(text, language, voice, backend or self.backend))
+
+    def generate(self, text, language="ar", voice=None, backend=None):
+        """Blocking: returns the cached path, generating it if needed."""
+        backend = backend or self.backend
+        key = tts_key(text, language, voice, backend)
+        path = self._paths.get(key)
+        if path:
+            self.hits += 1
+            return path
+
+        impl = BACKENDS[backend]
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{key}.{impl.extension}")
+        tmp = path + ".tmp"
+        impl.synthesize(text, language, voice, tmp)
+        os.replace(tmp, path)
+        with self._lock:
+            self._paths[key] = path
+            self.misses += 1
+        print(f"🗣️ TTS generated ({backend}): {text[:40]}")
+        return path
+
+    def generate_many(self, requests):
+        """
+        Generates a batch concurrently. `requests` is a list of dicts with
+        text/language/voice/backend; returns paths in the same order (None on error).
+        """
+        def one(req):
+            try:
+                return self.generate(req["text"], req.get("language", "ar"),
+                                     req.get("voice"), req.get("backend"))
+            except Exception as e:
+                print(f"Error creating TTS for '{req['text'][:40]}': {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+            return list(pool.map(one, requests))
+
+    async def synthesize(self, text, language="ar", voice=None, backend=None):
+        """Async lookup for runtime announcements; concurrent misses share one generation."""
+        backend = backend or self.backend
+        key = tts_key(text, language, voice, backend)
+        path = self._paths.get(key)
+        if path:
+            self.hits += 1
+            return path
+
+        pending = self._inflight.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(
+                asyncio.to_thread(self.generate, text, language, voice, backend))
+            self._inflight[key] = pending
+            pending.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(pending)
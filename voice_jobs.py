@@ -0,0 +1,260 @@
+"""
+Per-guild voice job engine.
+
+Everything the bot plays in voice (adhan, /test_prayer, /ajrr, welcomes) is a
+job: a clip, the channels to play it in, and a priority. Each guild plays one
+job at a time, so jobs no longer fight over guild.voice_client and a welcome
+can no longer stop an adhan.
+
+    kind      priority   when something less important is playing
+    adhan     0          preempts it
+    ajrr      1          waits for it
+    welcome   2          waits for it
+
+A preempted /ajrr is put back in the queue with the channels it has not
+finished. A preempted welcome is dropped. An /ajrr submitted while the same
+clip is still queued joins that job instead of queueing a second one.
+
+Jobs can be cancelled (/cancel) and report per-channel progress (/jobs).
+Commands get the job ID back as soon as the job is queued.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+
+import metrics
+from voice_journal import journal
+
+PRIORITY_ADHAN = 0
+PRIORITY_AJRR = 1
+PRIORITY_WELCOME = 2
+
+# kind -> (priority, preempts less important jobs, resumes after being preempted)
+JOB_KINDS = {
+    "adhan": (PRIORITY_ADHAN, True, False),
+    "ajrr": (PRIORITY_AJRR, False, True),
+    "welcome": (PRIORITY_WELCOME, False, False),
+}
+# Finished jobs kept for /jobs and /cancel lookups
+JOB_HISTORY = 200
+
+FINAL_STATES = ("done", "failed", "cancelled", "preempted")
+
+class VoiceJob:
+    """One clip for a set of channels in one guild; `future` resolves with the job when it ends."""
+
+    def __init__(self, job_id, guild_id, kind, clip, channel_ids, requested_by=None, **options):
+        self.id = job_id
+        self.guild_id = guild_id
+        self.kind = kind
+        self.priority, self.preempts, self.resumes = JOB_KINDS[kind]
+        self.clip = clip
+        self.channel_ids = list(channel_ids)
+        self.requested_by = requested_by
+        self.options = options
+        self.state = "queued"       # queued | running | done | failed | cancelled | preempted
+        self.results = {}           # channel_id -> "ok" | error name, filled as channels finish
+        self.error = None
+        self.stopped_by = None
+        self.created = time.monotonic()
+        self.started = None
+        self.finished_at = None
+        loop = asyncio.get_running_loop()
+        self.future = loop.create_future()
+        self._begun = loop.create_future()    # Resolves when the job first runs (or ends unrun)
+        self._stop = None           # (state, by) requested while running
+
+    @property
+    def finished(self):
+        return self.state in FINAL_STATES
+
+    async def wait(self):
+        """Waits for the job to end (cancelling the waiter does not cancel the job)."""
+        return await asyncio.shield(self.future)
+
+    async def wait_started(self):
+        """Waits until the engine starts the job (or it ends without running)."""
+        return await asyncio.shield(self._begun)
+
+    def remaining(self):
+        """Channels not played yet (all of them unless the job was preempted and resumed)."""
+        return [c for c in self.channel_ids if c not in self.results]
+
+    def progress(self):
+        return len(self.results), len(self.channel_ids)
+
+    def summary(self):
+        done, total = self.progress()
+        line = f"#{self.id} {self.kind} ({self.clip}) {self.state} {done}/{total}"
+        if self.stopped_by:
+            line += f" by {self.stopped_by}"
+        if self.error:
+            line += f": {self.error}"
+        return line
+
+    def to_dict(self):
+        done, total = self.progress()
+        return {"id": self.id, "guild": self.guild_id, "kind": self.kind, "clip": self.clip,
+                "state": self.state, "done": done, "total": total,
+                "results": {str(c): r for c, r in self.results.items()},
+                "error": self.error, "stopped_by": self.stopped_by}
+
+class VoiceJobEngine:
+    """Per-guild priority queues of VoiceJob; `runner(job)` plays a job's remaining channels."""
+
+    def __init__(self, runner, history=JOB_HISTORY):
+        self.runner = runner
+        self.history = history
+        self.jobs = OrderedDict()   # job_id -> job (live ones and the last `history` finished)
+        self._ids = itertools.count(1)
+        self._queues = {}           # guild_id -> heap of (priority, job_id, job)
+        self._running = {}          # guild_id -> (job, task)
+        self._workers = {}          # guild_id -> worker task
+        self.counts = {state: 0 for state in FINAL_STATES}
+        self.preemptions = 0
+
+    # --- Submitting ---
+    def submit(self, guild_id, kind, clip, channel_ids, requested_by=None, **options):
+        """Queues a job (or joins an identical queued /ajrr) and returns it; never blocks."""
+        queue = self._queues.setdefault(guild_id, [])
+        if kind == "ajrr":
+            for _, _, queued in queue:
+                if queued.kind == kind and queued.clip == clip and queued.state == "queued" \
+                        and queued.options == options:
+                    queued.channel_ids += [c for c in channel_ids if c not in queued.channel_ids]
+                    return queued
+
+        job = VoiceJob(next(self._ids), guild_id, kind, clip, channel_ids, requested_by, **options)
+        self.jobs[job.id] = job
+        heapq.heappush(queue, (job.priority, job.id, job))
+        journal.record(guild_id, "job", detail=f"#{job.id} {kind} queued ({len(job.channel_ids)} channels)")
+
+        running = self._running.get(guild_id)
+        if running and job.preempts and job.priority < running[0].priority:
+            self.preemptions += 1
+            self._request_stop(running, "preempted", f"#{job.id}")
+
+        worker = self._workers.get(guild_id)
+        if worker is None or worker.done():
+            self._workers[guild_id] = asyncio.create_task(self._work(guild_id))
+        return job
+
+    # --- Cancelling ---
+    def cancel(self, job_id, by=None):
+        """Cancels a queued or running job; returns it, or None if unknown or already finished."""
+        job = self.jobs.get(job_id)
+        if job is None or job.finished:
+            return None
+        running = self._running.get(job.guild_id)
+        if running and running[0] is job:
+            self._request_stop(running, "cancelled", by)
+        else:
+            job.stopped_by = by
+            self._finish(job, "cancelled")  # The worker skips it when it comes up
+        return job
+
+    def cancel_guild(self, guild_id, by=None):
+        """Cancels every job of a guild (queued and running); returns how many."""
+        return len(self._cancel_guild(guild_id, by))
+
+    async def stop_guild(self, guild_id, by=None, timeout=None):
+        """
+        Cancels every job of a guild and waits until they have ended, i.e. a
+        cancelled broadcast is done disconnecting. Returns how many.
+        """
+        jobs = self._cancel_guild(guild_id, by)
+        if jobs:
+            await asyncio.wait([asyncio.ensure_future(job.wait()) for job in jobs], timeout=timeout)
+        return len(jobs)
+
+    def _cancel_guild(self, guild_id, by):
+        jobs = [j for _, _, j in self._queues.get(guild_id, ()) if not j.finished]
+        running = self._running.get(guild_id)
+        if running:
+            jobs.append(running[0])
+        return [job for job in jobs if self.cancel(job.id, by)]
+
+    @staticmethod
+    def _request_stop(running, state, by):
+        job, task = running
+        job._stop = (state, by)
+        task.cancel()
+
+    # --- Running ---
+    async def _work(self, guild_id):
+        queue = self._queues[guild_id]
+        while queue:
+            _, _, job = heapq.heappop(queue)
+            if job.finished:
+                continue
+            job.state = "running"
+            job._stop = None
+            if job.started is None:
+                job.started = time.monotonic()
+                job._begun.set_result(job)
+            task = asyncio.create_task(self.runner(job), name=f"voice job #{job.id}")
+            self._running[guild_id] = (job, task)
+            try:
+                # wait() does not raise when the job task is cancelled, only when this worker is
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                task.cancel()
+                self._finish(job, "cancelled")
+                raise
+            finally:
+                self._running.pop(guild_id, None)
+
+            if task.cancelled() or job._stop:
+                state, by = job._stop or ("cancelled", None)
+                job.stopped_by = by
+                if state == "preempted" and job.resumes and job.remaining():
+                    job.state = "queued"
+                    heapq.heappush(queue, (job.priority, job.id, job))
+                    journal.record(guild_id, "job", detail=f"#{job.id} {job.kind} preempted by {by}, requeued")
+                    continue
+                self._finish(job, state)
+            elif task.exception() is not None:
+                error = task.exception()
+                metrics.error("voice_job", error)
+                self._finish(job, "failed", repr(error))
+            else:
+                self._finish(job, "done")
+        self._queues.pop(guild_id, None)
+        self._workers.pop(guild_id, None)
+
+    def _finish(self, job, state, error=None):
+        job.state = state
+        job.error = error
+        job.finished_at = time.monotonic()
+        self.counts[state] += 1
+        if not job.future.done():
+            job.future.set_result(job)
+        if not job._begun.done():
+            job._begun.set_result(job)
+        journal.record(job.guild_id, "job", duration=job.finished_at - (job.started or job.created),
+                       detail=job.summary())
+        # Keep the last `history` finished jobs for lookups
+        finished = [i for i, j in self.jobs.items() if j.finished]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    # --- Introspection ---
+    def running(self, guild_id):
+        entry = self._running.get(guild_id)
+        return entry[0] if entry else None
+
+    def guild_jobs(self, guild_id):
+        """Running job, queued jobs in run order, then recent finished ones (newest first)."""
+        running = self.running(guild_id)
+        queued = [j for _, _, j in sorted(self._queues.get(guild_id, ())) if not j.finished and j is not running]
+        recent = [j for j in reversed(self.jobs.values()) if j.guild_id == guild_id and j.finished]
+        return ([running] if running else []) + queued + recent
+
+    def depth(self):
+        return sum(1 for q in self._queues.values() for _, _, j in q if j.state == "queued")
+
+    def stats(self):
+        return {"running": len(self._running), "queued": self.depth(),
+                "preemptions": self.preemptions, **self.counts}
@@ -0,0 +1,116 @@
+"""
+Voice event journal: the last few hundred voice events per guild, kept in
+memory so incidents ("why did the adhan skip channel X") can be reconstructed
+without scraping stdout.
+
+Each guild has a fixed-capacity ring of VoiceEvent records. Once a ring is
+full the oldest record object is overwritten in place, so appending is O(1)
+and allocates nothing. Guilds without voice activity cost nothing.
+
+Kinds: join, connect, move, reuse, play_start, play_stop, timeout, error,
+skip, disconnect, job (voice job queued / requeued / finished).
+
+VOICE_JOURNAL_SIZE=200           events kept per guild
+VOICE_JOURNAL_FILE=voice.jsonl   also append every event to this file (rotated)
+VOICE_JOURNAL_FILE_MB=5          size of one file before rotating
+VOICE_JOURNAL_FILE_BACKUPS=3     rotated files kept
+"""
+import json
+import logging
+import logging.handlers
+import os
+import time
+
+VOICE_JOURNAL_SIZE = int(os.getenv("VOICE_JOURNAL_SIZE", 200))
+VOICE_JOURNAL_FILE = os.getenv("VOICE_JOURNAL_FILE")
+VOICE_JOURNAL_FILE_MB = float(os.getenv("VOICE_JOURNAL_FILE_MB", 5))
+VOICE_JOURNAL_FILE_BACKUPS = int(os.getenv("VOICE_JOURNAL_FILE_BACKUPS", 3))
+
+class VoiceEvent:
+    __slots__ = ("ts", "kind", "guild_id", "channel_id", "duration", "detail")
+
+    def __init__(self, ts, kind, guild_id, channel_id, duration, detail):
+        self.ts = ts
+        self.kind = kind
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.duration = duration
+        self.detail = detail
+
+    def to_dict(self):
+        return {"ts": self.ts, "kind": self.kind, "guild": self.guild_id, "channel": self.channel_id,
+                "duration": self.duration, "detail": self.detail}
+
+class _Ring:
+    __slots__ = ("records", "next")
+
+    def __init__(self):
+        self.records = []
+        self.next = 0       # Slot overwritten next once the ring is full
+
+class VoiceJournal:
+    """Per-guild ring buffers of VoiceEvent, optionally spilled to a rotating file."""
+
+    def __init__(self, capacity=VOICE_JOURNAL_SIZE, path=VOICE_JOURNAL_FILE,
+                 file_mb=VOICE_JOURNAL_FILE_MB, backups=VOICE_JOURNAL_FILE_BACKUPS):
+        self.capacity = max(1, capacity)
+        self._rings = {}
+        self.recorded = 0
+        self._spill = None
+        if path:
+            handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=int(file_mb * 1024 * 1024), backupCount=backups, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._spill = logging.getLogger("voice_journal")
+            self._spill.setLevel(logging.INFO)
+            self._spill.propagate = False
+            self._spill.addHandler(handler)
+
+    def record(self, guild_id, kind, channel_id=None, duration=None, detail=None):
+        ring = self._rings.get(guild_id)
+        if ring is None:
+            ring = self._rings[guild_id] = _Ring()
+        now = time.time()
+        records = ring.records
+        if len(records) < self.capacity:
+            event = VoiceEvent(now, kind, guild_id, channel_id, duration, detail)
+            records.append(event)
+        else:
+            # Full: reuse the oldest record in place
+            event = records[ring.next]
+            event.ts, event.kind, event.channel_id = now, kind, channel_id
+            event.duration, event.detail = duration, detail
+            ring.next = (ring.next + 1) % self.capacity
+        self.recorded += 1
+        if self._spill is not None:
+            self._spill.info(json.dumps(event.to_dict(), ensure_ascii=False))
+
+    def events(self, guild_id, limit=None, kind=None, channel_id=None):
+        """Oldest-first copies (dicts) of a guild's events, optionally filtered."""
+        ring = self._rings.get(guild_id)
+        if ring is None:
+            return []
+        ordered = ring.records[ring.next:] + ring.records[:ring.next]
+        result = [e.to_dict() for e in ordered
+                  if (kind is None or e.kind == kind) and (channel_id is None or e.channel_id == channel_id)]
+        return result[-limit:] if limit else result
+
+    def forget(self, guild_id):
+        self._rings.pop(guild_id, None)
+
+    def stats(self):
+        return {"guilds": len(self._rings), "events": sum(len(r.records) for r in self._rings.values()),
+                "recorded": self.recorded, "capacity": self.capacity, "spill": self._spill is not None}
+
+def format_event(event):
+    """One line for Discord: time, kind, channel, duration, detail."""
+    line = f"`{time.strftime('%H:%M:%S', time.localtime(event['ts']))}` **{event['kind']}**"
+    if event["channel"]:
+        line += f" <#{event['channel']}>"
+    if event["duration"] is not None:
+        line += f" {event['duration']:.2f}s"
+    if event["detail"]:
+        line += f" — {event['detail']}"
+    return line
+
+journal = VoiceJournal()
@@ -0,0 +1,273 @@
+"""
+Voice worker pool: auxiliary bot tokens running as voice-only clients in the
+same process, so one broadcast can play in several channels of a guild at once
+(Discord allows one voice connection per bot per guild).
+
+VOICE_WORKER_TOKENS=tok1,tok2   extra bot accounts (must be invited to the guilds)
+
+FakeVoiceWorker (the real VoiceWorker on a fake gateway client, no Discord) is
+for tests and `python voice_pool.py [channels] [workers]`, which runs a
+broadcast against fake workers. It is never part of the bot's pool.
+"""
+import asyncio
+import os
+import threading
+import time
+
+import discord
+
+import audio_cache
+import metrics
+from voice_journal import journal
+from playback import play_and_wait
+
+class VoiceWorker:
+    """One bot account able to hold one voice connection per guild."""
+
+    def __init__(self, name, client, ffmpeg=None):
+        self.name = name
+        self.client = client
+        self.ffmpeg = ffmpeg
+        self._guild_locks = {}
+
+    def lock_for(self, guild_id):
+        lock = self._guild_locks.get(guild_id)
+        if lock is None:
+            lock = self._guild_locks[guild_id] = asyncio.Lock()
+        return lock
+
+    def is_ready(self):
+        return self.client.is_ready()
+
+    def in_guild(self, guild_id):
+        return self.is_ready() and self.client.get_guild(guild_id) is not None
+
+    async def play(self, guild_id, channel_id, path):
+        """Connects to the channel, plays the clip to the end and leaves."""
+        guild = self.client.get_guild(guild_id)
+        channel = guild.get_channel(channel_id) if guild else None
+        if channel is None:
+            raise RuntimeError(f"{self.name} cannot see channel {channel_id}")
+
+        if guild.voice_client:
+            await guild.voice_client.disconnect()
+        started = time.monotonic()
+        with metrics.VOICE_CONNECT.time(("connect",)):
+            vc = await channel.connect(self_deaf=True)
+        journal.record(guild_id, "connect", channel_id, time.monotonic() - started, self.name)
+        try:
+            await play_and_wait(vc, audio_cache.audio_source(path, self.ffmpeg))
+        finally:
+            await vc.disconnect()
+
+# --- Fake gateway (tests and the demo below) ---
+class _FakeVoiceClient:
+    """Voice connection whose player thread reads the source at `speed` x real time."""
+
+    FRAME_SECONDS = 0.02
+
+    def __init__(self, client, guild, channel):
+        self.client = client
+        self.guild = guild
+        self.channel = channel
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_playing(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def play(self, source, after=None):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._player, args=(source, after), daemon=True)
+        self._thread.start()
+
+    def _player(self, source, after):
+        # Like discord.player.AudioPlayer: read frames until EOF or stop(), then after(error)
+        error = None
+        try:
+            while not self._stop.is_set():
+                if self.client.hang:
+                    self._stop.wait(self.FRAME_SECONDS)
+                    continue
+                if not source.read():
+                    break
+                time.sleep(self.FRAME_SECONDS / self.client.speed)
+        except Exception as e:
+            error = e
+        finally:
+            source.cleanup()
+        if after is not None:
+            after(error)
+
+    def stop(self):
+        self._stop.set()
+
+    async def disconnect(self, force=False):
+        self.stop()
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+        self.guild.voice_client = None
+        self.client.connected[self.guild.id] -= 1
+
+class _FakeChannel:
+    def __init__(self, client, guild, channel_id):
+        self.client = client
+        self.guild = guild
+        self.id = channel_id
+
+    async def connect(self, self_deaf=False):
+        client = self.client
+        # One voice connection per account per guild, as on Discord
+        client.connected[self.guild.id] = client.connected.get(self.guild.id, 0) + 1
+        client.peak[self.guild.id] = max(client.peak.get(self.guild.id, 0), client.connected[self.guild.id])
+        await asyncio.sleep(client.connect_delay)
+        if self.id in client.fail_channels:
+            client.connected[self.guild.id] -= 1
+            raise discord.ClientException(f"cannot connect to {self.id}")
+        client.played.append((self.guild.id, self.id))
+        vc = self.guild.voice_client = _FakeVoiceClient(client, self.guild, self)
+        return vc
+
+class _FakeGuild:
+    def __init__(self, client, guild_id):
+        self.client = client
+        self.id = guild_id
+        self.voice_client = None
+
+    def get_channel(self, channel_id):
+        return _FakeChannel(self.client, self, channel_id)
+
+class FakeGatewayClient:
+    """Stands in for discord.Client: guilds, channels and voice connections, no network."""
+
+    def __init__(self, guild_ids=None, connect_delay=0.05, speed=1.0, hang=False, fail_channels=()):
+        self.guild_ids = guild_ids        # None = member of every guild
+        self.connect_delay = connect_delay
+        self.speed = speed
+        self.hang = hang                  # Playback never finishes (timeout handling)
+        self.fail_channels = set(fail_channels)
+        self.played = []                  # (guild_id, channel_id) per successful connect
+        self.connected = {}               # guild_id -> open voice connections
+        self.peak = {}                    # guild_id -> most connections open at once
+        self._guilds = {}
+
+    def is_ready(self):
+        return True
+
+    def get_guild(self, guild_id):
+        if self.guild_ids is not None and guild_id not in self.guild_ids:
+            return None
+        guild = self._guilds.get(guild_id)
+        if guild is None:
+            guild = self._guilds[guild_id] = _FakeGuild(self, guild_id)
+        return guild
+
+class FakeVoiceWorker(VoiceWorker):
+    """Real VoiceWorker (connect, play_and_wait, disconnect) on a FakeGatewayClient."""
+
+    def __init__(self, name, guild_ids=None, ffmpeg=None, **gateway):
+        super().__init__(name, FakeGatewayClient(guild_ids, **gateway), ffmpeg)
+
+    @property
+    def played(self):
+        return self.client.played
+
+class VoicePool:
+    """Assigns channels of one broadcast to free workers in parallel."""
+
+    def __init__(self, workers):
+        self.workers = list(workers)
+        self._tasks = []
+
+    def workers_for(self, guild_id):
+        return [w for w in self.workers if w.in_guild(guild_id)]
+
+    async def broadcast(self, guild_id, channel_ids, path, results=None):
+        """
+        Plays `path` in every channel, each worker taking the next free channel.
+        Returns {channel_id: "ok" | error name}; pass `results` to watch it fill up.
+        """
+        workers = self.workers_for(guild_id)
+        results = {} if results is None else results
+        if not workers:
+            for channel_id in channel_ids:
+                results[channel_id] = "no_worker"
+                journal.record(guild_id, "skip", channel_id, detail="no_worker")
+            return results
+
+        queue = asyncio.Queue()
+        for channel_id in channel_ids:
+            queue.put_nowait(channel_id)
+
+        async def drain(worker):
+            async with worker.lock_for(guild_id):
+                while True:
+                    try:
+                        channel_id = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    try:
+                        await worker.play(guild_id, channel_id, path)
+                        results[channel_id] = "ok"
+                    except Exception as e:
+                        print(f"Voice worker {worker.name} failed in {channel_id}: {e}")
+                        metrics.error("voice_pool", e)
+                        journal.record(guild_id, "error", channel_id, detail=f"{worker.name}: {e!r}")
+                        results[channel_id] = type(e).__name__
+
+        await asyncio.gather(*(drain(w) for w in workers))
+        return results
+
+    # --- Auxiliary clients ---
+    def start_auxiliary(self, tokens, ffmpeg=None):
+        """Logs in extra tokens as voice-only clients (guilds + voice states intents). Runs once."""
+        if self._tasks:
+            return self._tasks
+        for i, token in enumerate(tokens, start=1):
+            intents = discord.Intents.none()
+            intents.guilds = True
+            intents.voice_states = True
+            client = discord.Client(intents=intents, max_messages=None, chunk_guilds_at_startup=False)
+            worker = VoiceWorker(f"worker-{i}", client, ffmpeg)
+            self.workers.append(worker)
+            self._tasks.append(asyncio.create_task(self._run_client(worker, token)))
+        return self._tasks
+
+    @staticmethod
+    async def _run_client(worker, token):
+        try:
+            await worker.client.start(token)
+        except Exception as e:
+            print(f"❌ Voice worker {worker.name} stopped: {e}")
+
+    async def close(self):
+        for worker in self.workers:
+            if isinstance(worker.client, discord.Client) and worker.name != "main":
+                await worker.client.close()
+
+def build_pool(bot, ffmpeg=None):
+    """Pool of the main bot; VOICE_WORKER_TOKENS workers join it once logged in."""
+    return VoicePool([VoiceWorker("main", bot, ffmpeg)])
+
+def auxiliary_tokens():
+    return [t.strip() for t in os.getenv("VOICE_WORKER_TOKENS", "").split(",") if t.strip()]
+
+if __name__ == "__main__":
+    import sys
+
+    channels = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    from env_probe import find_ffmpeg
+
+    async def demo():
+        ffmpeg = find_ffmpeg()
+        for n in (1, workers):
+            pool = VoicePool([FakeVoiceWorker(f"fake-{i + 1}", ffmpeg=ffmpeg) for i in range(n)])
+            start = time.monotonic()
+            results = await pool.broadcast(1, list(range(channels)), "adhan.mp3")
+            elapsed = time.monotonic() - start
+            ok = sum(1 for r in results.values() if r == "ok")
+            print(f"{n} worker(s): {ok}/{channels} channels in {elapsed:.2f}s")
+
+    asyncio.run(demo())
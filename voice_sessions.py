@@ -0,0 +1,106 @@
+"""
+Warm ("sticky") voice sessions for welcomes.
+
+Instead of disconnecting after every welcome, the bot can stay in the last
+channel until an idle timer expires, so the next welcome there skips the voice
+handshake. Off by default; lock mode and prayer broadcasts take over
+immediately by cancelling the timer.
+
+STICKY_VOICE=1              enable for every guild (per-guild policy can override)
+STICKY_IDLE_SECONDS=120     idle time before leaving
+STICKY_MAX_SESSIONS=50      warm sessions kept at once across all guilds
+"""
+import asyncio
+import os
+import time
+
+import metrics
+from voice_journal import journal
+
+STICKY_VOICE = os.getenv("STICKY_VOICE", "0").lower() in ("1", "true", "yes", "on")
+STICKY_IDLE_SECONDS = float(os.getenv("STICKY_IDLE_SECONDS", 120))
+STICKY_MAX_SESSIONS = int(os.getenv("STICKY_MAX_SESSIONS", 50))
+
+class WarmSessions:
+    """Keeps per-guild voice connections open between welcomes, with an idle timeout."""
+
+    def __init__(self, enabled=STICKY_VOICE, idle_seconds=STICKY_IDLE_SECONDS,
+                 max_sessions=STICKY_MAX_SESSIONS):
+        self.enabled = enabled
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max_sessions
+        self.policies = {}      # guild_id -> {"enabled": bool, "idle_seconds": float}
+        self._timers = {}       # guild_id -> (TimerHandle, voice client)
+        self._closing = set()   # Strong refs to idle disconnect tasks
+        self.counts = {"connect": 0, "move": 0, "reuse": 0}
+        self._ttfa = {"connect": [0, 0.0], "move": [0, 0.0], "reuse": [0, 0.0]}
+
+    # --- Policy ---
+    def set_policy(self, guild_id, enabled=None, idle_seconds=None):
+        policy = self.policies.setdefault(guild_id, {})
+        if enabled is not None:
+            policy["enabled"] = enabled
+        if idle_seconds is not None:
+            policy["idle_seconds"] = idle_seconds
+
+    def is_sticky(self, guild_id):
+        return self.policies.get(guild_id, {}).get("enabled", self.enabled)
+
+    def idle_for(self, guild_id):
+        return self.policies.get(guild_id, {}).get("idle_seconds", self.idle_seconds)
+
+    # --- Sessions ---
+    async def acquire(self, guild, channel):
+        """Returns (voice client, "connect" | "move" | "reuse") for `channel`."""
+        self.cancel(guild.id)
+        vc = guild.voice_client
+        started = time.monotonic()
+        if not vc or not vc.is_connected():
+            vc = await channel.connect(self_deaf=True)
+            how = "connect"
+        elif vc.channel.id != channel.id:
+            await vc.move_to(channel)
+            how = "move"
+        else:
+            how = "reuse"
+        elapsed = time.monotonic() - started
+        if how != "reuse":
+            metrics.VOICE_CONNECT.observe(elapsed, (how,))
+        journal.record(guild.id, how, channel.id, elapsed, "welcome")
+        self.counts[how] += 1
+        return vc, how
+
+    def record_first_audio(self, how, seconds):
+        entry = self._ttfa[how]
+        entry[0] += 1
+        entry[1] += seconds
+
+    async def release(self, guild, vc):
+        """Disconnects now, or arms the idle timer when the guild is sticky."""
+        if not self.is_sticky(guild.id) or len(self._timers) >= self.max_sessions:
+            await vc.disconnect()
+            return
+        loop = asyncio.get_running_loop()
+        handle = loop.call_later(self.idle_for(guild.id), self._expire, guild.id, vc)
+        self._timers[guild.id] = (handle, vc)
+
+    def cancel(self, guild_id):
+        """Stops the idle timer (next play, lock mode or a prayer broadcast takes over)."""
+        entry = self._timers.pop(guild_id, None)
+        if entry:
+            entry[0].cancel()
+
+    def _expire(self, guild_id, vc):
+        entry = self._timers.get(guild_id)
+        if not entry or entry[1] is not vc:
+            return
+        del self._timers[guild_id]
+        # Only leave if nobody else reused or replaced this connection
+        if vc.is_connected() and not vc.is_playing():
+            task = asyncio.create_task(vc.disconnect())
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    def stats(self):
+        ttfa = {k: (v[1] / v[0] if v[0] else 0.0) for k, v in self._ttfa.items()}
+        return {"warm": len(self._timers), "counts": dict(self.counts), "ttfa": ttfa}
@@ -0,0 +1,117 @@
+"""
+Per-guild welcome queue.
+
+Joins are handled one at a time per guild (no more channel thrashing), pending
+joins to the same channel collapse into one welcome, and a member is not
+welcomed again within WELCOME_DEDUPE_SECONDS.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+import metrics
+
+WELCOME_DEDUPE_SECONDS = float(os.getenv("WELCOME_DEDUPE_SECONDS", 600))
+WELCOME_DEDUPE_MAX = int(os.getenv("WELCOME_DEDUPE_MAX", 10000))
+
+class TTLCache:
+    """Bounded set of keys that expire after `ttl` seconds (oldest evicted first)."""
+
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._items = OrderedDict()   # key -> expiry (monotonic)
+
+    def __contains__(self, key):
+        expiry = self._items.get(key)
+        if expiry is None:
+            return False
+        if expiry < time.monotonic():
+            del self._items[key]
+            return False
+        return True
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, key):
+        self._items.pop(key, None)
+        self._items[key] = time.monotonic() + self.ttl
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def discard(self, key):
+        self._items.pop(key, None)
+
+class WelcomeQueue:
+    """Serializes welcomes per guild; `handler(guild, channel_id, member_ids)` plays one welcome."""
+
+    def __init__(self, handler, dedupe_seconds=WELCOME_DEDUPE_SECONDS, dedupe_max=WELCOME_DEDUPE_MAX):
+        self.handler = handler
+        self.recent = TTLCache(dedupe_seconds, dedupe_max)
+        self._pending = {}      # guild_id -> OrderedDict(channel_id -> [enqueued_at, member_ids])
+        self._workers = {}      # guild_id -> asyncio.Task
+        self.enqueued = 0
+        self.coalesced = 0
+        self.suppressed = 0
+        self.handled = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def submit(self, guild, channel_id, member_id):
+        """Queues a welcome; returns False if it was dropped as a duplicate."""
+        key = (guild.id, member_id)
+        if key in self.recent:
+            self.suppressed += 1
+            return False
+        self.recent.add(key)
+
+        pending = self._pending.setdefault(guild.id, OrderedDict())
+        entry = pending.get(channel_id)
+        if entry is not None:
+            entry[1].append(member_id)
+            self.coalesced += 1
+        else:
+            pending[channel_id] = [time.monotonic(), [member_id]]
+            self.enqueued += 1
+
+        worker = self._workers.get(guild.id)
+        if worker is None or worker.done():
+            self._workers[guild.id] = asyncio.create_task(self._run(guild))
+        return True
+
+    async def _run(self, guild):
+        pending = self._pending[guild.id]
+        while pending:
+            channel_id, (enqueued_at, member_ids) = pending.popitem(last=False)
+            wait = time.monotonic() - enqueued_at
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            try:
+                await self.handler(guild, channel_id, member_ids)
+            except Exception as e:
+                print(f"Welcome error in {guild.name}: {e}")
+                metrics.error("welcome", e)
+            self.handled += 1
+        # Drained: drop the guild's entries (a new join starts a new worker)
+        self._pending.pop(guild.id, None)
+        self._workers.pop(guild.id, None)
+
+    def depth(self, guild_id=None):
+        if guild_id is not None:
+            return len(self._pending.get(guild_id, ()))
+        return sum(len(p) for p in self._pending.values())
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "busy_guilds": len(self._workers),
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "suppressed": self.suppressed,
+            "handled": self.handled,
+            "wait_avg": self.wait_total / self.handled if self.handled else 0.0,
+            "wait_max": self.wait_max,
+            "dedupe_entries": len(self.recent),
+        }